@@ -0,0 +1,200 @@
+"""
+Zoom-dependent hex, square and cluster aggregation of point layers for Monasib backend
+"""
+import json
+import numpy as np
+import shapely
+import geopandas as gpd
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from config import settings
+from cache import TTLCache
+
+
+METHODS = ("hex", "square", "cluster")
+
+EARTH_RADIUS = 6378137.0
+# Web Mercator meters per pixel at zoom 0 for 256px tiles
+ZOOM0_RESOLUTION = 2 * np.pi * EARTH_RADIUS / 256
+SQRT3 = np.sqrt(3.0)
+
+# Corners of a pointy-top hexagon of unit circumradius, closed
+HEX_ANGLES = np.radians(30 + 60 * np.arange(7))
+HEX_CORNERS = np.stack([np.cos(HEX_ANGLES), np.sin(HEX_ANGLES)], axis=1)
+SQUARE_CORNERS = np.array([[0, 0], [1, 0], [1, 1], [0, 1], [0, 0]], dtype=np.float64)
+
+
+def cell_size(zoom: int) -> float:
+    """Cell size in Web Mercator meters giving cells of aggregate_cell_px pixels on screen"""
+    return settings.aggregate_cell_px * ZOOM0_RESOLUTION / 2 ** zoom
+
+
+def to_mercator(longitude: np.ndarray, latitude: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    latitude = np.clip(latitude, -85.05112878, 85.05112878)
+    x = EARTH_RADIUS * np.radians(longitude)
+    y = EARTH_RADIUS * np.log(np.tan(np.pi / 4 + np.radians(latitude) / 2))
+    return x, y
+
+
+def from_mercator(x: np.ndarray, y: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    longitude = np.degrees(x / EARTH_RADIUS)
+    latitude = np.degrees(2 * np.arctan(np.exp(y / EARTH_RADIUS)) - np.pi / 2)
+    return longitude, latitude
+
+
+def hex_cells(x: np.ndarray, y: np.ndarray, size: float) -> Tuple[np.ndarray, np.ndarray]:
+    """Axial (q, r) coordinates of the pointy-top hexagons containing each point"""
+    q = (SQRT3 / 3 * x - y / 3) / size
+    r = (2 / 3 * y) / size
+    # Round in cube coordinates and fix the component with the largest error
+    s = -q - r
+    rq, rr, rs = np.round(q), np.round(r), np.round(s)
+    dq, dr, ds = np.abs(rq - q), np.abs(rr - r), np.abs(rs - s)
+    fix_q = (dq > dr) & (dq > ds)
+    fix_r = ~fix_q & (dr > ds)
+    rq = np.where(fix_q, -rr - rs, rq)
+    rr = np.where(fix_r, -rq - rs, rr)
+    return rq.astype(np.int64), rr.astype(np.int64)
+
+
+def hex_centers(q: np.ndarray, r: np.ndarray, size: float) -> Tuple[np.ndarray, np.ndarray]:
+    return size * SQRT3 * (q + r / 2), size * 1.5 * r
+
+
+class Bins:
+    """Aggregated cells of one layer at one zoom, in Web Mercator"""
+
+    def __init__(self, method: str, size: float, keys: np.ndarray, x: np.ndarray, y: np.ndarray,
+                 counts: np.ndarray, means: Dict[str, np.ndarray]):
+        self.method = method
+        self.size = size
+        self.keys = keys  # (q, r) or (ix, iy) per cell
+        self.x = x        # cell center, or member centroid for clusters
+        self.y = y
+        self.counts = counts
+        self.means = means
+
+    def __len__(self):
+        return len(self.counts)
+
+    @property
+    def nbytes(self) -> int:
+        return (self.keys.nbytes + self.x.nbytes + self.y.nbytes + self.counts.nbytes +
+                sum(values.nbytes for values in self.means.values()))
+
+    def select(self, bbox: Optional[Tuple[float, float, float, float]]) -> np.ndarray:
+        """Indices of cells whose center lies in a lon/lat bbox, padded by one cell"""
+        if bbox is None:
+            return np.arange(len(self))
+        minx, miny = to_mercator(np.array([bbox[0]]), np.array([bbox[1]]))
+        maxx, maxy = to_mercator(np.array([bbox[2]]), np.array([bbox[3]]))
+        pad = self.size
+        return np.flatnonzero((self.x >= minx[0] - pad) & (self.x <= maxx[0] + pad) &
+                              (self.y >= miny[0] - pad) & (self.y <= maxy[0] + pad))
+
+    def geometries(self, index: np.ndarray) -> np.ndarray:
+        """Cell polygons, or cluster points, in EPSG:4326"""
+        if self.method == "cluster":
+            longitude, latitude = from_mercator(self.x[index], self.y[index])
+            return shapely.points(np.round(longitude, 6), np.round(latitude, 6))
+        if self.method == "hex":
+            corners = HEX_CORNERS * self.size
+            x = self.x[index, None] + corners[:, 0]
+            y = self.y[index, None] + corners[:, 1]
+        else:
+            x = (self.keys[index, 0, None] + SQUARE_CORNERS[:, 0]) * self.size
+            y = (self.keys[index, 1, None] + SQUARE_CORNERS[:, 1]) * self.size
+        longitude, latitude = from_mercator(x, y)
+        return shapely.polygons(np.round(np.stack([longitude, latitude], axis=-1), 6))
+
+
+def point_coordinates(gdf: gpd.GeoDataFrame) -> Tuple[np.ndarray, np.ndarray]:
+    """Longitude and latitude of points, or of centroids for other geometries"""
+    geometries = np.asarray(gdf.geometry.values)
+    if gdf.crs is not None and gdf.crs.to_epsg() != 4326:
+        geometries = np.asarray(gdf.geometry.to_crs("EPSG:4326").values)
+    not_point = shapely.get_type_id(geometries) != 0
+    if not_point.any():
+        geometries = geometries.copy()
+        geometries[not_point] = shapely.centroid(geometries[not_point])
+    return shapely.get_x(geometries), shapely.get_y(geometries)
+
+
+def numeric_fields(gdf: gpd.GeoDataFrame, fields: Optional[Sequence[str]] = None) -> List[str]:
+    """Numeric attributes to summarize; all but identifiers by default"""
+    numeric = [name for name in gdf.columns
+               if name != gdf.geometry.name and np.issubdtype(gdf[name].dtype, np.number)]
+    if fields is None:
+        return [name for name in numeric if name.lower() not in ("id", "fid")]
+    unknown = [name for name in fields if name not in numeric]
+    if unknown:
+        raise ValueError(f"Not numeric fields of the layer: {', '.join(unknown)}")
+    return list(fields)
+
+
+def aggregate(gdf: gpd.GeoDataFrame, method: str, zoom: int, fields: Sequence[str]) -> Bins:
+    """Assign every feature to a cell in one vectorized pass and summarize each cell"""
+    if method not in METHODS:
+        raise ValueError(f"method must be one of {', '.join(METHODS)}")
+    size = cell_size(zoom)
+    longitude, latitude = point_coordinates(gdf)
+    valid = np.isfinite(longitude) & np.isfinite(latitude)
+    x, y = to_mercator(longitude[valid], latitude[valid])
+
+    if method == "hex":
+        a, b = hex_cells(x, y, size)
+    else:
+        a, b = np.floor(x / size).astype(np.int64), np.floor(y / size).astype(np.int64)
+    # One int64 per cell, so grouping is a flat sort rather than a row-wise unique
+    packed, cell = np.unique((a << 32) | (b & 0xFFFFFFFF), return_inverse=True)
+    keys = np.stack([packed >> 32, (packed & 0xFFFFFFFF).astype(np.uint32).astype(np.int32)], axis=1)
+    counts = np.bincount(cell, minlength=len(keys))
+
+    if method == "hex":
+        center_x, center_y = hex_centers(keys[:, 0], keys[:, 1], size)
+    elif method == "square":
+        center_x, center_y = (keys[:, 0] + 0.5) * size, (keys[:, 1] + 0.5) * size
+    else:
+        # Clusters sit at the centroid of their members
+        center_x = np.bincount(cell, weights=x, minlength=len(keys)) / counts
+        center_y = np.bincount(cell, weights=y, minlength=len(keys)) / counts
+
+    means = {}
+    for name in fields:
+        values = gdf[name].to_numpy(dtype=np.float64, na_value=np.nan)[valid]
+        present = ~np.isnan(values)
+        totals = np.bincount(cell[present], weights=values[present], minlength=len(keys))
+        with np.errstate(invalid="ignore", divide="ignore"):
+            means[name] = totals / np.bincount(cell[present], minlength=len(keys))
+    return Bins(method, size, keys, center_x, center_y, counts, means)
+
+
+def encode_bins(bins: Bins, index: np.ndarray) -> bytes:
+    """Selected cells as a GeoJSON FeatureCollection with count and mean_<field> properties"""
+    geometries = shapely.to_geojson(bins.geometries(index))
+    features = []
+    for i, geometry in zip(index, geometries):
+        properties = {"count": int(bins.counts[i])}
+        for name, values in bins.means.items():
+            properties[f"mean_{name}"] = round(float(values[i]), 3) if np.isfinite(values[i]) else None
+        features.append(f'{{"type": "Feature", "properties": {json.dumps(properties)}, "geometry": {geometry}}}')
+    return ('{"type": "FeatureCollection", "features": [' + ", ".join(features) + "]}").encode()
+
+
+# Aggregations of whole layers, keyed by layer, version, method, zoom and fields
+aggregate_cache = TTLCache(
+    ttl=settings.cache_ttl,
+    max_bytes=settings.aggregate_cache_max_memory_mb * 1024 * 1024
+)
+
+
+def get_bins(layer_name: str, version: str, read_layer, method: str, zoom: int,
+             fields: Optional[Sequence[str]] = None) -> Bins:
+    """Cached aggregation of a layer at a zoom level"""
+    gdf = read_layer(layer_name)
+    fields = numeric_fields(gdf, fields)
+    return aggregate_cache.get_or_compute(
+        (layer_name, version, method, zoom, tuple(fields)),
+        lambda: aggregate(gdf, method, zoom, fields),
+        size_of=lambda bins: bins.nbytes
+    )
@@ -0,0 +1,232 @@
+"""
+Suitability analysis runs and result caching for Monasib backend
+"""
+import json
+import hashlib
+import threading
+import numpy as np
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from config import settings
+from cache import TTLCache
+from feature_store import CandidateStore
+from parallel import get_scorer, use_parallel
+from metrics import stage
+from ranking import ScoreAccumulator, select_top
+from scoring import score_batch, score_candidates
+
+
+class AnalysisResult:
+    """Scores of one analysis run together with its response payload"""
+
+    def __init__(self, analysis_id: str, scores: np.ndarray, response: Dict[str, Any], scored_count: int,
+                 dataset: Optional[str] = None):
+        self.analysis_id = analysis_id
+        self.scores = scores
+        self.response = response
+        self.scored_count = scored_count
+        self.dataset = dataset  # Version of the candidate store that was scored
+        self._ranked_index = np.empty(0, dtype=np.int64)
+        self._lock = threading.Lock()
+
+    @property
+    def nbytes(self) -> int:
+        """Approximate memory held by the result"""
+        return self.scores.nbytes + 16 * 1024  # Response payload is small and bounded
+
+    def ranked(self, depth: int) -> np.ndarray:
+        """
+        Candidate indices of the best `depth` locations in rank order.
+
+        Only as much of the ranking as requested is selected, and the
+        deepest selection so far is kept for later pages.
+        """
+        depth = min(depth, self.scored_count)
+        with self._lock:
+            if len(self._ranked_index) < depth:
+                scored = np.flatnonzero(self.scores > 0)
+                self._ranked_index, _ = select_top(scored, self.scores[scored], depth)
+            return self._ranked_index[:depth]
+
+    def _page_index(self, page: int, page_size: int):
+        start = (page - 1) * page_size
+        return start, self.ranked(start + page_size)[start:]
+
+    def page_header(self, page: int, page_size: int) -> Dict[str, Any]:
+        return {
+            "analysis_id": self.analysis_id,
+            "page": page,
+            "page_size": page_size,
+            "total_results": self.scored_count,
+            "total_pages": -(-self.scored_count // page_size)
+        }
+
+    def page(self, store: CandidateStore, page: int, page_size: int) -> Dict[str, Any]:
+        """One page of the ranked locations, 1-based"""
+        start, index = self._page_index(page, page_size)
+        return {
+            **self.page_header(page, page_size),
+            "locations": [
+                {**describe_location(store, i, self.scores[i]), "rank": start + offset + 1}
+                for offset, i in enumerate(index)
+            ]
+        }
+
+    def page_columns(self, store: CandidateStore, page: int, page_size: int) -> Dict[str, np.ndarray]:
+        """The same page as one array per field, for columnar encodings"""
+        start, index = self._page_index(page, page_size)
+        return {
+            "rank": np.arange(start + 1, start + len(index) + 1),
+            "id": store.ids[index],
+            "latitude": store.latitude[index],
+            "longitude": store.longitude[index],
+            "suitability_score": np.round(self.scores[index].astype(np.float64), 2),
+            **{f"parameters.{param_id}": values[index] for param_id, values in store.columns.items()}
+        }
+
+
+def normalize_criteria(criteria: Dict[str, Any]) -> Dict[str, Dict[str, float]]:
+    """Reduce criteria to sorted parameters with numeric value and weight"""
+    return {
+        param_id: {
+            'value': float(criteria[param_id]['value']),
+            'weight': float(criteria[param_id]['weight'])
+        }
+        for param_id in sorted(criteria)
+    }
+
+
+def analysis_key(criteria: Dict[str, Any], dataset_version: str) -> str:
+    """Canonical hash of normalized criteria and the candidate dataset version"""
+    canonical = json.dumps(
+        {"criteria": normalize_criteria(criteria), "dataset": dataset_version},
+        sort_keys=True, separators=(",", ":")
+    )
+    return hashlib.sha256(canonical.encode()).hexdigest()[:32]
+
+
+def describe_location(store: CandidateStore, index: int, score: float) -> Dict[str, Any]:
+    """Location dict of a candidate with its rounded suitability score"""
+    return {**store.location(index), 'suitability_score': round(float(score), 2)}
+
+
+def format_best_location(location: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """Summary of the best location as returned by the API"""
+    if location is None:
+        return None
+    return {
+        "coordinates": f"{location['latitude']:.6f}, {location['longitude']:.6f}",
+        "suitability_score": location['suitability_score'],
+        "address": location['address']
+    }
+
+
+def run_analysis(store: CandidateStore, criteria: Dict[str, Any], analysis_id: str) -> AnalysisResult:
+    """Score every candidate and summarize the ranking"""
+    if use_parallel(len(store)):
+        # Large stores are scored in shards across worker processes
+        with stage("scoring"):
+            scores, accumulator = get_scorer().score(store, criteria, k=10)
+    else:
+        # Calculate suitability scores for all locations at once
+        with stage("scoring"):
+            scores = score_candidates(store.columns, criteria)
+
+        # Top 10 by partial selection and statistics from a single pass over the scores
+        with stage("ranking"):
+            accumulator = ScoreAccumulator(10)
+            accumulator.add(scores)
+    with stage("summary"):
+        return summarize_analysis(store, criteria, analysis_id, scores, accumulator)
+
+
+def summarize_analysis(store: CandidateStore, criteria: Dict[str, Any], analysis_id: str,
+                       scores: np.ndarray, accumulator: ScoreAccumulator) -> AnalysisResult:
+    """Build the analysis response from scores and their accumulated top 10"""
+    summary = accumulator.summary()
+    top_locations = [
+        describe_location(store, i, score)
+        for i, score in zip(accumulator.top_index, accumulator.top_scores)
+    ]
+
+    response = {
+        "status": "success",
+        "message": "GIS analysis completed successfully",
+        "analysis_id": analysis_id,
+        "criteria_used": criteria,
+        "total_locations_analyzed": len(store),
+        "suitable_locations_found": summary["suitable"],
+        "scored_locations": summary["scored"],
+        "best_location": format_best_location(top_locations[0] if top_locations else None),
+        "top_10_locations": top_locations,
+        "analysis_summary": {
+            "average_score": summary["average_score"],
+            "median_score": summary["median_score"],
+            "parameters_count": len(criteria),
+            "total_weight": sum(param['weight'] for param in criteria.values()),
+            "analysis_timestamp": datetime.utcnow().isoformat()
+        }
+    }
+    return AnalysisResult(analysis_id, scores, response, summary["scored"], dataset=store.version)
+
+
+# Results of recent analyses, keyed by analysis_key
+result_cache = TTLCache(
+    ttl=settings.cache_ttl,
+    max_bytes=settings.result_cache_max_memory_mb * 1024 * 1024
+)
+
+
+def find_analysis(analysis_id: str) -> Optional[AnalysisResult]:
+    """Look up a cached analysis by id"""
+    return result_cache.get(analysis_id)
+
+
+def get_analysis(store: CandidateStore, criteria: Dict[str, Any]) -> AnalysisResult:
+    """Return a cached analysis for these criteria, computing it at most once"""
+    analysis_id = analysis_key(criteria, store.version)
+    if not settings.cache_enabled:
+        return run_analysis(store, criteria, analysis_id)
+    return result_cache.get_or_compute(
+        analysis_id,
+        lambda: run_analysis(store, criteria, analysis_id),
+        size_of=lambda result: result.nbytes
+    )
+
+
+def run_batch(store: CandidateStore, criteria_list: List[Dict[str, Any]], top_n: int = 10) -> List[Dict[str, Any]]:
+    """
+    Score several criteria sets against the same candidates in one pass.
+
+    Candidates are processed in chunks so the candidates x scenarios score
+    matrix never has to exist in full.
+    """
+    accumulators = [ScoreAccumulator(top_n) for _ in criteria_list]
+    chunk_size = settings.scoring_chunk_size
+    for start in range(0, len(store), chunk_size):
+        scores = score_batch(store.columns, criteria_list, start, start + chunk_size)
+        for k, accumulator in enumerate(accumulators):
+            accumulator.add(scores[:, k], offset=start)
+
+    scenarios = []
+    for criteria, accumulator in zip(criteria_list, accumulators):
+        summary = accumulator.summary()
+        top_locations = [
+            describe_location(store, i, score)
+            for i, score in zip(accumulator.top_index, accumulator.top_scores)
+        ]
+        scenarios.append({
+            "analysis_id": analysis_key(criteria, store.version),
+            "criteria_used": criteria,
+            "suitable_locations_found": summary["suitable"],
+            "best_location": format_best_location(top_locations[0] if top_locations else None),
+            "top_locations": top_locations,
+            "analysis_summary": {
+                "average_score": summary["average_score"],
+                "median_score": summary["median_score"],
+                "parameters_count": len(criteria),
+                "total_weight": sum(param['weight'] for param in criteria.values())
+            }
+        })
+    return scenarios
@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+"""
+Performance benchmarks for Monasib
+
+Times scoring, layer I/O, GeoJSON serialization and startup data
+generation on synthetic datasets and writes the results as JSON.
+
+    python benchmark.py --sizes 1000,100000,1000000 --output results.json
+    python benchmark.py --baseline results.json   # exits 1 on regressions
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import statistics
+import subprocess
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+
+# Keep every file the app writes inside a scratch directory
+WORK_DIR = tempfile.mkdtemp(prefix="monasib-bench-")
+os.environ["DATABASE_PATH"] = os.path.join(WORK_DIR, "bench.gpkg")
+os.environ["CANDIDATE_STORE_PATH"] = os.path.join(WORK_DIR, "candidates.npz")
+os.environ["TILE_CACHE_DIR"] = os.path.join(WORK_DIR, "tile_cache")
+os.environ["LOG_LEVEL"] = "WARNING"
+
+import numpy as np
+import geopandas as gpd
+from fastapi.testclient import TestClient
+
+import feature_store
+from config import settings
+from encoding import payload_cache
+from parameters import RESTAURANT_PARAMETERS
+from feature_store import CandidateStore
+from scoring import score_candidates
+from analysis import run_analysis
+import main
+
+
+DEFAULT_SIZES = [1000, 100000, 1000000]
+
+# Every parameter at its frontend default threshold, equally weighted
+CRITERIA = {
+    param_id: {"value": 500 if config['type'] == 'distance' else 5, "weight": 10}
+    for param_id, config in RESTAURANT_PARAMETERS.items()
+}
+
+
+def measure(func: Callable[[], Any], repeats: int) -> Dict[str, float]:
+    """Wall-clock timings of repeated calls, in seconds"""
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return {
+        "min": min(timings),
+        "median": statistics.median(timings),
+        "mean": statistics.mean(timings),
+        "max": max(timings)
+    }
+
+
+class Suite:
+    """Collects benchmark results"""
+
+    def __init__(self, repeats: int):
+        self.repeats = repeats
+        self.results: List[Dict[str, Any]] = []
+
+    def run(self, name: str, size: int, func: Callable[[], Any], repeats: Optional[int] = None,
+            **extra) -> Dict[str, Any]:
+        timings = measure(func, repeats or self.repeats)
+        self.results.append({
+            "name": name,
+            "size": size,
+            "repeats": repeats or self.repeats,
+            **{key: round(value, 6) for key, value in timings.items()},
+            "per_second": round(size / timings["median"], 1) if timings["median"] > 0 else None,
+            **extra
+        })
+        print(f"  {name:<36} {size:>9,}  median {timings['median'] * 1000:10.2f} ms")
+        return self.results[-1]
+
+
+def bench_startup(suite: Suite):
+    """Sample data generation on first start, with no GeoPackage on disk"""
+    def startup():
+        for path in (settings.database_path, settings.candidate_store_path):
+            if os.path.exists(path):
+                os.remove(path)
+        feature_store._store = None  # Otherwise later runs reuse the candidates of the first
+        with TestClient(main.app):
+            pass
+
+    suite.run("startup.generate_sample_data", settings.max_analysis_locations, startup)
+
+
+def bench_scoring(suite: Suite, size: int):
+    """Vectorized scoring and the full analysis"""
+    store = CandidateStore.generate(settings.default_location_lat, settings.default_location_lng, size, seed=1)
+
+    suite.run("scoring.score_candidates", size, lambda: score_candidates(store.columns, CRITERIA))
+
+    # What perform_analysis does on a cache miss, including response encoding
+    suite.run("analysis.perform_analysis", size,
+              lambda: json.dumps(run_analysis(store, CRITERIA, "bench").response))
+
+
+def bench_layers(suite: Suite, client: TestClient, size: int):
+    """Layer loads with gpd.read_file and GeoJSON serialization through /layers/{layer_name}"""
+    rng = np.random.default_rng(size)
+    layer_name = f"bench_points_{size}"
+    gdf = gpd.GeoDataFrame(
+        {
+            "name": [f"Feature {i + 1}" for i in range(size)],
+            "importance": rng.integers(1, 10, size, endpoint=True)
+        },
+        geometry=gpd.points_from_xy(
+            settings.default_location_lng + rng.uniform(-0.06, 0.06, size),
+            settings.default_location_lat + rng.uniform(-0.045, 0.045, size)
+        ),
+        crs="EPSG:4326"
+    )
+    gdf.to_file(settings.database_path, layer=layer_name, driver="GPKG")
+
+    suite.run("layers.read_file", size, lambda: gpd.read_file(settings.database_path, layer=layer_name))
+
+    def fetch():
+        payload_cache.clear()  # Time reading and encoding the layer, not the cached body
+        response = client.get(f"/layers/{layer_name}")
+        response.raise_for_status()
+        return len(response.content)
+
+    result = suite.run("layers.geojson_endpoint", size, fetch)
+    result["response_bytes"] = fetch()
+
+
+def environment() -> Dict[str, Any]:
+    """Where and on what the benchmarks ran"""
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        "timestamp": datetime.utcnow().isoformat(),
+        "git_commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "numpy": np.__version__,
+        "geopandas": gpd.__version__
+    }
+
+
+def compare(results: List[Dict[str, Any]], baseline_path: str, tolerance: float) -> List[str]:
+    """Benchmarks whose median is slower than the baseline by more than the tolerance"""
+    with open(baseline_path) as f:
+        baseline = {(r["name"], r["size"]): r for r in json.load(f)["results"]}
+
+    regressions = []
+    for result in results:
+        previous = baseline.get((result["name"], result["size"]))
+        if previous is None or not previous["median"]:
+            continue
+        ratio = result["median"] / previous["median"]
+        result["baseline_median"] = previous["median"]
+        result["ratio"] = round(ratio, 3)
+        if ratio > 1 + tolerance:
+            regressions.append(f"{result['name']} @ {result['size']:,}: "
+                               f"{previous['median'] * 1000:.2f} ms -> {result['median'] * 1000:.2f} ms ({ratio:.2f}x)")
+    return regressions
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description="Monasib performance benchmarks")
+    parser.add_argument("--sizes", default=",".join(str(size) for size in DEFAULT_SIZES),
+                        help="Comma separated candidate/feature counts")
+    parser.add_argument("--repeats", type=int, default=3, help="Timed runs per benchmark")
+    parser.add_argument("--output", default=f"benchmark_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json",
+                        help="JSON file to write results to")
+    parser.add_argument("--baseline", help="Earlier results to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="Allowed slowdown against the baseline before failing (0.25 = 25%%)")
+    args = parser.parse_args()
+    sizes = [int(size) for size in args.sizes.split(",") if size]
+
+    suite = Suite(args.repeats)
+    try:
+        print("Startup")
+        bench_startup(suite)
+
+        client = TestClient(main.app)
+        for size in sizes:
+            print(f"Size {size:,}")
+            bench_scoring(suite, size)
+            bench_layers(suite, client, size)
+    finally:
+        main.gpkg.close()
+        shutil.rmtree(WORK_DIR, ignore_errors=True)
+
+    regressions = compare(suite.results, args.baseline, args.tolerance) if args.baseline else []
+
+    with open(args.output, "w") as f:
+        json.dump({"environment": environment(), "results": suite.results, "regressions": regressions}, f, indent=2)
+    print(f"Results written to {args.output}")
+
+    if regressions:
+        print("Regressions:")
+        for regression in regressions:
+            print(f"  {regression}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,116 @@
+"""
+Sample GeoPackage generation for Monasib backend
+"""
+import time
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+from typing import Dict, Optional
+
+from config import settings
+from logger import logger
+from feature_store import CandidateStore
+from files import atomic_path
+
+
+# Auxiliary layers: (layer name, display name)
+SAMPLE_LAYERS = [
+    ('transport_stops', 'Public Transport'),
+    ('shopping_areas', 'Shopping Centers'),
+    ('office_buildings', 'Office Buildings'),
+    ('parking_lots', 'Parking Areas'),
+    ('high_traffic_areas', 'High Traffic Zones'),
+    ('commercial_zones', 'Commercial Zones'),
+    ('residential_areas', 'Residential Areas'),
+    ('safety_zones', 'Safety Zones')
+]
+
+CUISINES = np.array(['Italian', 'Chinese', 'Mexican', 'American', 'Japanese', 'Mediterranean', 'Indian', 'Thai'])
+PRICE_RANGES = np.array(['$', '$$', '$$$', '$$$$'])
+ZONE_TYPES = np.array(['Commercial', 'Mixed-Use', 'Retail'])
+
+
+def _labels(prefix: str, ids: np.ndarray) -> pd.Series:
+    """Names like 'Restaurant 1' for every id"""
+    return prefix + pd.Series(ids).astype(str)
+
+
+def _random_points(rng: np.random.Generator, count: int, center_lat: float, center_lng: float) -> gpd.array.GeometryArray:
+    """Points within ~5km of the center, as in the candidate store"""
+    lat = center_lat + rng.uniform(-0.045, 0.045, count)
+    lng = center_lng + rng.uniform(-0.06, 0.06, count)
+    return gpd.points_from_xy(lng, lat)
+
+
+def generate_sample_layers(candidate_store: CandidateStore, seed: Optional[int] = None,
+                           center_lat: Optional[float] = None,
+                           center_lng: Optional[float] = None) -> Dict[str, gpd.GeoDataFrame]:
+    """
+    Build every sample layer with one seeded generator.
+
+    Layer sizes come from the sample_* settings; the same seed and
+    settings always give the same layers.
+    """
+    rng = np.random.default_rng(settings.sample_data_seed if seed is None else seed)
+    center_lat = settings.default_location_lat if center_lat is None else center_lat
+    center_lng = settings.default_location_lng if center_lng is None else center_lng
+    layers = {}
+
+    # Existing restaurants
+    count = settings.sample_restaurants_count
+    ids = np.arange(1, count + 1)
+    layers['restaurants'] = gpd.GeoDataFrame({
+        'id': ids,
+        'name': _labels('Restaurant ', ids),
+        'cuisine': rng.choice(CUISINES, count),
+        'rating': np.round(rng.uniform(3.5, 4.8, count), 1),
+        'price_range': rng.choice(PRICE_RANGES, count),
+        'established_year': rng.integers(2000, 2023, count, endpoint=True)
+    }, geometry=_random_points(rng, count, center_lat, center_lng), crs="EPSG:4326")
+
+    # Potential locations are the first candidates the analysis scores
+    count = min(settings.sample_locations_count, len(candidate_store))
+    ids = candidate_store.ids[:count].astype(np.int64)
+    layers['potential_locations'] = gpd.GeoDataFrame({
+        'id': ids,
+        'name': _labels('Location ', ids),
+        'address': _labels('Sample Location ', ids),
+        'zone_type': rng.choice(ZONE_TYPES, count)
+    }, geometry=gpd.points_from_xy(candidate_store.longitude[:count], candidate_store.latitude[:count]),
+        crs="EPSG:4326")
+
+    for layer_name, display_name in SAMPLE_LAYERS:
+        count = int(rng.integers(settings.sample_layer_features_min, settings.sample_layer_features_max,
+                                 endpoint=True))
+        ids = np.arange(1, count + 1)
+        layers[layer_name] = gpd.GeoDataFrame({
+            'id': ids,
+            'name': _labels(f'{display_name} ', ids),
+            'category': np.full(count, display_name),
+            'importance': rng.integers(1, 10, count, endpoint=True)
+        }, geometry=_random_points(rng, count, center_lat, center_lng), crs="EPSG:4326")
+
+    return layers
+
+
+def write_geopackage(path: str, layers: Dict[str, gpd.GeoDataFrame]):
+    """
+    Write layers with spatial indexes into a new GeoPackage.
+
+    Layers go into a temporary file that replaces `path` only once all of
+    them are written, so readers never see a partial database. Every
+    writer gets its own temporary file, as every worker may bootstrap at once.
+    """
+    with atomic_path(path) as tmp_path:
+        for layer_name, gdf in layers.items():
+            gdf.to_file(tmp_path, layer=layer_name, driver="GPKG", engine="pyogrio", SPATIAL_INDEX="YES")
+
+
+def bootstrap_database(path: str, candidate_store: CandidateStore):
+    """Create the sample GeoPackage"""
+    start = time.perf_counter()
+    layers = generate_sample_layers(candidate_store)
+    write_geopackage(path, layers)
+    total = sum(len(gdf) for gdf in layers.values())
+    logger.info(f"Created {path} with {len(layers)} sample layers and {total} features "
+                f"in {time.perf_counter() - start:.2f}s")
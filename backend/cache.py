@@ -0,0 +1,203 @@
+"""
+In-process caching for Monasib backend
+"""
+import os
+import time
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Hashable, Optional
+
+import shapely
+import geopandas as gpd
+
+from config import settings
+from logger import logger
+from metrics import LAYER_READ_LATENCY
+from columnar import read_layer
+
+
+_MISSING = object()
+
+
+class TTLCache:
+    """Thread-safe LRU cache with per-entry TTL and a memory budget"""
+
+    def __init__(self, ttl: float, max_bytes: int, clock: Callable[[], float] = time.monotonic):
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._inflight: Dict[Hashable, Future] = {}
+        self._nbytes = 0
+        self._lock = threading.RLock()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Return a live entry and mark it recently used"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            value, size, expires_at = entry
+            if expires_at <= self.clock():
+                self._remove(key)
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: Hashable, value: Any, size: int = 0):
+        """Store an entry, evicting least recently used ones over budget"""
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            if size > self.max_bytes:
+                return
+            self._entries[key] = (value, size, self.clock() + self.ttl)
+            self._nbytes += size
+            while self._nbytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+
+    def get_or_compute(self, key: Hashable, compute: Callable[[], Any],
+                       size_of: Callable[[Any], int] = lambda value: 0) -> Any:
+        """
+        Return a cached value or compute and store it.
+
+        Concurrent callers asking for the same missing key wait for a single
+        computation instead of repeating it.
+        """
+        value = self.get(key, _MISSING)
+        if value is not _MISSING:
+            return value
+
+        with self._lock:
+            future = self._inflight.get(key)
+            owner = future is None
+            if owner:
+                future = Future()
+                self._inflight[key] = future
+            else:
+                self.coalesced += 1
+        if not owner:
+            return future.result()
+
+        try:
+            value = compute()
+            self.set(key, value, size=size_of(value))
+            future.set_result(value)
+            return value
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    def invalidate(self, key: Hashable):
+        """Drop a single entry if present"""
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+
+    def clear(self):
+        """Drop every entry"""
+        with self._lock:
+            self._entries.clear()
+            self._nbytes = 0
+
+    def _remove(self, key: Hashable):
+        _, size, _ = self._entries.pop(key)
+        self._nbytes -= size
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def nbytes(self) -> int:
+        return self._nbytes
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss counters and current occupancy"""
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self),
+            "size_mb": round(self._nbytes / 1024 / 1024, 2),
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "hit_ratio": round(self.hits / lookups, 3) if lookups else 0
+        }
+
+
+def estimate_gdf_size(gdf: gpd.GeoDataFrame) -> int:
+    """Approximate memory held by a GeoDataFrame, including geometries"""
+    attributes = int(gdf.drop(columns=gdf.geometry.name).memory_usage(deep=True).sum())
+    geometries = gdf.geometry.values
+    # GEOS objects: fixed overhead plus 16 bytes per 2D coordinate
+    return attributes + len(geometries) * 100 + int(shapely.get_num_coordinates(geometries).sum()) * 16
+
+
+class LayerCache:
+    """
+    Cache of GeoPackage layers, read from Arrow snapshots when the
+    columnar store is enabled.
+
+    Entries expire after the TTL and are all dropped when the GeoPackage
+    file changes on disk. Returned frames are shared; do not mutate them.
+    """
+
+    def __init__(self, db_path: str, ttl: Optional[float] = None, max_bytes: Optional[int] = None,
+                 enabled: Optional[bool] = None):
+        self.db_path = db_path
+        self.enabled = settings.cache_enabled if enabled is None else enabled
+        self._cache = TTLCache(
+            ttl=settings.cache_ttl if ttl is None else ttl,
+            max_bytes=settings.cache_max_memory_mb * 1024 * 1024 if max_bytes is None else max_bytes
+        )
+        self._mtime: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def get(self, layer_name: str) -> gpd.GeoDataFrame:
+        """Return a layer, reading it from disk only on a cache miss"""
+        if not self.enabled:
+            return self._read(layer_name)
+
+        self._check_source()
+        return self._cache.get_or_compute(
+            layer_name,
+            lambda: self._read(layer_name),
+            size_of=estimate_gdf_size
+        )
+
+    def _read(self, layer_name: str) -> gpd.GeoDataFrame:
+        with LAYER_READ_LATENCY.time(layer_name):
+            return read_layer(self.db_path, layer_name)
+
+    def _check_source(self):
+        """Drop all entries when the GeoPackage has been modified"""
+        try:
+            mtime = os.path.getmtime(self.db_path)
+        except OSError:
+            mtime = None
+        with self._lock:
+            if mtime != self._mtime:
+                if self._mtime is not None:
+                    logger.info(f"{self.db_path} changed, clearing layer cache")
+                self._cache.clear()
+                self._mtime = mtime
+
+    def clear(self):
+        """Drop every cached layer"""
+        self._cache.clear()
+
+    @property
+    def nbytes(self) -> int:
+        return self._cache.nbytes
+
+    def stats(self) -> Dict[str, Any]:
+        return {"enabled": self.enabled, **self._cache.stats()}
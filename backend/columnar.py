@@ -0,0 +1,359 @@
+"""
+Memory-mapped Arrow columnar storage for Monasib backend
+
+Layers and the candidate matrix can be kept as uncompressed Arrow IPC
+files. The candidate matrix is mapped instead of decoded: its columns are
+zero-copy views, so every worker process shares the same page cache copy.
+Layer reads skip record batches outside a bbox and undecoded columns, but
+still build a GeoDataFrame per process, which the layer cache then holds.
+Each snapshot also keeps a representative lon/lat per feature, so reads
+that need only coordinates (read_points) decode no geometries at all.
+pyarrow is optional; without it the GeoPackage is read directly.
+"""
+import os
+import json
+import threading
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+import pyogrio
+import shapely
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from config import settings
+from logger import logger
+from gpkg import GeoPackage
+from files import atomic_path
+
+try:
+    import pyarrow as pa
+    import pyarrow.ipc as ipc
+except ImportError:  # pragma: no cover - optional dependency
+    pa = None
+    ipc = None
+
+
+BOUNDS_COLUMNS = ("_minx", "_miny", "_maxx", "_maxy")
+
+# Representative lon/lat of each feature: points as-is, others by centroid
+POINT_COLUMNS = ("_lng", "_lat")
+
+
+def available() -> bool:
+    """Whether pyarrow is installed"""
+    return pa is not None
+
+
+def columnar_enabled() -> bool:
+    """Whether layers are served from Arrow snapshots"""
+    return settings.columnar_store_enabled and available()
+
+
+def _morton(x: np.ndarray, y: np.ndarray) -> np.ndarray:
+    """Z-order codes of points scaled to a 16-bit grid, so nearby rows share record batches"""
+    def spread(v: np.ndarray) -> np.ndarray:
+        v = v.astype(np.uint32)
+        v = (v | (v << 8)) & 0x00FF00FF
+        v = (v | (v << 4)) & 0x0F0F0F0F
+        v = (v | (v << 2)) & 0x33333333
+        return (v | (v << 1)) & 0x55555555
+
+    def scale(v: np.ndarray) -> np.ndarray:
+        span = v.max() - v.min()
+        return (v - v.min()) / span * 65535 if span > 0 else np.zeros(len(v))
+
+    return spread(scale(x)) | (spread(scale(y)) << 1)
+
+
+def _metadata(schema) -> Dict[str, str]:
+    return {key.decode(): value.decode() for key, value in (schema.metadata or {}).items()}
+
+
+class ColumnarLayerStore:
+    """
+    Arrow snapshots of GeoPackage layers.
+
+    Each layer is exported once per content version, sorted along a
+    Z-order curve and split into record batches whose bounding boxes are
+    kept in the file metadata. Reads skip batches outside a bbox and
+    decode only the requested columns.
+    """
+
+    def __init__(self, db_path: str, directory: Optional[str] = None, batch_rows: Optional[int] = None):
+        if not available():
+            raise RuntimeError("pyarrow is required for the columnar store")
+        self.db_path = db_path
+        self.directory = directory or settings.columnar_store_dir
+        self.batch_rows = batch_rows or settings.columnar_batch_rows
+        self.gpkg = GeoPackage(db_path, pool_size=1)
+        self._lock = threading.Lock()
+
+    def path(self, layer_name: str) -> str:
+        return os.path.join(self.directory, f"{layer_name}.arrow")
+
+    def version(self, layer_name: str) -> str:
+        """Content version of the layer in the GeoPackage"""
+        return str(self.gpkg.last_change(layer_name))
+
+    def snapshot(self, layer_name: str) -> str:
+        """Path of an up-to-date snapshot, exporting the layer if needed"""
+        path = self.path(layer_name)
+        version = self.version(layer_name)
+        if self._stored_version(path) == version:
+            return path
+        # The lock spans this process; other workers export through their own temporary file
+        with self._lock:
+            if self._stored_version(path) != version:
+                self.export(layer_name, version)
+        return path
+
+    def _stored_version(self, path: str) -> Optional[str]:
+        try:
+            with pa.memory_map(path) as source:
+                schema = ipc.open_file(source).schema
+                if not set(POINT_COLUMNS).issubset(schema.names):
+                    return None  # Exported before representative points were kept
+                return _metadata(schema).get("version")
+        except (OSError, pa.ArrowInvalid):
+            return None
+
+    def export(self, layer_name: str, version: str):
+        """Write the layer as a Z-ordered Arrow IPC file in record batches"""
+        gdf = pyogrio.read_dataframe(self.db_path, layer=layer_name)
+        geometries = np.asarray(gdf.geometry.values)
+        bounds = shapely.bounds(geometries)
+        bounds = np.nan_to_num(bounds, nan=0.0)
+        order = np.argsort(_morton((bounds[:, 0] + bounds[:, 2]) / 2, (bounds[:, 1] + bounds[:, 3]) / 2),
+                           kind="stable") if len(gdf) else np.arange(0)
+
+        bounds = bounds[order]
+        table = pa.Table.from_pandas(gdf.drop(columns=gdf.geometry.name).iloc[order], preserve_index=False)
+        for i, name in enumerate(BOUNDS_COLUMNS):
+            table = table.append_column(name, pa.array(bounds[:, i]))
+        lng, lat = representative_points(geometries[order], gdf.crs)
+        table = table.append_column(POINT_COLUMNS[0], pa.array(lng))
+        table = table.append_column(POINT_COLUMNS[1], pa.array(lat))
+        table = table.append_column("geometry", pa.array(shapely.to_wkb(geometries[order]),
+                                                         type=pa.binary()))
+        table = table.combine_chunks()
+
+        starts = range(0, len(table), self.batch_rows)
+        batches = [table.slice(start, self.batch_rows).to_batches()[0] for start in starts]
+        batch_bounds = [
+            [float(part[:, 0].min()), float(part[:, 1].min()), float(part[:, 2].max()), float(part[:, 3].max())]
+            for part in (bounds[start:start + self.batch_rows] for start in starts)
+        ]
+        metadata = {
+            "version": version,
+            "crs": gdf.crs.to_json() if gdf.crs else "",
+            "batch_bounds": json.dumps(batch_bounds)
+        }
+        schema = table.schema.with_metadata(metadata)
+
+        os.makedirs(self.directory, exist_ok=True)
+        path = self.path(layer_name)
+        # Readers holding the old mapping keep their pages once the file is replaced
+        with atomic_path(path) as tmp_path:
+            with pa.OSFile(tmp_path, "wb") as sink, ipc.new_file(sink, schema) as writer:
+                for batch in batches:
+                    writer.write_batch(batch)
+        logger.info(f"Exported '{layer_name}' ({len(gdf)} features, {len(batches)} batches) to {path}")
+
+    def read(self, layer_name: str, columns: Optional[Sequence[str]] = None,
+             bbox: Optional[Tuple[float, float, float, float]] = None) -> gpd.GeoDataFrame:
+        """
+        Read a layer from its memory-mapped snapshot.
+
+        Only the given property columns are decoded (all of them when
+        None), and with a bbox only record batches and features whose
+        bounds intersect it.
+        """
+        path = self.snapshot(layer_name)
+        with pa.memory_map(path) as source:
+            reader = ipc.open_file(source)
+            metadata = _metadata(reader.schema)
+            properties = [name for name in reader.schema.names
+                          if name not in BOUNDS_COLUMNS + POINT_COLUMNS and name != "geometry"]
+            if columns is not None:
+                properties = [name for name in properties if name in columns]
+
+            batches = [batch.select(properties + ["geometry"])
+                       for batch in _batches_in(reader, json.loads(metadata["batch_bounds"]), bbox)]
+
+            schema = pa.schema([reader.schema.field(name) for name in properties + ["geometry"]])
+            table = pa.Table.from_batches(batches, schema=schema)
+            frame = table.drop_columns(["geometry"]).to_pandas()
+            geometry = shapely.from_wkb(table.column("geometry").to_numpy(zero_copy_only=False))
+
+        return gpd.GeoDataFrame(frame, geometry=geometry, crs=metadata["crs"] or None)
+
+    def points(self, layer_name: str, column: Optional[str] = None,
+               bbox: Optional[Tuple[float, float, float, float]] = None
+               ) -> Tuple[np.ndarray, np.ndarray, Optional[np.ndarray]]:
+        """
+        Representative lon/lat of the features of a layer, and the values
+        of one property column (None when the layer has no such column).
+
+        Only the coordinate and value columns of the record batches in the
+        bbox are read from the mapping; geometries are not decoded.
+        """
+        path = self.snapshot(layer_name)
+        with pa.memory_map(path) as source:
+            reader = ipc.open_file(source)
+            names = list(POINT_COLUMNS) + ([column] if column in reader.schema.names else [])
+            batches = [batch.select(names)
+                       for batch in _batches_in(reader, json.loads(_metadata(reader.schema)["batch_bounds"]), bbox)]
+            table = pa.Table.from_batches(batches, schema=pa.schema([reader.schema.field(name) for name in names]))
+            lng, lat = (table.column(name).to_numpy() for name in POINT_COLUMNS)
+            values = table.column(column).to_numpy() if len(names) > 2 else None
+        valid = np.isfinite(lng) & np.isfinite(lat)
+        return lng[valid], lat[valid], values[valid] if values is not None else None
+
+
+def _batches_in(reader, batch_bounds: List[List[float]], bbox: Optional[Tuple[float, float, float, float]]):
+    """Record batches of a snapshot, pruned by their bounds and filtered to the features a bbox intersects"""
+    for i, (minx, miny, maxx, maxy) in enumerate(batch_bounds):
+        if bbox is not None and (minx > bbox[2] or maxx < bbox[0] or miny > bbox[3] or maxy < bbox[1]):
+            continue
+        batch = reader.get_batch(i)
+        if bbox is not None:
+            bounds = [batch.column(name).to_numpy() for name in BOUNDS_COLUMNS]
+            mask = ((bounds[0] <= bbox[2]) & (bounds[2] >= bbox[0]) &
+                    (bounds[1] <= bbox[3]) & (bounds[3] >= bbox[1]))
+            batch = batch.filter(pa.array(mask))
+        yield batch
+
+
+def representative_points(geometries: np.ndarray, crs=None) -> Tuple[np.ndarray, np.ndarray]:
+    """Lon/lat of points as-is and of the centroid of other geometries; NaN for missing or empty ones"""
+    geometries = np.asarray(geometries)
+    if crs is not None and crs.to_epsg() != 4326:
+        geometries = np.asarray(gpd.GeoSeries(geometries, crs=crs).to_crs("EPSG:4326").values)
+    lng, lat = np.full(len(geometries), np.nan), np.full(len(geometries), np.nan)
+    keep = ~(shapely.is_missing(geometries) | shapely.is_empty(geometries))
+    kept = geometries[keep]
+    points = np.where(shapely.get_type_id(kept) == 0, kept, shapely.centroid(kept))
+    lng[keep], lat[keep] = shapely.get_x(points), shapely.get_y(points)
+    return lng, lat
+
+
+_layer_stores: Dict[str, ColumnarLayerStore] = {}
+
+
+def release(db_path: str):
+    """Forget the snapshot store of a GeoPackage that is no longer served"""
+    store = _layer_stores.pop(db_path, None)
+    if store is not None:
+        store.gpkg.close()
+
+
+def sidecar_dir(db_path: str, directory: str) -> str:
+    """A cache directory resolved next to a GeoPackage, so every database keeps its own files"""
+    return os.path.join(os.path.dirname(os.path.abspath(db_path)), directory)
+
+
+def _layer_store(db_path: str) -> ColumnarLayerStore:
+    store = _layer_stores.get(db_path)
+    if store is None:
+        store = _layer_stores.setdefault(
+            db_path, ColumnarLayerStore(db_path, sidecar_dir(db_path, settings.columnar_store_dir)))
+    return store
+
+
+def read_layer(db_path: str, layer_name: str, columns: Optional[List[str]] = None,
+               bbox: Optional[Tuple[float, float, float, float]] = None) -> gpd.GeoDataFrame:
+    """Read a layer through the columnar store when enabled, otherwise from the GeoPackage"""
+    if columnar_enabled():
+        return _layer_store(db_path).read(layer_name, columns, bbox)
+
+    gdf = gpd.read_file(db_path, layer=layer_name, bbox=bbox)
+    if columns is not None:
+        gdf = gdf[[name for name in gdf.columns if name in columns] + [gdf.geometry.name]]
+    return gdf
+
+
+def read_points(db_path: str, layer_name: str, column: Optional[str] = None,
+                bbox: Optional[Tuple[float, float, float, float]] = None
+                ) -> Tuple[np.ndarray, np.ndarray, Optional[np.ndarray]]:
+    """
+    Representative lon/lat of a layer's features and one property column,
+    from the snapshot's coordinate columns when the columnar store is
+    enabled, otherwise by decoding the GeoPackage layer
+    """
+    if columnar_enabled():
+        return _layer_store(db_path).points(layer_name, column, bbox)
+
+    gdf = read_layer(db_path, layer_name, [column] if column else [], bbox)
+    lng, lat = representative_points(np.asarray(gdf.geometry.values), gdf.crs)
+    values = gdf[column].to_numpy(dtype=np.float64, na_value=np.nan) if column in gdf.columns else None
+    valid = np.isfinite(lng) & np.isfinite(lat)
+    return lng[valid], lat[valid], values[valid] if values is not None else None
+
+
+def _from_sources(read: Callable[[str, Optional[Tuple[float, float, float, float]]], Any], db_path: str,
+                  neighbours: Sequence[str], bbox: Optional[Tuple[float, float, float, float]]) -> List[Any]:
+    """Reads of a GeoPackage and of its neighbours inside a bbox, skipping sources without the layer"""
+    results, error = [], None
+    for path, area in [(db_path, None)] + [(path, bbox) for path in neighbours]:
+        try:
+            results.append(read(path, area))
+        except Exception as e:
+            error = error or e
+    if not results:
+        raise error
+    return results
+
+
+def read_layer_with_neighbours(db_path: str, layer_name: str, columns: Optional[List[str]] = None,
+                               neighbours: Sequence[str] = (),
+                               bbox: Optional[Tuple[float, float, float, float]] = None) -> gpd.GeoDataFrame:
+    """
+    Read a layer together with the features of neighbouring GeoPackages inside a bbox.
+
+    Neighbours are read through their spatial index, so only the features
+    near the GeoPackage's own area are decoded. Sources without the layer
+    are skipped; the read fails only if none of them has it.
+    """
+    frames = _from_sources(lambda path, area: read_layer(path, layer_name, columns, area), db_path, neighbours, bbox)
+    if len(frames) == 1:
+        return frames[0]
+    crs = frames[0].crs
+    frames = [frame.to_crs(crs) if crs is not None and frame.crs is not None and frame.crs != crs else frame
+              for frame in frames]
+    return gpd.GeoDataFrame(pd.concat(frames, ignore_index=True), geometry=frames[0].geometry.name, crs=crs)
+
+
+def read_points_with_neighbours(db_path: str, layer_name: str, column: Optional[str] = None,
+                                neighbours: Sequence[str] = (),
+                                bbox: Optional[Tuple[float, float, float, float]] = None
+                                ) -> Tuple[np.ndarray, np.ndarray, Optional[np.ndarray]]:
+    """read_points of a layer together with the features of neighbouring GeoPackages inside a bbox"""
+    parts = _from_sources(lambda path, area: read_points(path, layer_name, column, area), db_path, neighbours, bbox)
+    lng = np.concatenate([part[0] for part in parts])
+    lat = np.concatenate([part[1] for part in parts])
+    values = None
+    if any(part[2] is not None for part in parts):
+        values = np.concatenate([part[2].astype(np.float64) if part[2] is not None else np.full(len(part[0]), np.nan)
+                                 for part in parts])
+    return lng, lat, values
+
+
+# Candidate matrix
+
+def save_arrays(path: str, arrays: Dict[str, np.ndarray], metadata: Dict[str, str]):
+    """Write equal-length arrays as one Arrow IPC record batch"""
+    table = pa.table({name: pa.array(values) for name, values in arrays.items()})
+    with atomic_path(path) as tmp_path:
+        with pa.OSFile(tmp_path, "wb") as sink, ipc.new_file(sink, table.schema.with_metadata(metadata)) as writer:
+            writer.write_table(table, max_chunksize=max(len(table), 1))
+
+
+def load_arrays(path: str) -> Tuple[Dict[str, np.ndarray], Dict[str, str]]:
+    """Map an Arrow IPC file and view its columns as read-only numpy arrays without copying"""
+    table = ipc.open_file(pa.memory_map(path)).read_all()
+    arrays = {}
+    for name in table.column_names:
+        column = table.column(name)
+        chunk = column.chunk(0) if column.num_chunks == 1 else column.combine_chunks()
+        arrays[name] = chunk.to_numpy(zero_copy_only=True)
+    return arrays, _metadata(table.schema)
@@ -2,8 +2,8 @@
 Configuration management for Monasib backend
 """
 import os
-from typing import List
-from pydantic import BaseSettings
+from typing import Dict, List
+from pydantic import BaseSettings, validator
 
 
 class Settings(BaseSettings):
@@ -18,18 +18,38 @@ class Settings(BaseSettings):
     # Database Settings
     database_path: str = "gis_data.gpkg"
     database_backup_enabled: bool = True
+    sqlite_pool_size: int = 4
     
     # GIS Analysis Settings
     default_location_lat: float = 40.7128
     default_location_lng: float = -74.0060
     max_analysis_locations: int = 200
     min_analysis_locations: int = 50
+    candidate_store_path: str = "candidates.npz"  # a .arrow path keeps it memory-mapped (needs pyarrow)
+    candidate_seed: int = 42
+    scoring_chunk_size: int = 65536
+    parallel_scoring_workers: int = 0  # 0 or 1 disables sharded scoring
+    parallel_scoring_min_candidates: int = 1000000
+    max_batch_scenarios: int = 100
+    max_page_size: int = 1000
+    job_workers: int = 2
+    job_queue_size: int = 100
+    job_retention: int = 3600  # 1 hour
+    export_dir: str = "exports"
+    export_workers: int = 1
+    export_queue_size: int = 20
+    export_retention: int = 3600  # 1 hour
+    export_chunk_size: int = 50000
+    max_surface_size: int = 2048
+    surface_margin_m: float = 2000
+    surface_max_fill_m: float = 2000  # cells farther from every candidate have no score
     
     # Sample Data Generation
     sample_restaurants_count: int = 20
     sample_locations_count: int = 50
     sample_layer_features_min: int = 15
     sample_layer_features_max: int = 30
+    sample_data_seed: int = 42
     
     # Security Settings
     cors_origins: List[str] = [
@@ -59,10 +79,62 @@ class Settings(BaseSettings):
     # File Upload Settings
     max_file_size: int = 10485760  # 10MB
     allowed_extensions: List[str] = [".geojson", ".kml", ".gpx", ".csv"]
+    max_ingest_file_size: int = 1073741824  # 1GB, layer uploads are parsed as a stream
+    ingest_batch_size: int = 10000
+    ingest_max_value_size: int = 67108864  # 64MB, largest single GeoJSON feature or header before "features"
     
     # Cache Settings
     cache_ttl: int = 300  # 5 minutes
     cache_enabled: bool = True
+    cache_max_memory_mb: int = 256
+    result_cache_max_memory_mb: int = 256
+    response_cache_max_memory_mb: int = 128
+    session_ttl: int = 1800  # 30 minutes
+    session_max_memory_mb: int = 512
+    
+    # Columnar layer store (needs pyarrow)
+    columnar_store_enabled: bool = False
+    columnar_store_dir: str = "columnar"  # next to each GeoPackage
+    columnar_batch_rows: int = 65536
+    
+    # Response Encoding
+    compression_min_bytes: int = 1024
+    gzip_level: int = 6
+    brotli_quality: int = 5
+    precompressed_layer_max_features: int = 100000
+    
+    # Layer Aggregation
+    aggregate_cell_px: int = 60
+    aggregate_cache_max_memory_mb: int = 64
+    
+    # Density-derived Parameters
+    density_bandwidth_m: float = 400.0
+    density_cell_m: float = 25.0
+    density_max_cells: int = 2048
+    density_cache_dir: str = "density_cache"  # next to each GeoPackage
+    
+    # Regional Partitions
+    partitions_enabled: bool = False
+    partition_dir: str = "partitions"
+    partition_zoom: int = 9  # at most 10, so feature ids stay exact in JavaScript
+    partition_max_open: int = 16
+    partition_max_memory_mb: int = 1024
+    partition_halo_m: float = 4000.0  # neighbouring features this close count; twice the largest distance threshold
+    area_cache_max_memory_mb: int = 256
+    regions: Dict[str, List[float]] = {
+        "new_york": [-74.26, 40.49, -73.70, 40.92]
+    }
+    
+    # Vector Tiles
+    tile_cache_dir: str = "tile_cache"
+    tile_max_zoom: int = 22
+    
+    @validator("partition_zoom")
+    def partition_zoom_in_range(cls, value):
+        # Feature ids are tile_index << 32 | fid with tile_index < 4 ** zoom; JavaScript numbers are exact below 2 ** 53
+        if not 0 <= value <= 10:
+            raise ValueError("partition_zoom must be between 0 and 10")
+        return value
     
     class Config:
         env_file = ".env"
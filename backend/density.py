@@ -0,0 +1,211 @@
+"""
+Kernel density grids of weighted point layers for Monasib backend
+"""
+import os
+import re
+import math
+import hashlib
+import numpy as np
+from scipy import ndimage
+from typing import Dict, Optional, Sequence, Tuple
+
+from config import settings
+from logger import logger
+from parameters import RESTAURANT_PARAMETERS
+from gpkg import GeoPackage
+from columnar import read_points_with_neighbours, sidecar_dir
+from files import atomic_path
+
+
+# Meters per degree of latitude, and of longitude at the equator
+METERS_PER_DEGREE_LAT = 110540.0
+METERS_PER_DEGREE_LNG = 111320.0
+
+# Kernel radius in bandwidths; the grid extends this far past the candidates
+KERNEL_TRUNCATE = 3.0
+
+# Cache file name after the layer name: data key, bbox key
+CACHE_NAME = re.compile(r"([0-9a-f]{16})-([0-9a-f]{16})\.npz")
+
+# Density that maps to level 10, as a percentile of the non-zero cells
+LEVEL_PERCENTILE = 99
+
+
+class DensityGrid:
+    """Scale levels (1-10) on a regular lon/lat grid, row 0 at the top (north)"""
+
+    def __init__(self, bbox: Tuple[float, float, float, float], levels: np.ndarray):
+        self.bbox = bbox
+        self.levels = levels
+        height, width = levels.shape
+        self.cell_lng = (bbox[2] - bbox[0]) / width
+        self.cell_lat = (bbox[3] - bbox[1]) / height
+
+    def lookup(self, lng: np.ndarray, lat: np.ndarray) -> np.ndarray:
+        """Level of the cell containing each coordinate; 1 outside the grid"""
+        height, width = self.levels.shape
+        col = np.floor((np.asarray(lng) - self.bbox[0]) / self.cell_lng).astype(np.int64)
+        row = np.floor((self.bbox[3] - np.asarray(lat)) / self.cell_lat).astype(np.int64)
+        inside = (row >= 0) & (row < height) & (col >= 0) & (col < width)
+        values = np.ones(np.shape(lng), dtype=np.uint8)
+        values[inside] = self.levels[row[inside], col[inside]]
+        return values
+
+    def save(self, path: str):
+        with atomic_path(path) as tmp_path:
+            np.savez(tmp_path, bbox=np.array(self.bbox), levels=self.levels)
+
+    @classmethod
+    def load(cls, path: str) -> "DensityGrid":
+        with np.load(path) as data:
+            return cls(tuple(float(v) for v in data["bbox"]), data["levels"])
+
+
+def padded_extent(longitude: np.ndarray, latitude: np.ndarray, pad_m: float) -> Tuple[float, float, float, float]:
+    """Bbox of the coordinates padded by `pad_m` meters, snapped outward to a 0.001 degree lattice"""
+    center_lat = math.radians((float(np.min(latitude)) + float(np.max(latitude))) / 2)
+    pad_lat = pad_m / METERS_PER_DEGREE_LAT
+    pad_lng = pad_m / (METERS_PER_DEGREE_LNG * math.cos(center_lat))
+    return (
+        math.floor((float(np.min(longitude)) - pad_lng) * 1000) / 1000,
+        math.floor((float(np.min(latitude)) - pad_lat) * 1000) / 1000,
+        math.ceil((float(np.max(longitude)) + pad_lng) * 1000) / 1000,
+        math.ceil((float(np.max(latitude)) + pad_lat) * 1000) / 1000
+    )
+
+
+def density_extent(longitude: np.ndarray, latitude: np.ndarray,
+                   bandwidth_m: Optional[float] = None) -> Tuple[float, float, float, float]:
+    """Bbox of the candidates padded by the kernel radius, snapped to a 0.001 degree lattice"""
+    bandwidth_m = bandwidth_m or settings.density_bandwidth_m
+    return padded_extent(longitude, latitude, KERNEL_TRUNCATE * bandwidth_m)
+
+
+def kernel_density(lng: np.ndarray, lat: np.ndarray, weights: np.ndarray,
+                   bbox: Tuple[float, float, float, float], cell_m: float, bandwidth_m: float) -> np.ndarray:
+    """
+    Weighted Gaussian kernel density over a bbox.
+
+    Weights are binned onto the grid in one pass and smoothed with a
+    separable Gaussian filter, so the cost depends on the grid size and
+    not on the number of points.
+    """
+    minx, miny, maxx, maxy = bbox
+    cos_lat = math.cos(math.radians((miny + maxy) / 2))
+    width_m = (maxx - minx) * METERS_PER_DEGREE_LNG * cos_lat
+    height_m = (maxy - miny) * METERS_PER_DEGREE_LAT
+    # Coarser cells for large areas keep the grid within density_max_cells per side
+    cell_m = max(cell_m, width_m / settings.density_max_cells, height_m / settings.density_max_cells)
+    width, height = max(1, int(math.ceil(width_m / cell_m))), max(1, int(math.ceil(height_m / cell_m)))
+
+    col = np.floor((lng - minx) / (maxx - minx) * width).astype(np.int64)
+    row = np.floor((maxy - lat) / (maxy - miny) * height).astype(np.int64)
+    inside = (row >= 0) & (row < height) & (col >= 0) & (col < width)
+    binned = np.bincount(row[inside] * width + col[inside], weights=weights[inside],
+                         minlength=width * height).reshape(height, width)
+
+    sigma = (bandwidth_m / (height_m / height), bandwidth_m / (width_m / width))
+    return ndimage.gaussian_filter(binned, sigma=sigma, mode="constant", truncate=KERNEL_TRUNCATE)
+
+
+def density_levels(density: np.ndarray) -> np.ndarray:
+    """Densities as 1-10 levels, 10 at or above the top percentile of occupied cells"""
+    occupied = density[density > density.max() * 1e-6] if density.max() > 0 else density[:0]
+    if len(occupied) == 0:
+        return np.ones(density.shape, dtype=np.uint8)
+    top = np.percentile(occupied, LEVEL_PERCENTILE)
+    return np.clip(np.rint(1 + 9 * density / top), 1, 10).astype(np.uint8)
+
+
+def layer_points(db_path: str, layer_name: str, neighbours: Sequence[str] = (),
+                 bbox: Optional[Tuple[float, float, float, float]] = None) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Representative lon/lat and importance weight of every feature in a layer, and of neighbours' inside a bbox"""
+    lng, lat, importance = read_points_with_neighbours(db_path, layer_name, "importance", neighbours, bbox)
+    if importance is None:
+        return lng, lat, np.ones(len(lng))
+    return lng, lat, np.where(np.isnan(importance), 1.0, importance)
+
+
+def layer_version(db_path: str, layer_name: str) -> Optional[str]:
+    """Last change of a layer, None when the GeoPackage or the layer is missing"""
+    if not os.path.exists(db_path):
+        return None
+    gpkg = GeoPackage(db_path, pool_size=1)
+    try:
+        return gpkg.last_change(layer_name)
+    finally:
+        gpkg.close()
+
+
+def get_density_grid(db_path: str, layer_name: str, bbox: Tuple[float, float, float, float],
+                     version: Optional[str] = None, neighbours: Sequence[str] = ()) -> DensityGrid:
+    """
+    Density levels of a layer over a bbox, from the on-disk cache when current.
+
+    Cache files sit next to the GeoPackage, named by a data key (the
+    layer's last change and the kernel settings) and a bbox key. On
+    rebuild, files of the layer with another data key are removed; grids
+    of other bboxes for the same data stay. Features of `neighbours` inside
+    the bbox are included, and their layer versions are part of the data key.
+    """
+    if version is None:
+        version = layer_version(db_path, layer_name)
+    if neighbours:
+        version = repr([version] + [(path, layer_version(path, layer_name)) for path in neighbours])
+    data_key = hashlib.sha1(repr((version, settings.density_cell_m, settings.density_bandwidth_m,
+                                  settings.density_max_cells)).encode()).hexdigest()[:16]
+    bbox_key = hashlib.sha1(repr(bbox).encode()).hexdigest()[:16]
+    directory = sidecar_dir(db_path, settings.density_cache_dir)
+    path = os.path.join(directory, f"{layer_name}-{data_key}-{bbox_key}.npz")
+    if os.path.exists(path):
+        try:
+            return DensityGrid.load(path)
+        except Exception as e:
+            logger.warning(f"Could not load density grid {path}: {str(e)}")
+
+    lng, lat, weights = layer_points(db_path, layer_name, neighbours, bbox)
+    density = kernel_density(lng, lat, weights, bbox, settings.density_cell_m, settings.density_bandwidth_m)
+    grid = DensityGrid(bbox, density_levels(density))
+
+    os.makedirs(directory, exist_ok=True)
+    for name in os.listdir(directory):
+        match = CACHE_NAME.fullmatch(name[len(layer_name) + 1:]) if name.startswith(f"{layer_name}-") else None
+        if match is not None and match.group(1) != data_key:
+            try:
+                os.remove(os.path.join(directory, name))
+            except FileNotFoundError:
+                pass  # Removed by a concurrent rebuild
+    grid.save(path)
+    logger.info(f"Built {grid.levels.shape[1]}x{grid.levels.shape[0]} density grid of '{layer_name}' "
+                f"from {len(lng)} features")
+    return grid
+
+
+def density_parameters() -> Dict[str, str]:
+    """Scale parameters derived from a source layer, with their layer"""
+    return {
+        param_id: config['source_layer']
+        for param_id, config in RESTAURANT_PARAMETERS.items()
+        if config['type'] == 'scale' and config.get('source_layer')
+    }
+
+
+def compute_density_columns(longitude: np.ndarray, latitude: np.ndarray, db_path: str,
+                            neighbours: Sequence[str] = ()) -> Dict[str, np.ndarray]:
+    """
+    Derive scale parameters (1-10) from the kernel density of their source
+    layers, counting features of the `neighbours` GeoPackages near the candidates
+    """
+    if len(longitude) == 0:
+        return {}
+    bbox = density_extent(longitude, latitude)
+    columns = {}
+    for param_id, layer_name in density_parameters().items():
+        try:
+            grid = get_density_grid(db_path, layer_name, bbox, neighbours=neighbours)
+        except Exception as e:
+            logger.warning(f"Cannot derive '{param_id}' from layer '{layer_name}': {str(e)}")
+            continue
+        columns[param_id] = grid.lookup(longitude, latitude)
+        logger.info(f"Derived '{param_id}' from the density of '{layer_name}'")
+    return columns
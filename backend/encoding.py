@@ -0,0 +1,199 @@
+"""
+Response encoding, compression and validators for Monasib backend
+"""
+import gzip
+import json
+import hashlib
+from typing import Any, Callable, Dict, Optional, Set
+
+from fastapi import Request
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import Response
+
+from config import settings
+from cache import TTLCache
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - optional dependency
+    brotli = None
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover - optional dependency
+    msgpack = None
+
+try:
+    import pyarrow as pa
+    import pyarrow.ipc as ipc
+except ImportError:  # pragma: no cover - optional dependency
+    pa = None
+    ipc = None
+
+
+JSON = "application/json"
+MSGPACK = "application/msgpack"
+ARROW_STREAM = "application/vnd.apache.arrow.stream"
+
+VARY = "Accept, Accept-Encoding"
+
+
+def make_etag(*parts: Any) -> str:
+    """Strong validator derived from everything that determines a response"""
+    digest = hashlib.sha1(json.dumps(parts, sort_keys=True, default=str).encode()).hexdigest()
+    return f'"{digest[:20]}"'
+
+
+def not_modified(if_none_match: Optional[str], etag: str) -> bool:
+    """Whether an If-None-Match header matches the current ETag"""
+    if not if_none_match:
+        return False
+    candidates = {tag.strip()[2:] if tag.strip().startswith("W/") else tag.strip()
+                  for tag in if_none_match.split(",")}
+    return "*" in candidates or etag in candidates
+
+
+def _quality(param: str) -> Optional[float]:
+    """The q-value of one media range parameter; a malformed q counts as 1"""
+    name, _, value = param.replace(" ", "").partition("=")
+    if name.lower() != "q":
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        return 1.0
+
+
+def _accepted(header: Optional[str]) -> Set[str]:
+    """Tokens of an Accept or Accept-Encoding header that are not refused with q=0"""
+    accepted = set()
+    for item in (header or "").split(","):
+        token, *params = item.split(";")
+        if any(_quality(param) == 0 for param in params):
+            continue
+        if token.strip():
+            accepted.add(token.strip().lower())
+    return accepted
+
+
+def choose_encoding(accept_encoding: Optional[str]) -> str:
+    """Content coding to send: brotli when available, then gzip"""
+    accepted = _accepted(accept_encoding)
+    if brotli is not None and "br" in accepted:
+        return "br"
+    if "gzip" in accepted:
+        return "gzip"
+    return "identity"
+
+
+def choose_format(accept: Optional[str]) -> str:
+    """Media type of the body, falling back to JSON when a codec is not installed"""
+    accepted = _accepted(accept)
+    if pa is not None and ARROW_STREAM in accepted:
+        return ARROW_STREAM
+    if msgpack is not None and (MSGPACK in accepted or "application/x-msgpack" in accepted):
+        return MSGPACK
+    return JSON
+
+
+def dump_json(content: Any) -> bytes:
+    """JSON as JSONResponse renders it"""
+    return json.dumps(jsonable_encoder(content), ensure_ascii=False, allow_nan=False,
+                      separators=(",", ":")).encode("utf-8")
+
+
+def dump_msgpack(content: Any) -> bytes:
+    return msgpack.packb(jsonable_encoder(content))
+
+
+def dump_arrow(columns: Dict[str, Any], metadata: Dict[str, Any]) -> bytes:
+    """One Arrow IPC stream with the given columns; metadata values are stored as JSON"""
+    table = pa.table({name: pa.array(values) for name, values in columns.items()})
+    table = table.replace_schema_metadata({key: dump_json(value) for key, value in metadata.items()})
+    sink = pa.BufferOutputStream()
+    with ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+def dump_content(content: Dict[str, Any], media_type: str, records: Optional[str] = None) -> bytes:
+    """Render a response dict; Arrow gets the `records` list as the table and the rest as metadata"""
+    if media_type == ARROW_STREAM:
+        metadata = {key: value for key, value in content.items() if key != records}
+        return dump_arrow(record_columns(content[records]), metadata)
+    if media_type == MSGPACK:
+        return dump_msgpack(content)
+    return dump_json(content)
+
+
+def record_columns(records: list) -> Dict[str, Any]:
+    """Column lists from records, flattening nested dicts to parent.child names"""
+    columns: Dict[str, list] = {}
+    for i, record in enumerate(records):
+        flat = {}
+        for key, value in record.items():
+            if isinstance(value, dict):
+                flat.update({f"{key}.{k}": v for k, v in value.items()})
+            else:
+                flat[key] = value
+        for key, value in flat.items():
+            columns.setdefault(key, [None] * i).append(value)
+        for key in columns.keys() - flat.keys():
+            columns[key].append(None)
+    return columns
+
+
+class EncodedPayload:
+    """A response body together with its compressed variants, built once"""
+
+    def __init__(self, body: bytes, media_type: str):
+        self.media_type = media_type
+        self.variants = {"identity": body}
+        if len(body) >= settings.compression_min_bytes:
+            self.variants["gzip"] = gzip.compress(body, compresslevel=settings.gzip_level, mtime=0)
+            if brotli is not None:
+                self.variants["br"] = brotli.compress(body, quality=settings.brotli_quality)
+
+    @property
+    def nbytes(self) -> int:
+        return sum(len(body) for body in self.variants.values())
+
+
+# Encoded bodies keyed by ETag and media type
+payload_cache = TTLCache(
+    ttl=settings.cache_ttl,
+    max_bytes=settings.response_cache_max_memory_mb * 1024 * 1024
+)
+
+
+def not_modified_response(etag: str) -> Response:
+    return Response(status_code=304, headers={"ETag": etag, "Vary": VARY})
+
+
+def encoded_response(request: Request, etag: str, media_type: str, render: Callable[[], bytes],
+                     headers: Optional[Dict[str, str]] = None) -> Response:
+    """
+    Answer with a cached, pre-compressed body for this ETag.
+
+    Returns 304 when the client already holds this version; otherwise
+    the body is rendered and compressed on the first request only.
+    """
+    if not_modified(request.headers.get("if-none-match"), etag):
+        return not_modified_response(etag)
+
+    def build() -> EncodedPayload:
+        return EncodedPayload(render(), media_type)
+
+    if settings.cache_enabled:
+        payload = payload_cache.get_or_compute((etag, media_type), build, size_of=lambda p: p.nbytes)
+    else:
+        payload = build()
+
+    encoding = choose_encoding(request.headers.get("accept-encoding"))
+    body = payload.variants.get(encoding)
+    response_headers = {"ETag": etag, "Vary": VARY, **(headers or {})}
+    if body is None:
+        body = payload.variants["identity"]
+    elif encoding != "identity":
+        response_headers["Content-Encoding"] = encoding
+    return Response(content=body, media_type=payload.media_type, headers=response_headers)
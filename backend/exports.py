@@ -0,0 +1,189 @@
+"""
+Background exports of stored analysis rankings for Monasib backend
+"""
+import os
+import json
+import uuid
+import shutil
+import zipfile
+import tempfile
+import warnings
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+import pyogrio
+from typing import Any, Dict, Iterator, Optional
+
+from config import settings
+from logger import logger
+from feature_store import CandidateStore
+from analysis import AnalysisResult
+from jobs import Job, JobCancelled, JobManager
+
+
+# Format: (file extension, media type)
+EXPORT_FORMATS = {
+    "geojson": (".geojson", "application/geo+json"),
+    "csv": (".csv", "text/csv"),
+    "gpkg": (".gpkg", "application/geopackage+sqlite3"),
+    "shapefile": (".zip", "application/zip")
+}
+
+
+def shapefile_names(names) -> Dict[str, str]:
+    """Unique DBF field names of at most 10 characters"""
+    mapping, used = {}, set()
+    for name in names:
+        short = name[:10]
+        suffix = 1
+        while short in used:
+            tail = str(suffix)
+            short = name[:10 - len(tail)] + tail
+            suffix += 1
+        used.add(short)
+        mapping[name] = short
+    return mapping
+
+
+class ExportJob(Job):
+    """Writes the ranked locations of one analysis to a file, chunk by chunk"""
+
+    def __init__(self, job_id: str, result: AnalysisResult, store: CandidateStore, format: str,
+                 limit: Optional[int] = None):
+        super().__init__(job_id)
+        self.result = result
+        self.store = store
+        self.format = format
+        self.total = min(limit or result.scored_count, result.scored_count)
+        self.processed = 0
+        extension, self.media_type = EXPORT_FORMATS[format]
+        self.filename = f"analysis_{result.analysis_id}{extension}"
+        self.path = os.path.join(settings.export_dir, f"{job_id}{extension}")
+        self.tmp_path = os.path.join(settings.export_dir, f"{job_id}.tmp{extension}")
+
+    def chunks(self) -> Iterator[pd.DataFrame]:
+        """Ranked locations in rank order, export_chunk_size rows at a time"""
+        ranked = self.result.ranked(self.total)
+        # An empty ranking still yields one empty chunk so every format gets its schema
+        for start in range(0, max(self.total, 1), settings.export_chunk_size):
+            if self._cancel.is_set():
+                raise JobCancelled()
+            index = ranked[start:start + settings.export_chunk_size]
+            yield pd.DataFrame({
+                "rank": np.arange(start + 1, start + len(index) + 1),
+                "id": self.store.ids[index].astype(np.int64),
+                "latitude": self.store.latitude[index],
+                "longitude": self.store.longitude[index],
+                "suitability_score": np.round(self.result.scores[index].astype(np.float64), 2),
+                **{param_id: values[index] for param_id, values in self.store.columns.items()}
+            })
+            self._update(processed=start + len(index))
+
+    def _geodataframe(self, frame: pd.DataFrame) -> gpd.GeoDataFrame:
+        return gpd.GeoDataFrame(frame, geometry=gpd.points_from_xy(frame["longitude"], frame["latitude"]),
+                                crs="EPSG:4326")
+
+    def write_csv(self, path: str):
+        with open(path, "w", newline="") as f:
+            for i, frame in enumerate(self.chunks()):
+                frame.to_csv(f, header=i == 0, index=False)
+
+    def write_geojson(self, path: str):
+        with open(path, "w") as f:
+            f.write('{"type": "FeatureCollection", "features": [\n')
+            first = True
+            for frame in self.chunks():
+                properties = frame.drop(columns=["latitude", "longitude"]).to_dict("records")
+                lines = [
+                    f'{{"type": "Feature", "properties": {json.dumps(props)}, '
+                    f'"geometry": {{"type": "Point", "coordinates": [{lng!r}, {lat!r}]}}}}'
+                    for props, lng, lat in zip(properties, frame["longitude"].tolist(), frame["latitude"].tolist())
+                ]
+                if lines:
+                    f.write(("" if first else ",\n") + ",\n".join(lines))
+                    first = False
+            f.write("\n]}\n")
+
+    def _write_layers(self, path: str, driver: str, columns: Optional[Dict[str, str]] = None, **options):
+        """Append each chunk to a single OGR layer, creating it with the first"""
+        created = False
+        for frame in self.chunks():
+            gdf = self._geodataframe(frame.rename(columns=columns or {}))
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore", RuntimeWarning)
+                pyogrio.write_dataframe(gdf, path, layer="analysis_results", driver=driver,
+                                        append=created, **({} if created else options))
+            created = True
+
+    def write_gpkg(self, path: str):
+        self._write_layers(path, "GPKG", layer_options={"SPATIAL_INDEX": "YES"})
+
+    def write_shapefile(self, path: str):
+        names = ["rank", "id", "latitude", "longitude", "suitability_score", *self.store.columns]
+        directory = tempfile.mkdtemp(dir=settings.export_dir)
+        try:
+            self._write_layers(os.path.join(directory, "analysis_results.shp"), "ESRI Shapefile",
+                               columns=shapefile_names(names))
+            with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as archive:
+                for name in sorted(os.listdir(directory)):
+                    archive.write(os.path.join(directory, name), name)
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
+
+    def run(self):
+        """Write the export to a temporary file and move it into place when complete"""
+        if not self._start():
+            return
+        os.makedirs(settings.export_dir, exist_ok=True)
+        try:
+            getattr(self, f"write_{self.format}")(self.tmp_path)
+            os.replace(self.tmp_path, self.path)
+            with self._lock:
+                self._finish("completed")
+            logger.info(f"Export {self.job_id} of analysis {self.result.analysis_id} written to {self.path}")
+        except JobCancelled:
+            with self._lock:
+                self._finish("cancelled")
+            logger.info(f"Export {self.job_id} cancelled after {self.processed} locations")
+        except Exception as e:
+            logger.error(f"Export {self.job_id} failed: {str(e)}")
+            with self._lock:
+                self._finish("failed", error=str(e))
+        finally:
+            self.result = None  # Do not keep the scores alive with the finished job
+            if os.path.exists(self.tmp_path):
+                os.remove(self.tmp_path)
+
+    def discard(self):
+        """Delete the exported file"""
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "export_id": self.job_id,
+                "status": self.status,
+                "format": self.format,
+                "progress": round(self.processed / self.total, 4) if self.total else 1.0,
+                "processed": self.processed,
+                "total": self.total,
+                "filename": self.filename,
+                "error": self.error,
+                "created_at": self.created_at
+            }
+
+
+export_manager = JobManager(
+    workers=settings.export_workers,
+    max_pending=settings.export_queue_size,
+    retention=settings.export_retention
+)
+
+
+def submit_export(result: AnalysisResult, store: CandidateStore, format: str,
+                  limit: Optional[int] = None) -> ExportJob:
+    """Queue an export of an analysis ranking"""
+    if format not in EXPORT_FORMATS:
+        raise ValueError(f"format must be one of {', '.join(EXPORT_FORMATS)}")
+    return export_manager.enqueue(ExportJob(uuid.uuid4().hex, result, store, format, limit))
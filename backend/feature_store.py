@@ -0,0 +1,247 @@
+"""
+Columnar candidate feature store for Monasib backend
+"""
+import os
+import threading
+import numpy as np
+from typing import Dict, Any, List, Optional, Sequence, Tuple
+
+from config import settings
+from logger import logger
+from parameters import RESTAURANT_PARAMETERS
+from spatial import compute_distance_columns
+from density import compute_density_columns
+from columnar import load_arrays, save_arrays
+from files import atomic_path
+
+
+# Compact storage types per parameter kind
+PARAMETER_DTYPES = {
+    'distance': np.float32,  # meters
+    'scale': np.uint8        # 1-10 levels
+}
+
+
+def _random_columns(rng: np.random.Generator, count: int) -> Dict[str, np.ndarray]:
+    """Seeded parameter values for candidates without real data"""
+    columns = {}
+    for param_id, param_config in RESTAURANT_PARAMETERS.items():
+        dtype = PARAMETER_DTYPES[param_config['type']]
+        if param_config['type'] == 'distance':
+            columns[param_id] = rng.integers(50, 2000, count, endpoint=True).astype(dtype)
+        else:
+            columns[param_id] = rng.integers(1, 10, count, endpoint=True).astype(dtype)
+    return columns
+
+
+class CandidateStore:
+    """Analysis candidates held as one typed array per attribute"""
+
+    def __init__(self, ids, latitude, longitude, columns: Dict[str, np.ndarray], seed: Optional[int] = None,
+                 distance_source_mtime: Optional[float] = None, dataset: Optional[str] = None):
+        self.ids = ids
+        self.latitude = latitude
+        self.longitude = longitude
+        self.columns = columns
+        self.seed = seed
+        # GeoPackage mtime the distance columns were derived from
+        self.distance_source_mtime = distance_source_mtime
+        # Version of a store assembled from other stores
+        self.dataset = dataset
+
+    @classmethod
+    def generate(cls, center_lat: float, center_lng: float, count: int, seed: int) -> "CandidateStore":
+        """Generate reproducible candidates within ~5km of the center"""
+        rng = np.random.default_rng(seed)
+        latitude = center_lat + rng.uniform(-0.045, 0.045, count)
+        longitude = center_lng + rng.uniform(-0.06, 0.06, count)
+        columns = _random_columns(rng, count)
+
+        ids = np.arange(1, count + 1, dtype=np.uint32)
+        return cls(ids, latitude, longitude, columns, seed=seed)
+
+    @classmethod
+    def from_points(cls, ids, latitude, longitude, seed: int) -> "CandidateStore":
+        """Candidates at given coordinates, with seeded values until derived from layers"""
+        columns = _random_columns(np.random.default_rng(seed), len(ids))
+        return cls(ids, latitude, longitude, columns, seed=seed)
+
+    @classmethod
+    def concat(cls, stores: List["CandidateStore"], dataset: str) -> "CandidateStore":
+        """One store holding the candidates of several, identified by `dataset`"""
+        if not stores:
+            return cls(np.empty(0, dtype=np.int64), np.empty(0), np.empty(0),
+                       {param_id: np.empty(0, dtype=PARAMETER_DTYPES[config['type']])
+                        for param_id, config in RESTAURANT_PARAMETERS.items()}, dataset=dataset)
+        return cls(
+            np.concatenate([store.ids.astype(np.int64) for store in stores]),
+            np.concatenate([store.latitude for store in stores]),
+            np.concatenate([store.longitude for store in stores]),
+            {param_id: np.concatenate([store.columns[param_id] for store in stores])
+             for param_id in RESTAURANT_PARAMETERS},
+            dataset=dataset
+        )
+
+    @classmethod
+    def load(cls, path: str) -> "CandidateStore":
+        """Load a store previously written with save()"""
+        if path.endswith(".arrow"):
+            return cls._load_arrow(path)
+        with np.load(path) as data:
+            columns = {param_id: data[f"param_{param_id}"] for param_id in RESTAURANT_PARAMETERS}
+            seed = int(data['seed']) if 'seed' in data else None
+            mtime = float(data['distance_source_mtime']) if 'distance_source_mtime' in data else None
+            return cls(data['ids'], data['latitude'], data['longitude'], columns, seed=seed,
+                       distance_source_mtime=mtime)
+
+    @classmethod
+    def _load_arrow(cls, path: str) -> "CandidateStore":
+        # Columns are read-only views of the mapped file, shared by every worker
+        arrays, metadata = load_arrays(path)
+        columns = {param_id: arrays[f"param_{param_id}"] for param_id in RESTAURANT_PARAMETERS}
+        seed = int(metadata['seed']) if 'seed' in metadata else None
+        mtime = float(metadata['distance_source_mtime']) if 'distance_source_mtime' in metadata else None
+        return cls(arrays['ids'], arrays['latitude'], arrays['longitude'], columns, seed=seed,
+                   distance_source_mtime=mtime)
+
+    def save(self, path: str):
+        """Write the store to disk as an uncompressed .npz archive, or Arrow IPC for a .arrow path"""
+        if path.endswith(".arrow"):
+            metadata = {}
+            if self.seed is not None:
+                metadata['seed'] = str(self.seed)
+            if self.distance_source_mtime is not None:
+                metadata['distance_source_mtime'] = repr(self.distance_source_mtime)
+            save_arrays(path, {'ids': self.ids, 'latitude': self.latitude, 'longitude': self.longitude,
+                               **{f"param_{param_id}": values for param_id, values in self.columns.items()}},
+                        metadata)
+            return
+        arrays = {f"param_{param_id}": values for param_id, values in self.columns.items()}
+        if self.seed is not None:
+            arrays['seed'] = np.int64(self.seed)
+        if self.distance_source_mtime is not None:
+            arrays['distance_source_mtime'] = np.float64(self.distance_source_mtime)
+        with atomic_path(path) as tmp_path:
+            np.savez(tmp_path, ids=self.ids, latitude=self.latitude, longitude=self.longitude, **arrays)
+
+    def __len__(self):
+        return len(self.ids)
+
+    @property
+    def nbytes(self) -> int:
+        """Memory used by the candidate arrays"""
+        return (self.ids.nbytes + self.latitude.nbytes + self.longitude.nbytes +
+                sum(values.nbytes for values in self.columns.values()))
+
+    @property
+    def version(self) -> str:
+        """Identifies the candidate data, for keying derived results"""
+        if self.dataset is not None:
+            return self.dataset
+        return f"{self.seed}:{len(self)}:{self.distance_source_mtime}"
+
+    def within(self, bbox: Tuple[float, float, float, float]) -> np.ndarray:
+        """Indices of the candidates inside a lon/lat bbox"""
+        return np.flatnonzero((self.longitude >= bbox[0]) & (self.longitude <= bbox[2]) &
+                              (self.latitude >= bbox[1]) & (self.latitude <= bbox[3]))
+
+    def subset(self, index: np.ndarray) -> "CandidateStore":
+        """A copy holding only the candidates at `index`"""
+        return CandidateStore(self.ids[index], self.latitude[index], self.longitude[index],
+                              {param_id: values[index] for param_id, values in self.columns.items()},
+                              seed=self.seed, distance_source_mtime=self.distance_source_mtime)
+
+    def derive_distances(self, db_path: str, neighbours: Sequence[str] = (),
+                         halo: Optional[Tuple[float, float, float, float]] = None) -> bool:
+        """
+        Derive layer-backed columns from the GeoPackage: nearest-feature
+        distances, and scale levels from the density of the source layer.
+
+        Features of the `neighbours` GeoPackages inside the `halo` bbox are
+        included, and a change to any of them derives the columns again.
+        """
+        mtime = max(os.path.getmtime(path) for path in [db_path, *neighbours] if os.path.exists(path))
+        if self.distance_source_mtime == mtime:
+            return False
+
+        distances = compute_distance_columns(self.longitude, self.latitude, db_path, neighbours, halo)
+        for param_id, values in distances.items():
+            self.columns[param_id] = values.astype(PARAMETER_DTYPES['distance'])
+        for param_id, values in compute_density_columns(self.longitude, self.latitude, db_path, neighbours).items():
+            self.columns[param_id] = values.astype(PARAMETER_DTYPES['scale'])
+        self.distance_source_mtime = mtime
+        return True
+
+    def location(self, index: int) -> Dict[str, Any]:
+        """Build the location dict for one candidate"""
+        location_id = int(self.ids[index])
+        return {
+            'id': location_id,
+            'latitude': float(self.latitude[index]),
+            'longitude': float(self.longitude[index]),
+            'address': f"Sample Location {location_id}",
+            'parameters': {param_id: values[index].item() for param_id, values in self.columns.items()}
+        }
+
+
+_store: Optional[CandidateStore] = None
+_store_lock = threading.Lock()
+
+
+def load_candidate_store() -> CandidateStore:
+    """Load the persisted candidate store, generating it on first use"""
+    path = settings.candidate_store_path
+    count = settings.max_analysis_locations
+
+    if os.path.exists(path):
+        try:
+            store = CandidateStore.load(path)
+            if len(store) == count and store.seed == settings.candidate_seed:
+                logger.info(f"Loaded {len(store)} candidates from {path}")
+                refresh_distances(store)
+                return store
+            logger.info("Candidate store settings changed, regenerating")
+        except Exception as e:
+            logger.warning(f"Could not load candidate store {path}: {str(e)}")
+
+    store = CandidateStore.generate(
+        center_lat=settings.default_location_lat,
+        center_lng=settings.default_location_lng,
+        count=count,
+        seed=settings.candidate_seed
+    )
+    refresh_distances(store, save=False)
+    store.save(path)
+    logger.info(f"Generated {len(store)} candidates ({store.nbytes / 1024:.1f} KB) in {path}")
+    return store
+
+
+def refresh_distances(store: CandidateStore, save: bool = True) -> bool:
+    """Re-derive layer-backed columns when the GeoPackage has changed"""
+    if not os.path.exists(settings.database_path):
+        return False
+    try:
+        if not store.derive_distances(settings.database_path):
+            return False
+    except Exception as e:
+        logger.warning(f"Distance precomputation failed: {str(e)}")
+        return False
+
+    if save:
+        store.save(settings.candidate_store_path)
+    return True
+
+
+def candidate_store_loaded() -> Optional[CandidateStore]:
+    """The candidate store if it has been loaded, without loading it"""
+    return _store
+
+
+def get_candidate_store() -> CandidateStore:
+    """Return the process-wide candidate store, loading it if needed"""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = load_candidate_store()
+    return _store
@@ -0,0 +1,27 @@
+"""
+Atomic file writes for Monasib backend
+"""
+import os
+import shutil
+import tempfile
+from contextlib import contextmanager
+from typing import Iterator
+
+
+@contextmanager
+def atomic_path(path: str) -> Iterator[str]:
+    """
+    A temporary path to write `path` to, moved over it when the block succeeds.
+
+    The temporary file sits in a directory of its own next to `path`, so
+    every writer (process or thread) gets a fresh name with the same file
+    name and extension, on the same filesystem. It is removed whether or
+    not the block succeeds.
+    """
+    directory = tempfile.mkdtemp(prefix=f".{os.path.basename(path)}.", dir=os.path.dirname(os.path.abspath(path)))
+    try:
+        tmp_path = os.path.join(directory, os.path.basename(path))
+        yield tmp_path
+        os.replace(tmp_path, path)
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
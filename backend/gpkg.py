@@ -0,0 +1,231 @@
+"""
+Read-only GeoPackage metadata access for Monasib backend
+"""
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from config import settings
+
+
+# gpkg_geometry_columns type names mapped to GeoJSON spelling
+GEOMETRY_TYPE_NAMES = {
+    'GEOMETRY': 'Geometry',
+    'POINT': 'Point',
+    'LINESTRING': 'LineString',
+    'POLYGON': 'Polygon',
+    'MULTIPOINT': 'MultiPoint',
+    'MULTILINESTRING': 'MultiLineString',
+    'MULTIPOLYGON': 'MultiPolygon',
+    'GEOMETRYCOLLECTION': 'GeometryCollection'
+}
+
+
+# Envelope sizes in bytes by the envelope indicator in the blob flags
+ENVELOPE_SIZES = {0: 0, 1: 32, 2: 48, 3: 48, 4: 64}
+
+
+def quote_identifier(name: str) -> str:
+    """Quote an SQLite identifier such as a table or column name"""
+    return '"' + name.replace('"', '""') + '"'
+
+
+def blob_to_wkb(blob: Optional[bytes]) -> Optional[bytes]:
+    """Strip the GeoPackage header from a geometry blob"""
+    if blob is None:
+        return None
+    envelope = (blob[3] >> 1) & 0x07
+    return bytes(blob[8 + ENVELOPE_SIZES.get(envelope, 0):])
+
+
+class FeatureTable:
+    """Schema of a GeoPackage feature table"""
+
+    def __init__(self, name: str, primary_key: str, geometry_column: str, columns: List[str],
+                 rtree: Optional[str]):
+        self.name = name
+        self.primary_key = primary_key
+        self.geometry_column = geometry_column
+        self.columns = columns  # Attribute columns, without key and geometry
+        self.rtree = rtree
+
+
+class GeoPackage:
+    """
+    Pooled read-only SQLite access to a GeoPackage.
+
+    Idle connections are reused across requests and dropped when the
+    file is replaced on disk.
+    """
+
+    def __init__(self, db_path: str, pool_size: Optional[int] = None):
+        self.db_path = db_path
+        self.pool_size = settings.sqlite_pool_size if pool_size is None else pool_size
+        self._idle: List[sqlite3.Connection] = []
+        self._file_id = None
+        self._lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        uri = f"file:{os.path.abspath(self.db_path)}?mode=ro"
+        return sqlite3.connect(uri, uri=True, check_same_thread=False)
+
+    @contextmanager
+    def connection(self) -> Iterator[sqlite3.Connection]:
+        """Borrow a read-only connection from the pool"""
+        stat = os.stat(self.db_path)  # Raises if the GeoPackage is missing
+        file_id = (stat.st_dev, stat.st_ino)
+
+        with self._lock:
+            if file_id != self._file_id:
+                for conn in self._idle:
+                    conn.close()
+                self._idle.clear()
+                self._file_id = file_id
+            conn = self._idle.pop() if self._idle else None
+        if conn is None:
+            conn = self._connect()
+
+        try:
+            yield conn
+        finally:
+            with self._lock:
+                if file_id == self._file_id and len(self._idle) < self.pool_size:
+                    self._idle.append(conn)
+                    conn = None
+            if conn is not None:
+                conn.close()
+
+    def close(self):
+        """Close all idle connections"""
+        with self._lock:
+            for conn in self._idle:
+                conn.close()
+            self._idle.clear()
+
+    def ping(self) -> bool:
+        """Cheap check that the GeoPackage opens and has its system tables"""
+        with self.connection() as conn:
+            return conn.execute("SELECT 1 FROM gpkg_contents LIMIT 1").fetchone() is not None
+
+    def layers(self) -> Dict[str, Dict[str, Any]]:
+        """Describe every feature layer from the GeoPackage system tables"""
+        with self.connection() as conn:
+            rows = conn.execute(
+                """
+                SELECT c.table_name, c.identifier, c.min_x, c.min_y, c.max_x, c.max_y,
+                       c.srs_id, c.last_change, g.column_name, g.geometry_type_name
+                FROM gpkg_contents c
+                LEFT JOIN gpkg_geometry_columns g ON g.table_name = c.table_name
+                WHERE c.data_type = 'features'
+                ORDER BY c.table_name
+                """
+            ).fetchall()
+            counts = self._ogr_feature_counts(conn)
+
+            layers = {}
+            for (table_name, identifier, min_x, min_y, max_x, max_y,
+                 srs_id, last_change, column_name, geometry_type) in rows:
+                feature_count = counts.get(table_name)
+                if feature_count is None:
+                    feature_count = self._count_rows(conn, table_name)
+                layers[table_name] = {
+                    "table_name": table_name,
+                    "identifier": identifier,
+                    "geometry_column": column_name,
+                    "geometry_type": GEOMETRY_TYPE_NAMES.get((geometry_type or '').upper(), geometry_type),
+                    "srs_id": srs_id,
+                    "bounds": [min_x, min_y, max_x, max_y] if min_x is not None else None,
+                    "feature_count": feature_count,
+                    "last_change": last_change
+                }
+            return layers
+
+    def layer(self, table_name: str) -> Optional[Dict[str, Any]]:
+        """Describe a single feature layer, or None if it does not exist"""
+        return self.layers().get(table_name)
+
+    def last_change(self, table_name: str) -> Optional[str]:
+        """Timestamp of the last write to a layer, used as its content version"""
+        with self.connection() as conn:
+            row = conn.execute(
+                "SELECT last_change FROM gpkg_contents WHERE table_name = ?", (table_name,)
+            ).fetchone()
+        return row[0] if row else None
+
+    def feature_table(self, table_name: str) -> Optional[FeatureTable]:
+        """Resolve the schema and spatial index of a feature table"""
+        with self.connection() as conn:
+            row = conn.execute(
+                "SELECT column_name FROM gpkg_geometry_columns WHERE table_name = ?", (table_name,)
+            ).fetchone()
+            if row is None:
+                return None
+            geometry_column = row[0]
+
+            primary_key, columns = None, []
+            for _, name, _, _, _, pk in conn.execute(f"PRAGMA table_info({quote_identifier(table_name)})"):
+                if pk:
+                    primary_key = name
+                elif name != geometry_column:
+                    columns.append(name)
+
+            rtree = f"rtree_{table_name}_{geometry_column}"
+            exists = conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (rtree,)
+            ).fetchone()
+            return FeatureTable(table_name, primary_key or 'rowid', geometry_column, columns,
+                                rtree if exists else None)
+
+    def iter_features(self, table: FeatureTable, columns: Sequence[str],
+                      bbox: Optional[Tuple[float, float, float, float]] = None,
+                      after: Optional[int] = None, limit: Optional[int] = None,
+                      batch_size: int = 1000) -> Iterator[List[tuple]]:
+        """
+        Yield batches of (fid, geometry blob, *columns) rows ordered by fid.
+
+        The bbox filter is answered by the layer's R-tree index when it has
+        one; rows are fetched in batches so memory stays flat.
+        """
+        selected = ", ".join(f"t.{quote_identifier(c)}" for c in columns)
+        sql = (f"SELECT t.{quote_identifier(table.primary_key)}, t.{quote_identifier(table.geometry_column)}"
+               f"{', ' + selected if selected else ''} FROM {quote_identifier(table.name)} t")
+        where, params = [], []
+        if bbox is not None and table.rtree:
+            where.append(f"t.{quote_identifier(table.primary_key)} IN "
+                         f"(SELECT id FROM {quote_identifier(table.rtree)} "
+                         f"WHERE maxx >= ? AND minx <= ? AND maxy >= ? AND miny <= ?)")
+            params.extend([bbox[0], bbox[2], bbox[1], bbox[3]])
+        if after is not None:
+            where.append(f"t.{quote_identifier(table.primary_key)} > ?")
+            params.append(after)
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += f" ORDER BY t.{quote_identifier(table.primary_key)}"
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit)
+
+        with self.connection() as conn:
+            cursor = conn.execute(sql, params)
+            try:
+                while True:
+                    rows = cursor.fetchmany(batch_size)
+                    if not rows:
+                        break
+                    yield rows
+            finally:
+                cursor.close()
+
+    def _ogr_feature_counts(self, conn: sqlite3.Connection) -> Dict[str, int]:
+        """Trigger-maintained feature counts written by GDAL, if present"""
+        try:
+            rows = conn.execute("SELECT table_name, feature_count FROM gpkg_ogr_contents").fetchall()
+        except sqlite3.OperationalError:
+            return {}
+        return {table_name: count for table_name, count in rows if count is not None}
+
+    def _count_rows(self, conn: sqlite3.Connection, table_name: str) -> int:
+        """Fallback row count using the primary key index"""
+        return conn.execute(f"SELECT COUNT(*) FROM {quote_identifier(table_name)}").fetchone()[0]
@@ -0,0 +1,474 @@
+"""
+Streaming ingestion of uploaded layers into the GeoPackage for Monasib backend
+"""
+import io
+import os
+import re
+import csv
+import json
+import shutil
+import tempfile
+import threading
+import warnings
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+import pyogrio
+import shapely
+from shapely.geometry import shape, Point, LineString, Polygon, MultiLineString, GeometryCollection
+from xml.etree.ElementTree import iterparse
+from typing import Any, BinaryIO, Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from config import settings
+from logger import logger
+
+
+# One (properties, geometry) pair per parsed feature; geometry may be None
+Record = Tuple[Dict[str, Any], Any]
+
+LAYER_NAME = re.compile(r"^[A-Za-z_][A-Za-z0-9_]{0,62}$")
+RESERVED_PREFIXES = ("gpkg_", "rtree_", "sqlite_")
+
+READ_SIZE = 1024 * 1024
+FEATURES_ARRAY = re.compile(r'"features"\s*:\s*\[')
+LEGACY_CRS = re.compile(r'"crs"\s*:\s*\{.*?"name"\s*:\s*"([^"]+)"', re.S)
+
+LATITUDE_COLUMNS = ("latitude", "lat", "y")
+LONGITUDE_COLUMNS = ("longitude", "lon", "lng", "long", "x")
+WKT_COLUMNS = ("wkt", "geometry", "geom", "the_geom")
+
+# GPKG accepts one writer at a time
+_write_lock = threading.Lock()
+
+
+def validate_layer_name(layer_name: str):
+    """Raise ValueError unless the name is a safe, non-system table name"""
+    if not LAYER_NAME.match(layer_name) or layer_name.lower().startswith(RESERVED_PREFIXES):
+        raise ValueError(f"Invalid layer name '{layer_name}'")
+
+
+# GeoJSON
+
+def _text(stream: BinaryIO) -> io.TextIOWrapper:
+    return io.TextIOWrapper(stream, encoding="utf-8-sig", newline="")
+
+
+def iter_geojson(stream: BinaryIO, read_size: int = READ_SIZE,
+                 max_value_size: Optional[int] = None) -> Iterator[Dict[str, Any]]:
+    """
+    Yield GeoJSON features one at a time without loading the document.
+
+    Handles a FeatureCollection by decoding its "features" array element
+    by element, and otherwise a sequence of features or geometries
+    (newline-delimited GeoJSON or RFC 8142 text sequences). Only one value
+    is buffered at a time; one larger than `max_value_size` is rejected.
+    """
+    max_value_size = max_value_size or settings.ingest_max_value_size
+    text = _text(stream)
+    decoder = json.JSONDecoder()
+    try:
+        buffer = text.read(read_size)
+        eof = len(buffer) < read_size
+        match = FEATURES_ARRAY.search(buffer)
+        pos = match.end() if match else 0
+        decoded = 0
+
+        while True:
+            # Skip separators between values
+            while True:
+                while pos < len(buffer) and buffer[pos] in " \t\r\n,\x1e":
+                    pos += 1
+                if pos < len(buffer) or eof:
+                    break
+                chunk = text.read(read_size)
+                eof = len(chunk) < read_size
+                buffer, pos = buffer[pos:] + chunk, 0
+
+            if pos >= len(buffer) or (match and buffer[pos] == "]"):
+                return
+            try:
+                value, end = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                if eof:
+                    raise ValueError("Malformed GeoJSON")
+                pending = len(buffer) - pos
+                if pending >= max_value_size:
+                    raise ValueError(f"GeoJSON values larger than {max_value_size} bytes are not supported")
+                # Reads grow with the value, so decoding it again stays linear overall
+                size = max(read_size, pending)
+                chunk = text.read(size)
+                eof = len(chunk) < size
+                buffer, pos = buffer[pos:] + chunk, 0
+                if match is None and not decoded:
+                    # A collection whose "features" member starts past the first read
+                    match = FEATURES_ARRAY.search(buffer, max(0, pending - 64))
+                    if match is not None:
+                        buffer, pos = buffer[match.end():], 0
+                continue
+            pos = end
+            decoded += 1
+
+            if not isinstance(value, dict):
+                yield value  # Skipped by read_geojson
+            elif value.get("type") == "Feature":
+                yield value
+            elif value.get("type") == "FeatureCollection":
+                yield from value.get("features") or []
+            elif "coordinates" in value or "geometries" in value:
+                yield {"type": "Feature", "properties": {}, "geometry": value}
+    finally:
+        text.detach()
+
+
+def geojson_crs(stream: BinaryIO) -> Optional[str]:
+    """CRS named by a legacy "crs" member near the start of the document, if any"""
+    position = stream.tell()
+    head = stream.read(64 * 1024).decode("utf-8", errors="ignore")
+    stream.seek(position)
+    match = LEGACY_CRS.search(head.split('"features"', 1)[0])
+    if match is None or match.group(1).upper().endswith("CRS84"):
+        return None
+    return match.group(1)
+
+
+def read_geojson(stream: BinaryIO) -> Iterator[Record]:
+    for feature in iter_geojson(stream):
+        properties = feature.get("properties") if isinstance(feature, dict) else None
+        if not isinstance(feature, dict) or not isinstance(properties or {}, dict):
+            # Not a feature, or properties that are not an object: skipped like a missing geometry
+            yield {}, None
+        else:
+            yield properties or {}, feature.get("geometry")
+
+
+# CSV
+
+def read_csv(stream: BinaryIO) -> Iterator[Record]:
+    """Rows with either a WKT column or longitude/latitude columns"""
+    text = _text(stream)
+    try:
+        reader = csv.DictReader(text)
+        fields = {name.strip().lower(): name for name in reader.fieldnames or []}
+        wkt = next((fields[name] for name in WKT_COLUMNS if name in fields), None)
+        lat = next((fields[name] for name in LATITUDE_COLUMNS if name in fields), None)
+        lng = next((fields[name] for name in LONGITUDE_COLUMNS if name in fields), None)
+        if wkt is None and (lat is None or lng is None):
+            raise ValueError("CSV needs a WKT column or longitude and latitude columns")
+
+        for row in reader:
+            if wkt is not None:
+                geometry = row.pop(wkt) or None
+            else:
+                try:
+                    geometry = (float(row.pop(lng)), float(row.pop(lat)))
+                except (TypeError, ValueError):
+                    geometry = None
+            yield row, geometry
+    finally:
+        text.detach()
+
+
+# KML and GPX
+
+def _local(tag: str) -> str:
+    return tag.rsplit("}", 1)[-1]
+
+
+def _child(elem, name: str):
+    return next((child for child in elem if _local(child.tag) == name), None)
+
+
+def _child_text(elem, name: str) -> Optional[str]:
+    child = _child(elem, name)
+    return child.text.strip() if child is not None and child.text else None
+
+
+def _kml_coordinates(elem) -> List[Tuple[float, float]]:
+    coordinates = next((e for e in elem.iter() if _local(e.tag) == "coordinates"), None)
+    if coordinates is None or not coordinates.text:
+        return []
+    return [tuple(float(v) for v in point.split(",")[:2]) for point in coordinates.text.split()]
+
+
+def _kml_geometry(elem):
+    name = _local(elem.tag)
+    if name == "Point":
+        coordinates = _kml_coordinates(elem)
+        return Point(coordinates[0]) if coordinates else None
+    if name == "LineString":
+        return LineString(_kml_coordinates(elem))
+    if name == "Polygon":
+        outer = _child(elem, "outerBoundaryIs")
+        holes = [_kml_coordinates(inner) for inner in elem if _local(inner.tag) == "innerBoundaryIs"]
+        return Polygon(_kml_coordinates(outer), holes) if outer is not None else None
+    if name == "MultiGeometry":
+        parts = [part for part in (_kml_geometry(child) for child in elem) if part is not None]
+        return GeometryCollection(parts) if parts else None
+    return None
+
+
+def _iter_elements(stream: BinaryIO, names: Tuple[str, ...]) -> Iterator[Any]:
+    """
+    Yield complete elements with one of the given local names.
+
+    Each yielded element is detached from its parent afterwards, so the
+    parsed tree never grows with the size of the document.
+    """
+    stack = []
+    for event, elem in iterparse(stream, events=("start", "end")):
+        if event == "start":
+            stack.append(elem)
+            continue
+        stack.pop()
+        if _local(elem.tag) in names:
+            yield elem
+            if stack:
+                stack[-1].remove(elem)
+
+
+def read_kml(stream: BinaryIO) -> Iterator[Record]:
+    for placemark in _iter_elements(stream, ("Placemark",)):
+        properties = {"name": _child_text(placemark, "name"), "description": _child_text(placemark, "description")}
+        extended = _child(placemark, "ExtendedData")
+        if extended is not None:
+            for data in extended.iter():
+                if _local(data.tag) == "Data":
+                    properties[data.get("name")] = _child_text(data, "value")
+                elif _local(data.tag) == "SimpleData":
+                    properties[data.get("name")] = data.text
+        geometry = next((g for g in (_kml_geometry(child) for child in placemark) if g is not None), None)
+        yield properties, geometry
+
+
+def _gpx_points(elem, name: str) -> List[Tuple[float, float]]:
+    return [(float(point.get("lon")), float(point.get("lat"))) for point in elem if _local(point.tag) == name]
+
+
+def read_gpx(stream: BinaryIO) -> Iterator[Record]:
+    for elem in _iter_elements(stream, ("wpt", "rte", "trk")):
+        kind = _local(elem.tag)
+        properties = {
+            "name": _child_text(elem, "name"),
+            "description": _child_text(elem, "desc"),
+            "type": _child_text(elem, "type"),
+            "feature_type": {"wpt": "waypoint", "rte": "route", "trk": "track"}[kind]
+        }
+        if kind == "wpt":
+            properties["elevation"] = _child_text(elem, "ele")
+            properties["time"] = _child_text(elem, "time")
+            geometry = Point(float(elem.get("lon")), float(elem.get("lat")))
+        elif kind == "rte":
+            geometry = LineString(_gpx_points(elem, "rtept"))
+        else:
+            segments = [_gpx_points(segment, "trkpt") for segment in elem if _local(segment.tag) == "trkseg"]
+            geometry = MultiLineString([segment for segment in segments if len(segment) > 1])
+        yield properties, geometry
+
+
+READERS = {
+    ".geojson": read_geojson,
+    ".json": read_geojson,
+    ".csv": read_csv,
+    ".kml": read_kml,
+    ".gpx": read_gpx
+}
+
+
+# Writing
+
+def _geometries(raw: List[Any]) -> np.ndarray:
+    """Shapely geometries for a batch; points given as coordinate pairs are built in one call"""
+    geometries = np.empty(len(raw), dtype=object)
+    pairs, pair_index = [], []
+    for i, value in enumerate(raw):
+        try:
+            if value is None:
+                continue
+            if isinstance(value, tuple):
+                pairs.append(value)
+                pair_index.append(i)
+            elif isinstance(value, str):
+                geometries[i] = shapely.from_wkt(value)
+            elif isinstance(value, dict):
+                if value.get("type") == "Point" and len(value.get("coordinates") or ()) >= 2:
+                    pairs.append(tuple(value["coordinates"][:2]))
+                    pair_index.append(i)
+                else:
+                    geometries[i] = shape(value)
+            elif isinstance(value, shapely.Geometry):
+                geometries[i] = value
+        except Exception:
+            geometries[i] = None
+    if pairs:
+        geometries[pair_index] = shapely.points(np.asarray(pairs, dtype=np.float64))
+    return geometries
+
+
+def _conform(frame: pd.DataFrame, schema: Dict[str, str]) -> pd.DataFrame:
+    """Match the columns and types of the target layer"""
+    frame = frame.reindex(columns=list(schema))
+    for column, dtype in schema.items():
+        if dtype.startswith(("int", "float")):
+            frame[column] = pd.to_numeric(frame[column], errors="coerce")
+        elif dtype == "object":
+            values = frame[column]
+            frame[column] = values.where(values.isna(), values.astype(str))
+    return frame
+
+
+def _properties(records: List[Dict[str, Any]]) -> pd.DataFrame:
+    frame = pd.DataFrame.from_records(records)
+    for column in frame.columns:
+        if frame[column].dtype == object and frame[column].map(lambda v: isinstance(v, (dict, list))).any():
+            # Nested values are stored as JSON text
+            frame[column] = frame[column].map(lambda v: json.dumps(v) if isinstance(v, (dict, list)) else v)
+    return frame
+
+
+class LayerWriter:
+    """Writes batches to one GeoPackage layer, creating it with a spatial index on the first write"""
+
+    def __init__(self, db_path: str, layer_name: str, mode: str = "append"):
+        self.db_path = db_path
+        self.layer_name = layer_name
+        self.schema: Optional[Dict[str, str]] = None
+        self.written = 0
+        self.batches = 0
+        if mode == "append":
+            try:
+                info = pyogrio.read_info(db_path, layer=layer_name)
+                self.schema = dict(zip(info["fields"], (str(dtype) for dtype in info["dtypes"])))
+            except Exception:
+                self.schema = None  # New layer or new database
+
+    def write(self, gdf: gpd.GeoDataFrame):
+        """Append a batch in EPSG:4326, conforming it to the layer schema; the first write replaces the layer"""
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", RuntimeWarning)  # Mixed geometry types in one layer
+            if self.schema is None:
+                types = set(gdf.geom_type)
+                pyogrio.write_dataframe(gdf, self.db_path, layer=self.layer_name, driver="GPKG",
+                                        geometry_type=types.pop() if len(types) == 1 else "Unknown",
+                                        layer_options={"SPATIAL_INDEX": "YES"})
+                self.schema = {column: str(dtype) for column, dtype in gdf.drop(columns="geometry").dtypes.items()}
+            else:
+                frame = _conform(pd.DataFrame(gdf.drop(columns="geometry")), self.schema)
+                gdf = gpd.GeoDataFrame(frame, geometry=gdf.geometry.values, crs=gdf.crs)
+                pyogrio.write_dataframe(gdf, self.db_path, layer=self.layer_name, driver="GPKG", append=True)
+        self.written += len(gdf)
+        self.batches += 1
+
+
+def copy_layer(source: str, db_path: str, layer_name: str, batch_size: int):
+    """Replace a layer with the same layer of another GeoPackage, batch by batch"""
+    writer = LayerWriter(db_path, layer_name, "replace")
+    total = pyogrio.read_info(source, layer=layer_name)["features"]
+    for start in range(0, total, batch_size):
+        writer.write(pyogrio.read_dataframe(source, layer=layer_name, skip_features=start, max_features=batch_size))
+
+
+def ingest_stream(stream: BinaryIO, extension: str, db_path: str, layer_name: str,
+                  mode: str = "append", source_crs: Optional[str] = None,
+                  batch_size: Optional[int] = None) -> Dict[str, Any]:
+    """
+    Parse an upload incrementally and write it to a GeoPackage layer in batches.
+
+    Each batch is reprojected to EPSG:4326 and appended in its own
+    transaction, so memory stays bounded by the batch size. The layer is
+    created with a spatial index, or replaced when mode is "replace" once
+    the whole upload has parsed.
+    """
+    def route(gdf: gpd.GeoDataFrame) -> Iterator[Tuple[str, gpd.GeoDataFrame]]:
+        yield db_path, gdf
+
+    return ingest_routed(stream, extension, layer_name, route, mode, source_crs, batch_size)
+
+
+def ingest_routed(stream: BinaryIO, extension: str, layer_name: str,
+                  route: Callable[[gpd.GeoDataFrame], Iterable[Tuple[str, gpd.GeoDataFrame]]],
+                  mode: str = "append", source_crs: Optional[str] = None,
+                  batch_size: Optional[int] = None, replace_in: Sequence[str] = ()) -> Dict[str, Any]:
+    """
+    Ingest an upload whose batches `route` splits into (db_path, frame) parts.
+
+    Every GeoPackage gets its own writer. With mode "replace", batches are
+    staged and no layer changes unless the whole upload parses; the layer
+    is then also emptied in the `replace_in` databases that received no
+    features.
+    """
+    validate_layer_name(layer_name)
+    reader = READERS.get(extension.lower())
+    if reader is None:
+        raise ValueError(f"Unsupported file type '{extension}'")
+    if mode not in ("append", "replace"):
+        raise ValueError("mode must be 'append' or 'replace'")
+    if extension.lower() in (".geojson", ".json") and source_crs is None:
+        source_crs = geojson_crs(stream)
+    source_crs = source_crs or "EPSG:4326"
+    batch_size = batch_size or settings.ingest_batch_size
+
+    with _write_lock:
+        writers: Dict[str, LayerWriter] = {}
+        # Replacements are written to a staging GeoPackage per database until the whole upload has parsed
+        staged: Dict[str, str] = {}
+        skipped = 0
+        properties: List[Dict[str, Any]] = []
+        geometries: List[Any] = []
+
+        def writer_for(path: str) -> LayerWriter:
+            writer = writers.get(path)
+            if writer is None:
+                target = path
+                if mode == "replace":
+                    directory = tempfile.mkdtemp(prefix=".ingest-", dir=os.path.dirname(os.path.abspath(path)))
+                    target = staged[path] = os.path.join(directory, "staged.gpkg")
+                writer = writers[path] = LayerWriter(target, layer_name, mode)
+            return writer
+
+        def flush():
+            nonlocal skipped
+            geometry = _geometries(geometries)
+            valid = ~(shapely.is_missing(geometry) | shapely.is_empty(geometry))
+            skipped += int((~valid).sum())
+            if valid.any():
+                frame = _properties(properties)[valid] if properties else pd.DataFrame(index=range(len(geometry)))[valid]
+                gdf = gpd.GeoDataFrame(frame.reset_index(drop=True), geometry=geometry[valid], crs=source_crs)
+                if gdf.crs.to_epsg() != 4326:
+                    gdf = gdf.to_crs("EPSG:4326")
+                for path, part in route(gdf):
+                    writer_for(path).write(part)
+            properties.clear()
+            geometries.clear()
+
+        try:
+            for record_properties, record_geometry in reader(stream):
+                properties.append(record_properties)
+                geometries.append(record_geometry)
+                if len(geometries) >= batch_size:
+                    flush()
+            if geometries:
+                flush()
+
+            if mode == "replace" and not writers:
+                # Keep the current features rather than replacing them with nothing
+                raise ValueError(f"No valid features to replace '{layer_name}' with ({skipped} skipped)")
+            if mode == "replace":
+                # The upload parsed completely: only now are the old features replaced
+                for path, source in staged.items():
+                    copy_layer(source, path, layer_name, batch_size)
+                # An empty frame with the new schema stands in for the old features
+                template = next(iter(writers.values()))
+                empty = gpd.GeoDataFrame({column: pd.Series(dtype=dtype) for column, dtype in template.schema.items()},
+                                         geometry=gpd.GeoSeries([], crs="EPSG:4326"))
+                for path in replace_in:
+                    if path not in writers:
+                        LayerWriter(path, layer_name, mode).write(empty)
+        finally:
+            for source in staged.values():
+                shutil.rmtree(os.path.dirname(source), ignore_errors=True)
+
+    written = sum(writer.written for writer in writers.values())
+    batches = sum(writer.batches for writer in writers.values())
+    logger.info(f"Ingested {written} features into '{layer_name}' in {batches} batches ({skipped} skipped)")
+    return {"layer": layer_name, "features_written": written, "features_skipped": skipped,
+            "batches": batches, "source_crs": source_crs}
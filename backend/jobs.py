@@ -0,0 +1,255 @@
+"""
+Background analysis jobs with progress reporting for Monasib backend
+"""
+import json
+import time
+import uuid
+import asyncio
+import threading
+import numpy as np
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, AsyncIterator, Dict, Optional
+
+from config import settings
+from logger import logger
+from feature_store import CandidateStore
+from ranking import ScoreAccumulator
+from scoring import score_candidates
+from analysis import analysis_key, describe_location, result_cache, summarize_analysis
+
+
+FINISHED = ("completed", "failed", "cancelled")
+
+
+class JobCancelled(Exception):
+    """Raised inside a job when cancellation was requested"""
+
+
+class Job(ABC):
+    """State shared by background jobs: status, cancellation and change revisions"""
+
+    def __init__(self, job_id: str):
+        self.job_id = job_id
+        self.status = "queued"
+        self.error: Optional[str] = None
+        self.created_at = datetime.utcnow().isoformat()
+        self.finished_at: Optional[float] = None
+        # Bumped on every change so progress streams know when to send an event
+        self.revision = 0
+        self._cancel = threading.Event()
+        self._lock = threading.Lock()
+
+    def cancel(self) -> bool:
+        """Request cancellation; returns False if the job already finished"""
+        with self._lock:
+            if self.status in FINISHED:
+                return False
+            self._cancel.set()
+            if self.status == "queued":
+                self._finish("cancelled")
+            return True
+
+    def _start(self) -> bool:
+        """Mark the job running unless it was cancelled while queued"""
+        with self._lock:
+            if self._cancel.is_set():
+                return False
+            self.status = "running"
+            self.revision += 1
+            return True
+
+    def _update(self, **changes):
+        with self._lock:
+            for name, value in changes.items():
+                setattr(self, name, value)
+            self.revision += 1
+
+    def _finish(self, status: str, **changes):
+        for name, value in changes.items():
+            setattr(self, name, value)
+        self.status = status
+        self.finished_at = time.monotonic()
+        self.revision += 1
+
+    @abstractmethod
+    def run(self):
+        """Do the work on a worker thread, honouring cancellation"""
+
+    def discard(self):
+        """Release anything the job left behind once it is forgotten"""
+
+    @abstractmethod
+    def snapshot(self) -> Dict[str, Any]:
+        """Status of the job as returned by the API"""
+
+
+class AnalysisJob(Job):
+    """State of one queued or running analysis"""
+
+    def __init__(self, job_id: str, store: CandidateStore, criteria: Dict[str, Any]):
+        super().__init__(job_id)
+        self.store = store
+        self.criteria = criteria
+        self.processed = 0
+        self.total = len(store)
+        self.top_locations = []
+        self.analysis_id: Optional[str] = None
+
+    def run(self):
+        """Score the candidates chunk by chunk, publishing progress between chunks"""
+        if not self._start():
+            return
+
+        try:
+            scores = np.empty(self.total, dtype=np.float64)
+            accumulator = ScoreAccumulator(10)
+            chunk_size = settings.scoring_chunk_size
+            for start in range(0, self.total, chunk_size):
+                if self._cancel.is_set():
+                    raise JobCancelled()
+                stop = min(start + chunk_size, self.total)
+                columns = {param_id: values[start:stop] for param_id, values in self.store.columns.items()}
+                scores[start:stop] = score_candidates(columns, self.criteria)
+                accumulator.add(scores[start:stop], offset=start)
+                self._update(processed=stop, top_locations=[
+                    describe_location(self.store, i, score)
+                    for i, score in zip(accumulator.top_index, accumulator.top_scores)
+                ])
+
+            analysis_id = analysis_key(self.criteria, self.store.version)
+            result = summarize_analysis(self.store, self.criteria, analysis_id, scores, accumulator)
+            if settings.cache_enabled:
+                result_cache.set(analysis_id, result, size=result.nbytes)
+            with self._lock:
+                self._finish("completed", analysis_id=analysis_id)
+            logger.info(f"Job {self.job_id} completed as analysis {analysis_id}")
+
+        except JobCancelled:
+            with self._lock:
+                self._finish("cancelled")
+            logger.info(f"Job {self.job_id} cancelled after {self.processed} candidates")
+        except Exception as e:
+            logger.error(f"Job {self.job_id} failed: {str(e)}")
+            with self._lock:
+                self._finish("failed", error=str(e))
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Current state as returned by the API"""
+        with self._lock:
+            return {
+                "job_id": self.job_id,
+                "status": self.status,
+                "progress": round(self.processed / self.total, 4) if self.total else 1.0,
+                "processed": self.processed,
+                "total": self.total,
+                "top_locations": self.top_locations,
+                "analysis_id": self.analysis_id,
+                "error": self.error,
+                "created_at": self.created_at
+            }
+
+
+class JobQueueFull(Exception):
+    """Raised when too many jobs are waiting"""
+
+
+class JobManager:
+    """
+    Bounded executor for background jobs.
+
+    Finished jobs stay available for job_retention seconds so clients can
+    read their outcome.
+    """
+
+    def __init__(self, workers: int, max_pending: int, retention: float):
+        self.max_pending = max_pending
+        self.retention = retention
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="analysis-job")
+        self._jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def submit(self, store: CandidateStore, criteria: Dict[str, Any]) -> AnalysisJob:
+        """Queue an analysis, raising JobQueueFull when the backlog is at its limit"""
+        return self.enqueue(AnalysisJob(uuid.uuid4().hex, store, criteria))
+
+    def enqueue(self, job: Job) -> Job:
+        """Queue any job, raising JobQueueFull when the backlog is at its limit"""
+        with self._lock:
+            self._prune()
+            pending = sum(1 for queued in self._jobs.values() if queued.status == "queued")
+            if pending >= self.max_pending:
+                raise JobQueueFull(f"{pending} jobs already queued")
+            self._jobs[job.job_id] = job
+        self._executor.submit(job.run)
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def forget(self, job_id: str):
+        """Drop a finished job and whatever it left behind"""
+        with self._lock:
+            job = self._jobs.pop(job_id, None)
+        if job is not None:
+            job.discard()
+
+    def _prune(self):
+        now = time.monotonic()
+        for job_id in [job_id for job_id, job in self._jobs.items()
+                       if job.finished_at is not None and now - job.finished_at > self.retention]:
+            self._jobs.pop(job_id).discard()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            counts = {"queued": 0, "running": 0, "completed": 0, "failed": 0, "cancelled": 0}
+            for job in self._jobs.values():
+                counts[job.status] += 1
+            return counts
+
+    def shutdown(self):
+        """Cancel outstanding jobs and stop the workers"""
+        with self._lock:
+            jobs = list(self._jobs.values())
+        for job in jobs:
+            job.cancel()
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+def format_event(event: str, data: Dict[str, Any]) -> str:
+    """One server-sent event"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+async def job_events(job: Job, poll_interval: float = 0.1, heartbeat: float = 15.0) -> AsyncIterator[str]:
+    """
+    Stream a job's progress as server-sent events until it finishes.
+
+    Runs on the event loop without holding a worker thread; a comment line
+    is sent periodically so idle proxies keep the connection open.
+    """
+    revision = -1
+    last_sent = time.monotonic()
+    while True:
+        if job.revision != revision:
+            revision = job.revision
+            snapshot = job.snapshot()
+            if snapshot["status"] in FINISHED:
+                yield format_event(snapshot["status"], snapshot)
+                return
+            yield format_event("progress", snapshot)
+            last_sent = time.monotonic()
+        elif time.monotonic() - last_sent >= heartbeat:
+            yield ": keep-alive\n\n"
+            last_sent = time.monotonic()
+        await asyncio.sleep(poll_interval)
+
+
+job_manager = JobManager(
+    workers=settings.job_workers,
+    max_pending=settings.job_queue_size,
+    retention=settings.job_retention
+)
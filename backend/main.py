@@ -1,258 +1,96 @@
 import os
-import json
 import random
-import logging
 from contextlib import asynccontextmanager
 from datetime import datetime
-from fastapi import FastAPI, HTTPException, Depends, Request
+from fastapi import FastAPI, HTTPException, Request, Query, File, UploadFile
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import JSONResponse, FileResponse
+from fastapi.responses import JSONResponse, FileResponse, StreamingResponse, Response
 from pydantic import BaseModel
-from typing import Dict, Any, Optional
+from typing import Dict, Any, List, Optional
 import geopandas as gpd
-from shapely.geometry import Polygon, Point
-import numpy as np
 
 # Import custom modules
 from config import settings
 from logger import logger
+from parameters import RESTAURANT_PARAMETERS
+from analysis import AnalysisResult, analysis_key, find_analysis, get_analysis, result_cache, run_batch
+from parallel import shutdown_scorer
+from sessions import close_session, create_session, find_session, sessions
+from jobs import JobQueueFull, job_events, job_manager
+from exports import EXPORT_FORMATS, export_manager, submit_export
+from metrics import CONTENT_TYPE, MetricsMiddleware, registry, stage, wants_prometheus, watch_cache
+from feature_store import CandidateStore, candidate_store_loaded, get_candidate_store, refresh_distances
+from bootstrap import bootstrap_database
+from ingest import ingest_stream, validate_layer_name
+from cache import LayerCache
+from gpkg import GeoPackage
+from streaming import parse_bbox, select_properties, stream_feature_collection
+from tiles import cached_tile, get_tile
+from aggregation import METHODS, aggregate_cache, encode_bins, get_bins
+from encoding import (ARROW_STREAM, VARY, choose_format, dump_arrow, dump_content, encoded_response,
+                      make_etag, not_modified, not_modified_response, payload_cache)
+from surface import SurfaceGrid, compute_surface, default_bbox, encode_grid, encode_png, raster_cache
+from regions import (area_store, area_stores, dataset_store, describe_layers, ingest_partitioned, layer_sources,
+                     layers_version, partition_database, partitions, read_area_layer, render_area_tile,
+                     request_store, resolve_area, stream_area_collection, tile_lonlat_bounds)
 
 
 # Define the request body models
 class CriteriaPayload(BaseModel):
     criteria: Dict[str, Any]
     totalWeight: Optional[int] = 100
+    region: Optional[str] = None
+    bbox: Optional[List[float]] = None
 
-class ReportRequest(BaseModel):
-    analysisResults: Dict[str, Any]
+class ScenarioPayload(BaseModel):
+    name: Optional[str] = None
+    criteria: Dict[str, Any]
 
+class BatchCriteriaPayload(BaseModel):
+    scenarios: List[ScenarioPayload]
+    top_n: Optional[int] = 10
+    region: Optional[str] = None
+    bbox: Optional[List[float]] = None
 
-# Restaurant location analysis parameters
-RESTAURANT_PARAMETERS = {
-    'competitors': {
-        'name': 'Competitors Distance',
-        'type': 'distance',
-        'weight_factor': 0.15,
-        'optimal_range': (300, 800)  # meters
-    },
-    'foot_traffic': {
-        'name': 'Foot Traffic Density', 
-        'type': 'scale',
-        'weight_factor': 0.20,
-        'optimal_range': (6, 10)
-    },
-    'public_transport': {
-        'name': 'Public Transport Access',
-        'type': 'distance', 
-        'weight_factor': 0.12,
-        'optimal_range': (100, 400)  # meters
-    },
-    'parking': {
-        'name': 'Parking Availability',
-        'type': 'scale',
-        'weight_factor': 0.10,
-        'optimal_range': (5, 10)
-    },
-    'rent_cost': {
-        'name': 'Rental Cost',
-        'type': 'scale',
-        'weight_factor': 0.18,
-        'optimal_range': (1, 6),  # Lower is better
-        'inverted': True
-    },
-    'population_density': {
-        'name': 'Population Density',
-        'type': 'scale',
-        'weight_factor': 0.15,
-        'optimal_range': (6, 10)
-    },
-    'office_buildings': {
-        'name': 'Office Buildings Proximity',
-        'type': 'distance',
-        'weight_factor': 0.08,
-        'optimal_range': (200, 1000)  # meters
-    },
-    'shopping_centers': {
-        'name': 'Shopping Centers',
-        'type': 'distance', 
-        'weight_factor': 0.10,
-        'optimal_range': (300, 800)  # meters
-    },
-    'safety_level': {
-        'name': 'Safety Level',
-        'type': 'scale',
-        'weight_factor': 0.07,
-        'optimal_range': (7, 10)
-    },
-    'visibility': {
-        'name': 'Street Visibility',
-        'type': 'scale',
-        'weight_factor': 0.05,
-        'optimal_range': (6, 10)
-    }
-}
-
-
-def generate_sample_locations(center_lat=40.7128, center_lng=-74.0060, count=150):
-    """Generate sample restaurant location candidates around NYC"""
-    locations = []
-    for i in range(count):
-        # Generate random points within ~5km radius of center
-        lat_offset = random.uniform(-0.045, 0.045)  # ~5km latitude
-        lng_offset = random.uniform(-0.06, 0.06)    # ~5km longitude
-        
-        lat = center_lat + lat_offset
-        lng = center_lng + lng_offset
-        
-        # Generate random parameter values for each location
-        location_data = {
-            'id': i + 1,
-            'latitude': lat,
-            'longitude': lng,
-            'address': f"Sample Location {i + 1}",
-            'parameters': {}
-        }
-        
-        # Generate realistic parameter values
-        for param_id, param_config in RESTAURANT_PARAMETERS.items():
-            if param_config['type'] == 'distance':
-                # Distance values in meters
-                value = random.randint(50, 2000)
-            else:
-                # Scale values 1-10
-                value = random.randint(1, 10)
-            
-            location_data['parameters'][param_id] = value
-        
-        locations.append(location_data)
-    
-    return locations
+class SessionUpdatePayload(BaseModel):
+    criteria: Dict[str, Any] = {}
+    remove: List[str] = []
 
+class SurfacePayload(BaseModel):
+    criteria: Dict[str, Any]
+    bbox: Optional[List[float]] = None
+    width: int = 512
+    height: int = 512
+    format: str = "png"
 
-def calculate_suitability_score(location, criteria):
-    """Calculate suitability score for a location based on criteria"""
-    total_score = 0
-    total_weight = 0
-    
-    for param_id, param_criteria in criteria.items():
-        if param_id not in RESTAURANT_PARAMETERS:
-            continue
-            
-        param_config = RESTAURANT_PARAMETERS[param_id]
-        location_value = location['parameters'].get(param_id, 0)
-        user_weight = param_criteria['weight']
-        user_threshold = param_criteria['value']
-        
-        # Calculate score for this parameter (0-100)
-        if param_config['type'] == 'distance':
-            # For distance: closer to user threshold is better
-            if location_value <= user_threshold:
-                param_score = 100 - (location_value / user_threshold * 50)
-            else:
-                param_score = max(0, 50 - ((location_value - user_threshold) / user_threshold * 50))
-        else:
-            # For scale: match user's required level
-            if 'inverted' in param_config and param_config['inverted']:
-                # Lower is better (like rent cost)
-                param_score = max(0, 100 - (location_value / 10 * 100))
-            else:
-                # Higher is better
-                if location_value >= user_threshold:
-                    param_score = 100
-                else:
-                    param_score = (location_value / user_threshold) * 100
-        
-        # Weight the score
-        weighted_score = param_score * (user_weight / 100)
-        total_score += weighted_score
-        total_weight += user_weight
-    
-    # Normalize to 100% scale
-    if total_weight > 0:
-        return min(100, (total_score / total_weight) * 100)
-    return 0
+class ReportRequest(BaseModel):
+    analysisResults: Dict[str, Any]
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Startup
+    candidate_store = get_candidate_store()
+    
     if not os.path.exists(DB_FILE):
-        print(f"Creating database file: {DB_FILE}")
-
-        # Generate NYC sample data
-        logger.info("Generating sample location data...")
-        sample_locations = generate_sample_locations(
-            center_lat=settings.default_location_lat,
-            center_lng=settings.default_location_lng,
-            count=settings.sample_locations_count * 3
-        )
-        
-        # Create restaurants layer (sample existing restaurants)
-        logger.info(f"Creating restaurants layer with {settings.sample_restaurants_count} entries...")
-        restaurants_data = []
-        for i in range(settings.sample_restaurants_count):
-            loc = random.choice(sample_locations)
-            restaurants_data.append({
-                'id': i + 1,
-                'name': f'Restaurant {i + 1}',
-                'geometry': Point(loc['longitude'], loc['latitude']),
-                'cuisine': random.choice(['Italian', 'Chinese', 'Mexican', 'American', 'Japanese', 'Mediterranean', 'Indian', 'Thai']),
-                'rating': round(random.uniform(3.5, 4.8), 1),
-                'price_range': random.choice(['$', '$$', '$$$', '$$$$']),
-                'established_year': random.randint(2000, 2023)
-            })
-        
-        restaurants_gdf = gpd.GeoDataFrame(restaurants_data, crs="EPSG:4326")
-        restaurants_gdf.to_file(DB_FILE, layer='restaurants', driver="GPKG")
-        print("Created restaurants layer with NYC sample data.")
-
-        # Create potential locations layer
-        potential_data = []
-        for loc in sample_locations[:50]:  # First 50 as potential locations
-            potential_data.append({
-                'id': loc['id'],
-                'name': f"Location {loc['id']}",
-                'geometry': Point(loc['longitude'], loc['latitude']),
-                'address': loc['address'],
-                'zone_type': random.choice(['Commercial', 'Mixed-Use', 'Retail'])
-            })
-        
-        potential_gdf = gpd.GeoDataFrame(potential_data, crs="EPSG:4326")
-        potential_gdf.to_file(DB_FILE, layer='potential_locations', driver="GPKG")
-        print("Created potential_locations layer.")
-
-        # Create other sample layers
-        layer_configs = [
-            ('transport_stops', 'Public Transport', 'fa-bus'),
-            ('shopping_areas', 'Shopping Centers', 'fa-shopping-cart'),
-            ('office_buildings', 'Office Buildings', 'fa-building'),
-            ('parking_lots', 'Parking Areas', 'fa-parking'),
-            ('high_traffic_areas', 'High Traffic Zones', 'fa-walking'),
-            ('commercial_zones', 'Commercial Zones', 'fa-store'),
-            ('residential_areas', 'Residential Areas', 'fa-home'),
-            ('safety_zones', 'Safety Zones', 'fa-shield-alt')
-        ]
-        
-        for layer_name, display_name, icon in layer_configs:
-            layer_data = []
-            for i in range(random.randint(15, 30)):
-                loc = random.choice(sample_locations)
-                layer_data.append({
-                    'id': i + 1,
-                    'name': f'{display_name} {i + 1}',
-                    'geometry': Point(loc['longitude'], loc['latitude']),
-                    'category': display_name,
-                    'importance': random.randint(1, 10)
-                })
-            
-            layer_gdf = gpd.GeoDataFrame(layer_data, crs="EPSG:4326")
-            layer_gdf.to_file(DB_FILE, layer=layer_name, driver="GPKG")
-        
-        print("Created sample layers with NYC data.")
+        # Generate seeded NYC sample data in bulk
+        logger.info(f"Creating database file: {DB_FILE}")
+        bootstrap_database(DB_FILE, candidate_store)
+
+    # Ground distance and density parameters in the layers of the GeoPackage
+    refresh_distances(candidate_store)
+    
+    if settings.partitions_enabled and not partitions.keys() and os.path.exists(DB_FILE):
+        # First start with partitions: split the single database by tile
+        partition_database(DB_FILE, candidate_store)
 
     yield
     # Shutdown
+    job_manager.shutdown()
+    export_manager.shutdown()
+    shutdown_scorer()
 
 
 app = FastAPI(
@@ -264,6 +102,23 @@ app = FastAPI(
     redoc_url="/redoc"
 )
 DB_FILE = settings.database_path
+layer_cache = LayerCache(DB_FILE)
+gpkg = GeoPackage(DB_FILE)
+
+# Layers exposed to the map: (layer name, display name, icon)
+LAYER_INFO = [
+    ("restaurants", "Existing Restaurants", "fa-utensils"),
+    ("potential_locations", "Potential Locations", "fa-map-pin"),
+    ("transport_stops", "Public Transport", "fa-bus"),
+    ("shopping_areas", "Shopping Centers", "fa-shopping-cart"),
+    ("office_buildings", "Office Buildings", "fa-building"),
+    ("parking_lots", "Parking Areas", "fa-parking"),
+    ("high_traffic_areas", "High Traffic Zones", "fa-walking"),
+    ("commercial_zones", "Commercial Zones", "fa-store"),
+    ("residential_areas", "Residential Areas", "fa-home"),
+    ("safety_zones", "Safety Zones", "fa-shield-alt")
+]
+LAYER_NAMES = {layer_name for layer_name, _, _ in LAYER_INFO}
 
 # Add CORS middleware
 app.add_middleware(
@@ -272,7 +127,43 @@ app.add_middleware(
     allow_credentials=settings.cors_allow_credentials,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Grid-Width", "X-Grid-Height", "X-Grid-Bbox"],
 )
+app.add_middleware(MetricsMiddleware)
+
+# Cache hit ratios and sizes are read when /metrics is scraped
+watch_cache("layers", layer_cache.stats)
+watch_cache("analysis_results", result_cache.stats)
+watch_cache("surface_rasters", raster_cache.stats)
+watch_cache("sessions", sessions.stats)
+watch_cache("responses", payload_cache.stats)
+watch_cache("aggregates", aggregate_cache.stats)
+watch_cache("area_stores", area_stores.stats)
+
+
+def payload_store(region: Optional[str], bbox: Optional[List[float]]) -> CandidateStore:
+    """Candidates of the region or bbox a request names"""
+    try:
+        return request_store(region, bbox)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+def layer_known(layer_name: str) -> bool:
+    """Whether a standard layer or some partition has the layer, for areas where no partition holds it"""
+    return layer_name in LAYER_NAMES or layer_name in partitions.layer_names()
+
+
+def empty_collection() -> Response:
+    return Response(content=b'{"type": "FeatureCollection", "features": []}', media_type="application/geo+json")
+
+
+def scored_store(result: AnalysisResult) -> CandidateStore:
+    """The candidates an analysis ranked"""
+    store = dataset_store(result.dataset)
+    if store is None:
+        raise HTTPException(status_code=404, detail=f"Candidates of analysis '{result.analysis_id}' have changed")
+    return store
 
 
 @app.get("/")
@@ -287,38 +178,76 @@ def read_root():
     }
 
 
-@app.get("/health")
-def health_check():
-    """Health check endpoint for monitoring"""
+def readiness_checks() -> Dict[str, Any]:
+    """Status of the GeoPackage, candidate store and caches without reading any layer"""
+    checks = {}
     try:
-        # Check database file exists
-        db_status = os.path.exists(settings.database_path)
-        
-        # Check if we can read a layer (basic functionality test)
-        gis_status = False
-        try:
-            if db_status:
-                gdf = gpd.read_file(settings.database_path, layer='restaurants')
-                gis_status = len(gdf) >= 0
-        except:
-            pass
-        
-        health_data = {
-            "status": "healthy" if db_status and gis_status else "unhealthy",
+        checks["database"] = "ok" if gpkg.ping() else "error"
+    except Exception as e:
+        checks["database"] = f"error: {str(e)}"
+    
+    store = candidate_store_loaded()
+    checks["feature_store"] = "ok" if store is not None else "not_loaded"
+    if store is not None:
+        checks["candidates"] = len(store)
+    checks["layer_cache"] = "ok" if layer_cache.enabled else "disabled"
+    checks["result_cache_entries"] = len(result_cache)
+    return checks
+
+
+_last_health_status: Optional[str] = None
+
+
+def health_response(checks: Dict[str, Any], healthy: bool) -> JSONResponse:
+    """Build a health payload, logging only when the status changes"""
+    global _last_health_status
+    status = "healthy" if healthy else "unhealthy"
+    if status != _last_health_status:
+        logger.info(f"Health check: {status}")
+        _last_health_status = status
+    
+    return JSONResponse(
+        content={
+            "status": status,
             "timestamp": datetime.utcnow().isoformat(),
             "version": "1.0.0",
             "environment": settings.environment,
-            "checks": {
-                "database": "ok" if db_status else "error",
-                "gis_engine": "ok" if gis_status else "error"
-            },
-            "uptime": "healthy"
-        }
+            "checks": checks
+        },
+        status_code=200 if healthy else 503
+    )
+
+
+@app.get("/health/live")
+def liveness_check():
+    """Liveness probe: the process is up and serving requests"""
+    return {"status": "alive"}
+
+
+@app.get("/health/ready")
+def readiness_check():
+    """Readiness probe: database reachable and candidate store loaded"""
+    checks = readiness_checks()
+    return health_response(checks, checks["database"] == "ok" and checks["feature_store"] == "ok")
+
+
+@app.get("/health")
+def health_check(deep: bool = Query(False, description="Also read a layer through the GIS engine")):
+    """Health check endpoint for monitoring"""
+    try:
+        checks = readiness_checks()
+        healthy = checks["database"] == "ok"
         
-        status_code = 200 if health_data["status"] == "healthy" else 503
-        logger.info(f"Health check: {health_data['status']}")
+        if deep:
+            # Full read of a layer exercises GDAL and the layer cache
+            try:
+                layer_cache.get('restaurants')
+                checks["gis_engine"] = "ok"
+            except Exception as e:
+                checks["gis_engine"] = f"error: {str(e)}"
+                healthy = False
         
-        return JSONResponse(content=health_data, status_code=status_code)
+        return health_response(checks, healthy)
         
     except Exception as e:
         logger.error(f"Health check failed: {str(e)}")
@@ -333,8 +262,11 @@ def health_check():
 
 
 @app.get("/metrics")
-def get_metrics():
-    """Basic metrics endpoint"""
+def get_metrics(request: Request, format: Optional[str] = Query(None, description="'prometheus' for the text exposition format")):
+    """Basic metrics endpoint, answered from GeoPackage metadata"""
+    if wants_prometheus(request.headers.get("accept"), format):
+        return Response(content=registry.render(), media_type=CONTENT_TYPE)
+    
     try:
         metrics = {
             "database_size_mb": round(os.path.getsize(settings.database_path) / 1024 / 1024, 2) if os.path.exists(settings.database_path) else 0,
@@ -343,30 +275,21 @@ def get_metrics():
             "timestamp": datetime.utcnow().isoformat()
         }
         
-        # Count layers and features
+        # Count layers and features from GeoPackage metadata
         if os.path.exists(settings.database_path):
             try:
-                # Use geopandas to list layers instead of fiona
-                import sqlite3
-                conn = sqlite3.connect(settings.database_path)
-                cursor = conn.cursor()
-                cursor.execute("SELECT name FROM sqlite_master WHERE type='table';")
-                tables = cursor.fetchall()
-                metrics["total_layers"] = len([t[0] for t in tables if not t[0].startswith('sqlite_')])
-                conn.close()
-                
-                # Count features in first few layers
-                total_features = 0
-                layer_names = ['restaurants', 'potential_locations', 'transport_stops']
-                for layer in layer_names:
-                    try:
-                        gdf = gpd.read_file(settings.database_path, layer=layer)
-                        total_features += len(gdf)
-                    except:
-                        pass
-                metrics["total_features"] = total_features
-            except Exception:
-                pass
+                layers = gpkg.layers()
+                metrics["total_layers"] = len(layers)
+                metrics["total_features"] = sum(layer["feature_count"] for layer in layers.values())
+                metrics["layers"] = {name: layer["feature_count"] for name, layer in layers.items()}
+            except Exception as e:
+                logger.warning(f"Could not read GeoPackage metadata: {str(e)}")
+        metrics["layer_cache"] = layer_cache.stats()
+        metrics["result_cache"] = result_cache.stats()
+        metrics["jobs"] = job_manager.stats()
+        metrics["exports"] = export_manager.stats()
+        if settings.partitions_enabled:
+            metrics["partitions"] = partitions.stats()
         
         return metrics
         
@@ -376,7 +299,7 @@ def get_metrics():
 
 
 @app.post("/analysis")
-def perform_analysis(payload: CriteriaPayload):
+def perform_analysis(payload: CriteriaPayload, request: Request):
     """
     Performs restaurant location suitability analysis based on user criteria
     """
@@ -389,61 +312,335 @@ def perform_analysis(payload: CriteriaPayload):
         
         logger.info(f"Starting analysis with {len(criteria)} criteria: {list(criteria.keys())}")
         
-        # Generate sample locations for analysis
-        sample_locations = generate_sample_locations(
-            center_lat=settings.default_location_lat,
-            center_lng=settings.default_location_lng,
-            count=settings.max_analysis_locations
-        )
+        # Candidates are materialized once and shared across requests
+        with stage("candidate_load"):
+            store = payload_store(payload.region, payload.bbox)
+        
+        # The id covers the criteria and candidate data, so a matching ETag means nothing changed
+        # and the client is answered before anything is scored
+        media_type = choose_format(request.headers.get("accept"))
+        etag = make_etag(analysis_key(criteria, store.version), criteria, media_type)
+        if not_modified(request.headers.get("if-none-match"), etag):
+            return not_modified_response(etag)
+        
+        # Identical criteria against the same candidates share one cached result
+        result = get_analysis(store, criteria)
+        analysis_results = {**result.response, "criteria_used": criteria}
+        
+        logger.info(f"Analysis {result.analysis_id} completed: "
+                    f"{analysis_results['suitable_locations_found']} suitable locations found")
         
-        logger.info(f"Generated {len(sample_locations)} sample locations for analysis")
+        with stage("serialization"):
+            return encoded_response(
+                request, etag, media_type,
+                lambda: dump_content(analysis_results, media_type, records="top_10_locations")
+            )
         
-        # Calculate suitability scores
-        scored_locations = []
-        for location in sample_locations:
-            score = calculate_suitability_score(location, criteria)
-            if score > 0:  # Only include locations with some suitability
-                scored_locations.append({
-                    **location,
-                    'suitability_score': round(score, 2)
-                })
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Analysis error: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Analysis error: {str(e)}")
+
+
+@app.get("/analysis/{analysis_id}/results")
+def get_analysis_results(
+    analysis_id: str,
+    request: Request,
+    page: int = Query(1, ge=1),
+    page_size: int = Query(50, ge=1, le=settings.max_page_size)
+):
+    """
+    Returns a page of the full ranking of a recent analysis
+    """
+    result = find_analysis(analysis_id)
+    if result is None:
+        raise HTTPException(status_code=404, detail=f"Analysis '{analysis_id}' not found or expired")
+    
+    store = scored_store(result)
+    media_type = choose_format(request.headers.get("accept"))
+    etag = make_etag(analysis_id, page, page_size, media_type)
+    
+    def render() -> bytes:
+        if media_type == ARROW_STREAM:
+            # Columns come straight from the candidate arrays, without per-location dicts
+            return dump_arrow(result.page_columns(store, page, page_size), result.page_header(page, page_size))
+        return dump_content(result.page(store, page, page_size), media_type)
+    
+    return encoded_response(request, etag, media_type, render)
+
+
+@app.post("/analysis/batch")
+def perform_batch_analysis(payload: BatchCriteriaPayload):
+    """
+    Scores many criteria sets against the same candidates in one vectorized pass
+    """
+    try:
+        scenarios = payload.scenarios
         
-        # Sort by suitability score
-        scored_locations.sort(key=lambda x: x['suitability_score'], reverse=True)
+        if not scenarios:
+            raise HTTPException(status_code=400, detail="No scenarios provided")
+        if len(scenarios) > settings.max_batch_scenarios:
+            raise HTTPException(status_code=400, detail=f"At most {settings.max_batch_scenarios} scenarios per batch")
+        if any(not scenario.criteria for scenario in scenarios):
+            raise HTTPException(status_code=400, detail="Every scenario needs criteria")
+        if payload.top_n is None or not 0 <= payload.top_n <= 1000:
+            raise HTTPException(status_code=400, detail="top_n must be between 0 and 1000")
         
-        # Get statistics
-        suitable_locations = [loc for loc in scored_locations if loc['suitability_score'] >= 60]
-        best_location = scored_locations[0] if scored_locations else None
+        logger.info(f"Starting batch analysis with {len(scenarios)} scenarios")
         
-        logger.info(f"Analysis completed: {len(suitable_locations)} suitable locations found out of {len(scored_locations)}")
+        store = payload_store(payload.region, payload.bbox)
+        results = run_batch(store, [scenario.criteria for scenario in scenarios], top_n=payload.top_n)
+        for scenario, result in zip(scenarios, results):
+            result["name"] = scenario.name
         
-        # Prepare results
-        analysis_results = {
+        return {
             "status": "success",
-            "message": "GIS analysis completed successfully",
-            "criteria_used": criteria,
-            "total_locations_analyzed": len(sample_locations),
-            "suitable_locations_found": len(suitable_locations),
-            "best_location": {
-                "coordinates": f"{best_location['latitude']:.6f}, {best_location['longitude']:.6f}",
-                "suitability_score": best_location['suitability_score'],
-                "address": best_location['address']
-            } if best_location else None,
-            "top_10_locations": scored_locations[:10],
-            "analysis_summary": {
-                "average_score": round(np.mean([loc['suitability_score'] for loc in scored_locations]), 2) if scored_locations else 0,
-                "median_score": round(np.median([loc['suitability_score'] for loc in scored_locations]), 2) if scored_locations else 0,
-                "parameters_count": len(criteria),
-                "total_weight": sum(param['weight'] for param in criteria.values()),
-                "analysis_timestamp": datetime.utcnow().isoformat()
-            }
+            "message": "Batch analysis completed successfully",
+            "total_locations_analyzed": len(store),
+            "scenarios": results,
+            "analysis_timestamp": datetime.utcnow().isoformat()
         }
         
-        return analysis_results
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Batch analysis error: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Batch analysis error: {str(e)}")
+
+
+@app.post("/jobs/analysis", status_code=202)
+def submit_analysis_job(payload: CriteriaPayload):
+    """
+    Queues an analysis to run in the background and returns its job id
+    """
+    if not payload.criteria:
+        raise HTTPException(status_code=400, detail="No criteria provided")
+    
+    try:
+        job = job_manager.submit(payload_store(payload.region, payload.bbox), payload.criteria)
+    except JobQueueFull as e:
+        raise HTTPException(status_code=429, detail=f"Job queue full: {str(e)}")
+    
+    logger.info(f"Queued analysis job {job.job_id}")
+    return {
+        **job.snapshot(),
+        "status_url": f"/jobs/{job.job_id}",
+        "events_url": f"/jobs/{job.job_id}/events"
+    }
+
+
+@app.get("/jobs/{job_id}")
+def get_job(job_id: str):
+    """
+    Returns the state of an analysis job, with the analysis id once completed
+    """
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job '{job_id}' not found")
+    return job.snapshot()
+
+
+@app.get("/jobs/{job_id}/events")
+def stream_job_events(job_id: str):
+    """
+    Streams job progress and partial top locations as server-sent events
+    """
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job '{job_id}' not found")
+    return StreamingResponse(
+        job_events(job),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@app.delete("/jobs/{job_id}")
+def cancel_job(job_id: str):
+    """
+    Cancels a queued or running analysis job
+    """
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job '{job_id}' not found")
+    if not job.cancel():
+        raise HTTPException(status_code=409, detail=f"Job '{job_id}' already {job.status}")
+    return job.snapshot()
+
+
+@app.post("/analysis/{analysis_id}/exports", status_code=202)
+def submit_analysis_export(
+    analysis_id: str,
+    format: str = Query(..., description="'geojson', 'csv', 'gpkg' or 'shapefile'"),
+    limit: Optional[int] = Query(None, ge=1, description="Export only the best `limit` locations")
+):
+    """
+    Queues an export of the ranked locations of a recent analysis
+    """
+    if format not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"format must be one of {', '.join(EXPORT_FORMATS)}")
+    result = find_analysis(analysis_id)
+    if result is None:
+        raise HTTPException(status_code=404, detail=f"Analysis '{analysis_id}' not found or expired")
+    
+    try:
+        job = submit_export(result, scored_store(result), format, limit)
+    except JobQueueFull as e:
+        raise HTTPException(status_code=429, detail=f"Export queue is full: {str(e)}")
+    
+    logger.info(f"Queued {format} export {job.job_id} of analysis {analysis_id}")
+    return {
+        **job.snapshot(),
+        "status_url": f"/exports/{job.job_id}",
+        "download_url": f"/exports/{job.job_id}/download"
+    }
+
+
+@app.get("/exports/{export_id}")
+def get_export(export_id: str):
+    """
+    Returns the state and progress of an export
+    """
+    job = export_manager.get(export_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Export '{export_id}' not found")
+    return job.snapshot()
+
+
+@app.get("/exports/{export_id}/download")
+def download_export(export_id: str):
+    """
+    Streams a completed export file
+    """
+    job = export_manager.get(export_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Export '{export_id}' not found")
+    if job.status != "completed":
+        raise HTTPException(status_code=409, detail=f"Export '{export_id}' is {job.status}")
+    return FileResponse(job.path, media_type=job.media_type, filename=job.filename)
+
+
+@app.delete("/exports/{export_id}")
+def delete_export(export_id: str):
+    """
+    Cancels a running export, or deletes the file of a finished one
+    """
+    job = export_manager.get(export_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Export '{export_id}' not found")
+    if not job.cancel():
+        export_manager.forget(export_id)
+    return job.snapshot()
+
+
+@app.post("/analysis/sessions")
+def open_analysis_session(payload: CriteriaPayload):
+    """
+    Opens an interactive analysis session for incremental slider updates
+    """
+    try:
+        if not payload.criteria:
+            raise HTTPException(status_code=400, detail="No criteria provided")
+        
+        session = create_session(payload_store(payload.region, payload.bbox), payload.criteria)
+        with session.lock:
+            result = session.result()
+        logger.info(f"Opened analysis session {session.session_id}")
+        return {**result.response, "session_id": session.session_id}
         
+    except HTTPException:
+        raise
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
-        logger.error(f"Analysis error: {str(e)}")
-        raise HTTPException(status_code=500, detail=f"Analysis error: {str(e)}")
+        logger.error(f"Session error: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Session error: {str(e)}")
+
+
+@app.patch("/analysis/sessions/{session_id}")
+def update_analysis_session(session_id: str, payload: SessionUpdatePayload):
+    """
+    Changes some criteria of a session, re-scoring only the parameters that changed
+    """
+    session = find_session(session_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail=f"Session '{session_id}' not found or expired")
+    
+    try:
+        with session.lock:
+            session.update(payload.criteria, remove=payload.remove)
+            result = session.result()
+        return {**result.response, "session_id": session_id}
+        
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"Session {session_id} update error: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Session error: {str(e)}")
+
+
+@app.delete("/analysis/sessions/{session_id}")
+def delete_analysis_session(session_id: str):
+    """
+    Closes an analysis session
+    """
+    if not close_session(session_id):
+        raise HTTPException(status_code=404, detail=f"Session '{session_id}' not found or expired")
+    return {"status": "closed", "session_id": session_id}
+
+
+@app.post("/analysis/surface")
+def perform_surface_analysis(payload: SurfacePayload):
+    """
+    Scores a regular grid over a bbox as a continuous suitability surface
+    """
+    try:
+        criteria = payload.criteria
+        
+        if not criteria:
+            raise HTTPException(status_code=400, detail="No criteria provided")
+        if not (0 < payload.width <= settings.max_surface_size and 0 < payload.height <= settings.max_surface_size):
+            raise HTTPException(status_code=400, detail=f"Surface size must be between 1 and {settings.max_surface_size}")
+        if payload.format not in ("png", "grid"):
+            raise HTTPException(status_code=400, detail="format must be 'png' or 'grid'")
+        
+        bbox = tuple(payload.bbox) if payload.bbox is not None else default_bbox()
+        if len(bbox) != 4 or not (bbox[0] < bbox[2] and bbox[1] < bbox[3]):
+            raise HTTPException(status_code=400, detail="bbox must be minx,miny,maxx,maxy")
+        
+        grid = SurfaceGrid(bbox, payload.width, payload.height)
+        
+        # Distance and density rasters come from the GeoPackage layers when the database exists
+        if settings.partitions_enabled:
+            # Partition candidates already carry their layer-derived values
+            surface = compute_surface(criteria, grid, area_store(bbox))
+        elif os.path.exists(DB_FILE):
+            store = get_candidate_store()
+            surface = compute_surface(criteria, grid, store, layer_cache.get, str(os.path.getmtime(DB_FILE)))
+        else:
+            surface = compute_surface(criteria, grid, get_candidate_store())
+        
+        if payload.format == "png":
+            content, media_type = encode_png(surface), "image/png"
+        else:
+            content, media_type = encode_grid(surface), "application/octet-stream"
+        
+        return Response(
+            content=content,
+            media_type=media_type,
+            headers={
+                "X-Grid-Width": str(grid.width),
+                "X-Grid-Height": str(grid.height),
+                "X-Grid-Bbox": ",".join(str(v) for v in bbox)
+            }
+        )
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Surface analysis error: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Surface analysis error: {str(e)}")
 
 
 @app.post("/report")
@@ -485,7 +682,8 @@ def generate_report(request: ReportRequest):
                 "scoring_scale": "0-100% suitability index",
                 "data_sources": "Simulated urban location data"
             },
-            "download_formats": ["PDF", "Excel", "GeoJSON", "Shapefile"]
+            "download_formats": list(EXPORT_FORMATS),
+            "exports_url": f"/analysis/{results['analysis_id']}/exports" if results.get('analysis_id') else None
         }
         
         return {"report": report, "status": "generated"}
@@ -495,60 +693,279 @@ def generate_report(request: ReportRequest):
 
 
 @app.get("/layers")
-def get_available_layers():
+def get_available_layers(
+    region: Optional[str] = Query(None, description="Named region; only its partitions are described"),
+    bbox: Optional[str] = Query(None, description="Area as minx,miny,maxx,maxy (EPSG:4326)")
+):
     """
     Returns list of available GIS layers
     """
     try:
-        # Check which layers exist in the database
+        # Describe the layers that exist from GeoPackage metadata only
+        if settings.partitions_enabled:
+            layers = describe_layers(resolve_area(region, parse_bbox(bbox)))
+        else:
+            layers = gpkg.layers() if os.path.exists(DB_FILE) else {}
         available_layers = []
-        layer_info = [
-            ("restaurants", "Existing Restaurants", "fa-utensils"),
-            ("potential_locations", "Potential Locations", "fa-map-pin"),
-            ("transport_stops", "Public Transport", "fa-bus"),
-            ("shopping_areas", "Shopping Centers", "fa-shopping-cart"),
-            ("office_buildings", "Office Buildings", "fa-building"),
-            ("parking_lots", "Parking Areas", "fa-parking"),
-            ("high_traffic_areas", "High Traffic Zones", "fa-walking"),
-            ("commercial_zones", "Commercial Zones", "fa-store"),
-            ("residential_areas", "Residential Areas", "fa-home"),
-            ("safety_zones", "Safety Zones", "fa-shield-alt")
-        ]
-        
-        for layer_name, display_name, icon in layer_info:
-            try:
-                gdf = gpd.read_file(DB_FILE, layer=layer_name)
-                available_layers.append({
-                    "id": layer_name,
-                    "name": display_name,
-                    "icon": icon,
-                    "feature_count": len(gdf),
-                    "geometry_type": str(gdf.geometry.geom_type.iloc[0]) if len(gdf) > 0 else "Unknown"
-                })
-            except:
-                pass  # Layer doesn't exist or can't be read
+        for layer_name, display_name, icon in LAYER_INFO:
+            layer = layers.get(layer_name)
+            if layer is None:
+                continue  # Layer doesn't exist
+            available_layers.append({
+                "id": layer_name,
+                "name": display_name,
+                "icon": icon,
+                "feature_count": layer["feature_count"],
+                "geometry_type": layer["geometry_type"] if layer["feature_count"] > 0 else "Unknown",
+                "bounds": layer["bounds"]
+            })
                 
         return {"layers": available_layers}
         
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error fetching layers: {str(e)}")
 
 
 @app.get("/layers/{layer_name}")
-def get_layer(layer_name: str):
+def get_layer(
+    layer_name: str,
+    request: Request,
+    region: Optional[str] = Query(None, description="Named region to filter to"),
+    bbox: Optional[str] = Query(None, description="Filter to minx,miny,maxx,maxy (EPSG:4326)"),
+    limit: Optional[int] = Query(None, ge=1, description="Maximum number of features to return"),
+    cursor: Optional[int] = Query(None, description="Return features after this id (from next_cursor)"),
+    properties: Optional[str] = Query(None, description="Comma separated properties to include")
+):
     """
-    Returns a specified layer from the GeoPackage as GeoJSON
+    Streams a specified layer from the GeoPackage as GeoJSON
     """
     try:
-        gdf = gpd.read_file(DB_FILE, layer=layer_name)
-        
-        # Convert to GeoJSON
-        geojson_data = json.loads(gdf.to_json())
-        
-        return geojson_data
-        
+        bounds = resolve_area(region, parse_bbox(bbox))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    if settings.partitions_enabled:
+        # Only the partitions under the area are opened
+        sources = layer_sources(layer_name, bounds)
+        if not sources and layer_known(layer_name):
+            return empty_collection()
+        table = sources[0][1] if sources else None
+    else:
+        table = gpkg.feature_table(layer_name) if os.path.exists(DB_FILE) else None
+    if table is None:
+        raise HTTPException(status_code=404, detail=f"Layer '{layer_name}' not found")
+    
+    try:
+        columns = select_properties(table, properties)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    if settings.partitions_enabled:
+        version = layers_version(sources)
+        feature_count = sum((partition.gpkg.layer(layer_name) or {}).get("feature_count", 0)
+                            for partition, _ in sources)
+    else:
+        version = gpkg.last_change(layer_name)
+        feature_count = (gpkg.layer(layer_name) or {}).get("feature_count", 0)
+    
+    def features():
+        if settings.partitions_enabled:
+            return stream_area_collection(sources, columns, bbox=bounds, cursor=cursor, limit=limit)
+        return stream_feature_collection(gpkg, table, columns, bbox=bounds, cursor=cursor, limit=limit)
+    
+    # Layer content only changes with its last_change, so clients revalidate with If-None-Match
+    etag = make_etag(layer_name, version, bounds, limit, cursor, columns)
+    if not_modified(request.headers.get("if-none-match"), etag):
+        return not_modified_response(etag)
+    headers = {"Cache-Control": "no-cache"}
+    
+    if min(feature_count, limit or feature_count) <= settings.precompressed_layer_max_features:
+        # Encoded and compressed once per layer version and query
+        return encoded_response(
+            request, etag, "application/geo+json",
+            lambda: b"".join(features()),
+            headers=headers
+        )
+    
+    # Features are read in batches from the R-tree filtered table and sent as they are encoded
+    return StreamingResponse(
+        features(),
+        media_type="application/geo+json",
+        headers={"ETag": etag, "Vary": VARY, **headers}
+    )
+
+
+@app.get("/layers/{layer_name}/aggregate")
+def get_layer_aggregate(
+    layer_name: str,
+    request: Request,
+    z: int = Query(..., ge=0, description="Map zoom level; cells are a fixed size on screen"),
+    method: str = Query("hex", description="'hex', 'square' or 'cluster'"),
+    region: Optional[str] = Query(None, description="Only cells within a named region"),
+    bbox: Optional[str] = Query(None, description="Only cells within minx,miny,maxx,maxy (EPSG:4326)"),
+    fields: Optional[str] = Query(None, description="Comma separated numeric properties to average")
+):
+    """
+    Bins a layer into hexagons, squares or clusters with counts and mean attributes per cell
+    """
+    if z > settings.tile_max_zoom:
+        raise HTTPException(status_code=400, detail=f"z must be at most {settings.tile_max_zoom}")
+    if method not in METHODS:
+        raise HTTPException(status_code=400, detail=f"method must be one of {', '.join(METHODS)}")
+    try:
+        bounds = resolve_area(region, parse_bbox(bbox))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    if settings.partitions_enabled:
+        sources = layer_sources(layer_name, bounds)
+        if not sources and layer_known(layer_name):
+            return empty_collection()
+        found = bool(sources)
+    else:
+        found = os.path.exists(DB_FILE) and gpkg.feature_table(layer_name) is not None
+    if not found:
+        raise HTTPException(status_code=404, detail=f"Layer '{layer_name}' not found")
+    
+    try:
+        if settings.partitions_enabled:
+            # Bins cover the partitions under the area, each layer part read through its partition's cache
+            version = layers_version(sources)
+            
+            def read_layer(name: str) -> gpd.GeoDataFrame:
+                return read_area_layer(sources, name)
+        else:
+            version = gpkg.last_change(layer_name) or "0"
+            read_layer = layer_cache.get
+        etag = make_etag("aggregate", layer_name, version, method, z, bounds, fields)
+        if not_modified(request.headers.get("if-none-match"), etag):
+            return not_modified_response(etag)
+        field_names = [name.strip() for name in fields.split(",") if name.strip()] if fields else None
+        bins = get_bins(layer_name, version, read_layer, method, z, field_names)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"Aggregation of '{layer_name}' failed: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Aggregation error: {str(e)}")
+    
+    return encoded_response(
+        request, etag, "application/geo+json",
+        lambda: encode_bins(bins, bins.select(bounds)),
+        headers={"Cache-Control": "no-cache"}
+    )
+
+
+@app.post("/layers/{layer_name}/upload")
+async def upload_layer(
+    layer_name: str,
+    file: UploadFile = File(...),
+    mode: str = Query("append", description="'append' to the layer or 'replace' it"),
+    source_crs: Optional[str] = Query(None, description="CRS of the upload when the file does not declare one")
+):
+    """
+    Ingests a GeoJSON, KML, GPX or CSV upload into a GeoPackage layer
+    """
+    extension = os.path.splitext(file.filename or "")[1].lower()
+    if extension not in settings.allowed_extensions:
+        raise HTTPException(status_code=400, detail=f"Unsupported file type '{extension}'")
+    if mode not in ("append", "replace"):
+        raise HTTPException(status_code=400, detail="mode must be 'append' or 'replace'")
+    try:
+        validate_layer_name(layer_name)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if file.size is not None and file.size > settings.max_ingest_file_size:
+        raise HTTPException(status_code=413, detail=f"Upload exceeds {settings.max_ingest_file_size} bytes")
+
+    try:
+        # The upload is spooled to disk; parsing and batched writes run off the event loop
+        if settings.partitions_enabled:
+            # Features go to the partitions they fall in; their candidates are re-derived on next use
+            summary = await run_in_threadpool(ingest_partitioned, file.file, extension, layer_name, mode, source_crs)
+        else:
+            summary = await run_in_threadpool(ingest_stream, file.file, extension, DB_FILE, layer_name, mode,
+                                              source_crs)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"Ingestion into '{layer_name}' failed: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Ingestion error: {str(e)}")
+    finally:
+        await file.close()
+
+    layer_cache.clear()
+    if not settings.partitions_enabled and any(config.get('source_layer') == layer_name for config in RESTAURANT_PARAMETERS.values()):
+        # Layer-backed columns, and everything keyed by the store version, follow the new features
+        await run_in_threadpool(refresh_distances, get_candidate_store())
+
+    return summary
+
+
+@app.get("/tiles/{layer_name}/{z}/{x}/{y}.mvt")
+def get_vector_tile(layer_name: str, z: int, x: int, y: int):
+    """
+    Returns a Mapbox Vector Tile for a layer, cached on disk per layer version
+    """
+    if not 0 <= z <= settings.tile_max_zoom or not (0 <= x < 2 ** z and 0 <= y < 2 ** z):
+        raise HTTPException(status_code=400, detail=f"Invalid tile {z}/{x}/{y}")
+    
+    if settings.partitions_enabled:
+        # Partitions under the tile; a tile outside every partition is empty and not cached
+        sources = layer_sources(layer_name, tile_lonlat_bounds(z, x, y))
+        if not sources:
+            if not layer_known(layer_name):
+                raise HTTPException(status_code=404, detail=f"Layer '{layer_name}' not found")
+            return Response(content=b"", media_type="application/vnd.mapbox-vector-tile",
+                            headers={"Cache-Control": f"public, max-age={settings.cache_ttl}"})
+        try:
+            version = make_etag(layers_version(sources)).strip('"')
+            data = cached_tile(layer_name, version, z, x, y, lambda: render_area_tile(sources, layer_name, z, x, y))
+        except Exception as e:
+            logger.error(f"Tile {layer_name}/{z}/{x}/{y} failed: {str(e)}")
+            raise HTTPException(status_code=500, detail=f"Tile error: {str(e)}")
+        return Response(
+            content=data,
+            media_type="application/vnd.mapbox-vector-tile",
+            headers={"Cache-Control": f"public, max-age={settings.cache_ttl}"}
+        )
+    
+    table = gpkg.feature_table(layer_name) if os.path.exists(DB_FILE) else None
+    if table is None:
+        raise HTTPException(status_code=404, detail=f"Layer '{layer_name}' not found")
+    
+    try:
+        version = gpkg.last_change(layer_name) or "0"
+        data = get_tile(gpkg, table, version, z, x, y)
     except Exception as e:
-        raise HTTPException(status_code=404, detail=f"Layer '{layer_name}' not found: {str(e)}")
+        logger.error(f"Tile {layer_name}/{z}/{x}/{y} failed: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Tile error: {str(e)}")
+    
+    return Response(
+        content=data,
+        media_type="application/vnd.mapbox-vector-tile",
+        headers={"Cache-Control": f"public, max-age={settings.cache_ttl}"}
+    )
+
+
+@app.get("/regions")
+def get_regions():
+    """
+    Returns the named regions and the partitions holding their data
+    """
+    regions = []
+    for name, bbox in settings.regions.items():
+        regions.append({
+            "id": name,
+            "bbox": bbox,
+            "partitions": partitions.covering(tuple(bbox)) if settings.partitions_enabled else []
+        })
+    return {
+        "partitioned": settings.partitions_enabled,
+        "partition_zoom": settings.partition_zoom if settings.partitions_enabled else None,
+        "regions": regions
+    }
 
 
 @app.get("/parameters")
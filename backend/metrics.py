@@ -0,0 +1,248 @@
+"""
+Prometheus metrics for Monasib backend
+"""
+import time
+import bisect
+import threading
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+
+# Latency buckets in seconds, from sub-millisecond scoring stages to slow layer reads
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    """Base for labelled metrics; children are created on first use per label set"""
+
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self._children: Dict[Tuple[str, ...], list] = {}
+        self._lock = threading.Lock()
+
+    def _child(self, labels: Tuple[str, ...]) -> list:
+        child = self._children.get(labels)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(labels, self._new_child())
+        return child
+
+    def _new_child(self) -> list:
+        return [0.0]
+
+    def samples(self) -> Iterator[str]:
+        for labels, child in list(self._children.items()):
+            yield f"{self.name}{_format_labels(self.label_names, labels)} {_format_value(child[0])}"
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self.samples())
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, *labels: str, amount: float = 1.0):
+        child = self._child(labels)
+        with self._lock:
+            child[0] += amount
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def inc(self, *labels: str, amount: float = 1.0):
+        child = self._child(labels)
+        with self._lock:
+            child[0] += amount
+
+    def dec(self, *labels: str, amount: float = 1.0):
+        self.inc(*labels, amount=-amount)
+
+    def set(self, value: float, *labels: str):
+        self._child(labels)[0] = value
+
+
+class Histogram(Metric):
+    """Cumulative-bucket histogram; each child holds per-bucket counts, then sum and count"""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self) -> list:
+        return [0] * (len(self.buckets) + 1) + [0.0, 0]
+
+    def observe(self, value: float, *labels: str):
+        child = self._child(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            child[index] += 1
+            child[-2] += value
+            child[-1] += 1
+
+    @contextmanager
+    def time(self, *labels: str):
+        """Observe the duration of the enclosed block"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, *labels)
+
+    def samples(self) -> Iterator[str]:
+        for labels, child in list(self._children.items()):
+            with self._lock:
+                child = list(child)
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), child):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                yield f"{self.name}_bucket{_format_labels(self.label_names, labels, le)} {cumulative}"
+            yield f"{self.name}_sum{_format_labels(self.label_names, labels)} {_format_value(child[-2])}"
+            yield f"{self.name}_count{_format_labels(self.label_names, labels)} {child[-1]}"
+
+
+class Registry:
+    """Metrics to expose, plus callbacks that refresh gauges at scrape time"""
+
+    def __init__(self):
+        self.metrics: List[Metric] = []
+        self.collectors: List[Callable[[], None]] = []
+
+    def register(self, metric: Metric) -> Metric:
+        self.metrics.append(metric)
+        return metric
+
+    def add_collector(self, collector: Callable[[], None]):
+        self.collectors.append(collector)
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text exposition format"""
+        for collector in self.collectors:
+            collector()
+        return "\n".join(metric.render() for metric in self.metrics) + "\n"
+
+
+registry = Registry()
+
+REQUEST_LATENCY = registry.register(Histogram(
+    "monasib_http_request_duration_seconds",
+    "Time until the response starts, per route", labels=("method", "route", "status")
+))
+REQUESTS_IN_FLIGHT = registry.register(Gauge(
+    "monasib_http_requests_in_flight", "Requests currently being handled"
+))
+REQUESTS_IN_FLIGHT.set(0)
+ANALYSIS_STAGE_LATENCY = registry.register(Histogram(
+    "monasib_analysis_stage_duration_seconds",
+    "Time spent in each stage of an analysis request", labels=("stage",)
+))
+LAYER_READ_LATENCY = registry.register(Histogram(
+    "monasib_layer_read_duration_seconds",
+    "Time to read a layer from the GeoPackage", labels=("layer",)
+))
+CACHE_HIT_RATIO = registry.register(Gauge(
+    "monasib_cache_hit_ratio", "Fraction of cache lookups that were hits", labels=("cache",)
+))
+CACHE_ENTRIES = registry.register(Gauge(
+    "monasib_cache_entries", "Entries held by a cache", labels=("cache",)
+))
+CACHE_BYTES = registry.register(Gauge(
+    "monasib_cache_size_bytes", "Approximate memory held by a cache", labels=("cache",)
+))
+
+
+def stage(name: str):
+    """Time one stage of an analysis"""
+    return ANALYSIS_STAGE_LATENCY.time(name)
+
+
+def watch_cache(name: str, stats: Callable[[], Dict]):
+    """Export a cache's hit ratio and occupancy, read from its stats() at scrape time"""
+    def collect():
+        current = stats()
+        CACHE_HIT_RATIO.set(current["hit_ratio"], name)
+        CACHE_ENTRIES.set(current["entries"], name)
+        CACHE_BYTES.set(current["size_mb"] * 1024 * 1024, name)
+    registry.add_collector(collect)
+
+
+def wants_prometheus(accept: Optional[str], format: Optional[str]) -> bool:
+    """Whether a /metrics request asked for the text exposition format"""
+    if format is not None:
+        return format == "prometheus"
+    accept = accept or ""
+    return "text/plain" in accept or "openmetrics" in accept
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware recording per-route latency and in-flight requests.
+
+    Routes are labelled by their path template so ids in URLs do not
+    create new series; latency is measured to the start of the response.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        recorded = False
+        REQUESTS_IN_FLIGHT.inc()
+
+        def record(status: int):
+            route = scope.get("route")
+            REQUEST_LATENCY.observe(
+                time.perf_counter() - start,
+                scope["method"], getattr(route, "path", "unmatched"), str(status)
+            )
+
+        async def send_wrapper(message):
+            nonlocal recorded
+            if message["type"] == "http.response.start" and not recorded:
+                recorded = True
+                record(message["status"])
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        except Exception:
+            if not recorded:
+                recorded = True
+                record(500)
+            raise
+        finally:
+            REQUESTS_IN_FLIGHT.dec()
@@ -0,0 +1,219 @@
+"""
+Multi-core sharded scoring over shared-memory candidate arrays for Monasib backend
+"""
+import atexit
+import threading
+import multiprocessing
+import numpy as np
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing.shared_memory import SharedMemory
+from typing import Any, Dict, List, Optional, Tuple
+
+from config import settings
+from logger import logger
+from ranking import ScoreAccumulator
+from scoring import score_candidates
+
+
+# (shared memory name, dtype, length) of one array
+ArraySpec = Tuple[str, str, int]
+
+# Stores kept exported at once, e.g. the global store and a few area stores
+MAX_SHARED_STORES = 4
+
+
+class SharedColumns:
+    """Candidate columns copied once into named shared memory blocks"""
+
+    def __init__(self, columns: Dict[str, np.ndarray]):
+        self.blocks: List[SharedMemory] = []
+        self.specs: Dict[str, ArraySpec] = {}
+        # score() calls whose shards may still read the blocks
+        self.users = 0
+        for param_id, values in columns.items():
+            block = SharedMemory(create=True, size=max(values.nbytes, 1))
+            np.ndarray(values.shape, dtype=values.dtype, buffer=block.buf)[:] = values
+            self.blocks.append(block)
+            self.specs[param_id] = (block.name, values.dtype.str, len(values))
+
+    def close(self):
+        """Release and remove the shared memory blocks"""
+        for block in self.blocks:
+            block.close()
+            block.unlink()
+        self.blocks = []
+
+
+# Shared memory blocks attached by this worker process, by name
+_attached: Dict[str, SharedMemory] = {}
+
+
+def _attach(spec: ArraySpec) -> np.ndarray:
+    """View of a shared array, attaching the block on first use"""
+    name, dtype, length = spec
+    block = _attached.get(name)
+    if block is None:
+        block = _attached[name] = SharedMemory(name=name)
+    return np.ndarray((length,), dtype=np.dtype(dtype), buffer=block.buf)
+
+
+def _detach(names: List[str]):
+    """Drop attachments to blocks that are no longer in use"""
+    for name in names:
+        block = _attached.pop(name, None)
+        if block is not None:
+            block.close()
+
+
+def score_shard(specs: Dict[str, ArraySpec], output: ArraySpec, criteria: Dict[str, Any],
+                start: int, stop: int, k: int, stale: List[str]) -> ScoreAccumulator:
+    """
+    Score candidates start:stop in a worker process.
+
+    Columns are read from and scores written to shared memory, so only
+    the criteria and the shard's accumulator cross the process boundary.
+    """
+    _detach(stale)
+    columns = {param_id: _attach(spec)[start:stop] for param_id, spec in specs.items()}
+    scores = score_candidates(columns, criteria)
+
+    name, dtype, length = output
+    block = SharedMemory(name=name)
+    try:
+        np.ndarray((length,), dtype=np.dtype(dtype), buffer=block.buf)[start:stop] = scores
+    finally:
+        block.close()
+
+    accumulator = ScoreAccumulator(k)
+    accumulator.add(scores, offset=start)
+    return accumulator
+
+
+class ShardedScorer:
+    """
+    Process pool that scores candidate stores in parallel shards.
+
+    Each store version's columns are exported to shared memory once and
+    kept for the most recently used stores; workers attach to the blocks
+    by name and keep them mapped between requests. Blocks are removed
+    only once no score() call is using them.
+    """
+
+    def __init__(self, workers: int):
+        self.workers = workers
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._shared: "OrderedDict[tuple, SharedColumns]" = OrderedDict()
+        self._retired: List[SharedColumns] = []
+        self._stale: List[str] = []
+        self._lock = threading.Lock()
+
+    def _acquire(self, store) -> Tuple[ProcessPoolExecutor, SharedColumns, List[str]]:
+        with self._lock:
+            if self._pool is None:
+                # Spawned workers do not inherit the server's threads and locks
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.workers, mp_context=multiprocessing.get_context("spawn")
+                )
+            key = (id(store), store.version)
+            shared = self._shared.get(key)
+            if shared is None:
+                shared = self._shared[key] = SharedColumns(store.columns)
+                logger.info(f"Exported {len(store)} candidates to shared memory for {self.workers} workers")
+                while len(self._shared) > MAX_SHARED_STORES:
+                    _, evicted = self._shared.popitem(last=False)
+                    self._retired.append(evicted)
+                self._close_retired()
+            self._shared.move_to_end(key)
+            shared.users += 1
+            return self._pool, shared, list(self._stale)
+
+    def _release(self, shared: SharedColumns):
+        with self._lock:
+            shared.users -= 1
+            self._close_retired()
+
+    def _close_retired(self):
+        # Blocks of evicted stores go once their last shards finished; workers then detach them
+        for shared in [shared for shared in self._retired if shared.users == 0]:
+            self._stale = (self._stale + [spec[0] for spec in shared.specs.values()])[-64:]
+            shared.close()
+            self._retired.remove(shared)
+
+    def score(self, store, criteria: Dict[str, Any], k: int = 10) -> Tuple[np.ndarray, ScoreAccumulator]:
+        """Scores of every candidate and their merged accumulator"""
+        pool, shared, stale = self._acquire(store)
+        count = len(store)
+        output = SharedMemory(create=True, size=max(count * 8, 1))
+        try:
+            shard_size = -(-count // self.workers)
+            futures = [
+                pool.submit(score_shard, shared.specs, (output.name, '<f8', count), criteria,
+                            start, min(start + shard_size, count), k, stale)
+                for start in range(0, count, shard_size)
+            ]
+            try:
+                accumulator = ScoreAccumulator(k)
+                for future in futures:
+                    accumulator.merge(future.result())
+            finally:
+                # Shards that have not run yet must not read blocks that are about to be removed
+                for future in futures:
+                    future.cancel()
+                for future in futures:
+                    if not future.cancelled():
+                        future.exception()
+            scores = np.ndarray((count,), dtype=np.float64, buffer=output.buf).copy()
+        except BrokenProcessPool:
+            logger.error("Scoring worker died, restarting the process pool")
+            self.shutdown()
+            raise
+        finally:
+            output.close()
+            output.unlink()
+            self._release(shared)
+        return scores, accumulator
+
+    def shutdown(self):
+        """Stop the workers and remove shared memory"""
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown(cancel_futures=True)
+                self._pool = None
+            for shared in list(self._shared.values()) + self._retired:
+                shared.close()
+            self._shared.clear()
+            self._retired = []
+            self._stale = []
+
+
+_scorer: Optional[ShardedScorer] = None
+_scorer_lock = threading.Lock()
+
+
+def use_parallel(candidate_count: int) -> bool:
+    """Whether an analysis of this size should be sharded across processes"""
+    return settings.parallel_scoring_workers > 1 and candidate_count >= settings.parallel_scoring_min_candidates
+
+
+def get_scorer() -> ShardedScorer:
+    """Return the process-wide sharded scorer, creating it if needed"""
+    global _scorer
+    if _scorer is None:
+        with _scorer_lock:
+            if _scorer is None:
+                _scorer = ShardedScorer(settings.parallel_scoring_workers)
+    return _scorer
+
+
+def shutdown_scorer():
+    """Stop the sharded scorer if it was started"""
+    global _scorer
+    with _scorer_lock:
+        if _scorer is not None:
+            _scorer.shutdown()
+            _scorer = None
+
+
+atexit.register(shutdown_scorer)
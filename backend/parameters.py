@@ -0,0 +1,77 @@
+"""
+Restaurant location analysis parameters for Monasib backend
+"""
+
+
+# Restaurant location analysis parameters
+RESTAURANT_PARAMETERS = {
+    'competitors': {
+        'name': 'Competitors Distance',
+        'type': 'distance',
+        'weight_factor': 0.15,
+        'optimal_range': (300, 800),  # meters
+        'source_layer': 'restaurants'
+    },
+    'foot_traffic': {
+        'name': 'Foot Traffic Density', 
+        'type': 'scale',
+        'weight_factor': 0.20,
+        'optimal_range': (6, 10),
+        'source_layer': 'high_traffic_areas'
+    },
+    'public_transport': {
+        'name': 'Public Transport Access',
+        'type': 'distance', 
+        'weight_factor': 0.12,
+        'optimal_range': (100, 400),  # meters
+        'source_layer': 'transport_stops'
+    },
+    'parking': {
+        'name': 'Parking Availability',
+        'type': 'scale',
+        'weight_factor': 0.10,
+        'optimal_range': (5, 10),
+        'source_layer': 'parking_lots'
+    },
+    'rent_cost': {
+        'name': 'Rental Cost',
+        'type': 'scale',
+        'weight_factor': 0.18,
+        'optimal_range': (1, 6),  # Lower is better
+        'inverted': True
+    },
+    'population_density': {
+        'name': 'Population Density',
+        'type': 'scale',
+        'weight_factor': 0.15,
+        'optimal_range': (6, 10),
+        'source_layer': 'residential_areas'
+    },
+    'office_buildings': {
+        'name': 'Office Buildings Proximity',
+        'type': 'distance',
+        'weight_factor': 0.08,
+        'optimal_range': (200, 1000),  # meters
+        'source_layer': 'office_buildings'
+    },
+    'shopping_centers': {
+        'name': 'Shopping Centers',
+        'type': 'distance', 
+        'weight_factor': 0.10,
+        'optimal_range': (300, 800),  # meters
+        'source_layer': 'shopping_areas'
+    },
+    'safety_level': {
+        'name': 'Safety Level',
+        'type': 'scale',
+        'weight_factor': 0.07,
+        'optimal_range': (7, 10),
+        'source_layer': 'safety_zones'
+    },
+    'visibility': {
+        'name': 'Street Visibility',
+        'type': 'scale',
+        'weight_factor': 0.05,
+        'optimal_range': (6, 10)
+    }
+}
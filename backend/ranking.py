@@ -0,0 +1,90 @@
+"""
+Top-k selection and score statistics for Monasib backend
+"""
+import numpy as np
+from typing import Any, Dict, Tuple
+
+
+# Rounded scores 0.00-100.00 in steps of 0.01
+SCORE_BINS = 10001
+SUITABLE_SCORE = 60
+
+
+def select_top(index: np.ndarray, scores: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Pick the k best candidates without sorting the full array.
+
+    Candidates rank by score rounded to 2 decimals, highest first, with
+    ties broken by candidate index. This matches a stable full sort.
+    """
+    rounded = np.round(scores, 2)
+    if len(index) > k:
+        if k <= 0:
+            return index[:0], scores[:0]
+        kth = np.partition(rounded, len(rounded) - k)[len(rounded) - k]
+        above = np.flatnonzero(rounded > kth)
+        ties = np.flatnonzero(rounded == kth)
+        need = k - len(above)
+        if need < len(ties):
+            ties = ties[np.argpartition(index[ties], need - 1)[:need]]
+        keep = np.concatenate([above, ties])
+        index, scores, rounded = index[keep], scores[keep], rounded[keep]
+
+    order = np.lexsort((index, -rounded))
+    return index[order], scores[order]
+
+
+class ScoreAccumulator:
+    """
+    Running statistics and top-k over chunks of candidate scores.
+
+    Only candidates scoring above zero are counted. Statistics come from
+    a histogram of rounded scores, so chunks and shards merge exactly.
+    """
+
+    def __init__(self, k: int = 10):
+        self.k = k
+        self.histogram = np.zeros(SCORE_BINS, dtype=np.int64)
+        self.top_index = np.empty(0, dtype=np.int64)
+        self.top_scores = np.empty(0, dtype=np.float64)
+
+    def add(self, scores: np.ndarray, offset: int = 0):
+        """Fold in the scores of candidates offset .. offset + len(scores)"""
+        scored = np.flatnonzero(scores > 0)
+        values = scores[scored]
+        bins = np.rint(np.round(values, 2) * 100).astype(np.int64)
+        self.histogram += np.bincount(bins, minlength=SCORE_BINS)
+        self._merge_top(scored + offset, values)
+
+    def merge(self, other: "ScoreAccumulator"):
+        """Fold in another accumulator over a disjoint set of candidates"""
+        self.histogram += other.histogram
+        self._merge_top(other.top_index, other.top_scores)
+
+    def _merge_top(self, index: np.ndarray, scores: np.ndarray):
+        self.top_index, self.top_scores = select_top(
+            np.concatenate([self.top_index, index]),
+            np.concatenate([self.top_scores, scores]),
+            self.k
+        )
+
+    @property
+    def count(self) -> int:
+        return int(self.histogram.sum())
+
+    def summary(self) -> Dict[str, Any]:
+        """Scored and suitable counts with mean and median rounded score"""
+        count = self.count
+        if count == 0:
+            return {"scored": 0, "suitable": 0, "average_score": 0, "median_score": 0}
+
+        values = np.arange(SCORE_BINS) / 100
+        cumulative = np.cumsum(self.histogram)
+        lower = values[np.searchsorted(cumulative, (count - 1) // 2, side='right')]
+        upper = values[np.searchsorted(cumulative, count // 2, side='right')]
+        return {
+            "scored": count,
+            "suitable": int(self.histogram[SUITABLE_SCORE * 100:].sum()),
+            "average_score": round(float(np.dot(self.histogram, values) / count), 2),
+            "median_score": round(float((lower + upper) / 2), 2)
+        }
@@ -0,0 +1,547 @@
+"""
+Spatially partitioned multi-region datasets for Monasib backend
+"""
+import os
+import math
+import hashlib
+import threading
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+import pyogrio
+from typing import Any, BinaryIO, Dict, Iterator, List, Optional, Sequence, Set, Tuple
+
+from config import settings
+from logger import logger
+from cache import LayerCache, TTLCache
+from columnar import release
+from gpkg import FeatureTable, GeoPackage
+from feature_store import CandidateStore, get_candidate_store
+from ingest import LayerWriter, ingest_routed
+from aggregation import point_coordinates
+from density import KERNEL_TRUNCATE, padded_extent
+from streaming import encode_features
+from tiles import encode_layer, tile_features
+from surface import default_bbox
+
+
+Bbox = Tuple[float, float, float, float]
+
+PARTITION_DATABASE = "gis_data.gpkg"
+MAX_LATITUDE = 85.0511287798
+
+# Feature ids are unique across partitions: tile index above, partition fid in the low bits
+FID_BITS = 32
+FID_MASK = (1 << FID_BITS) - 1
+
+# Dataset versions of area stores start with this, followed by their bbox
+AREA_PREFIX = "area:"
+
+
+# Partition tiles
+
+def tile_xy(longitude: np.ndarray, latitude: np.ndarray, zoom: int) -> Tuple[np.ndarray, np.ndarray]:
+    """XYZ tile column and row of each lon/lat at a zoom level"""
+    n = 1 << zoom
+    lat = np.radians(np.clip(latitude, -MAX_LATITUDE, MAX_LATITUDE))
+    x = np.floor((np.asarray(longitude) + 180.0) / 360.0 * n)
+    y = np.floor((1.0 - np.log(np.tan(lat) + 1.0 / np.cos(lat)) / math.pi) / 2.0 * n)
+    return np.clip(x, 0, n - 1).astype(np.int64), np.clip(y, 0, n - 1).astype(np.int64)
+
+
+def tile_lonlat_bounds(z: int, x: int, y: int) -> Bbox:
+    """Lon/lat bounds of an XYZ tile"""
+    n = 1 << z
+
+    def latitude(row: int) -> float:
+        return math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * row / n))))
+
+    return x / n * 360.0 - 180.0, latitude(y + 1), (x + 1) / n * 360.0 - 180.0, latitude(y)
+
+
+def partition_key(z: int, x: int, y: int) -> str:
+    return f"{z}-{x}-{y}"
+
+
+def parse_partition_key(key: str) -> Tuple[int, int, int]:
+    z, x, y = (int(part) for part in key.split("-"))
+    return z, x, y
+
+
+def tile_index(key: str) -> int:
+    """Position of a partition in tile order"""
+    z, x, y = parse_partition_key(key)
+    return x * (1 << z) + y
+
+
+def candidates_path(directory: str) -> str:
+    """Candidate store of a partition, in the format of the main candidate store"""
+    extension = ".arrow" if settings.candidate_store_path.endswith(".arrow") else ".npz"
+    return os.path.join(directory, f"candidates{extension}")
+
+
+def partition_keys(bbox: Bbox, zoom: int) -> List[str]:
+    """Keys of every tile at `zoom` that a lon/lat bbox touches"""
+    x, y = tile_xy(np.array([bbox[0], bbox[2]]), np.array([bbox[3], bbox[1]]), zoom)
+    return [partition_key(zoom, col, row)
+            for col in range(x[0], x[1] + 1) for row in range(y[0], y[1] + 1)]
+
+
+def intersects(a: Bbox, b: Bbox) -> bool:
+    return a[0] <= b[2] and b[0] <= a[2] and a[1] <= b[3] and b[1] <= a[3]
+
+
+class Partition:
+    """One tile of the dataset with its own GeoPackage, layer cache and candidates"""
+
+    def __init__(self, key: str, directory: str, manager: Optional["PartitionManager"] = None):
+        self.key = key
+        self.tile_index = tile_index(key)
+        self.bounds = tile_lonlat_bounds(*parse_partition_key(key))
+        self.manager = manager
+        self.directory = directory
+        self.db_path = os.path.join(directory, PARTITION_DATABASE)
+        self.candidates_path = candidates_path(directory)
+        self.gpkg = GeoPackage(self.db_path)
+        self.layers = LayerCache(self.db_path, max_bytes=settings.partition_max_memory_mb * 1024 * 1024)
+        self._store: Optional[CandidateStore] = None
+        self._lock = threading.Lock()
+
+    def feature_id(self, fid: int) -> int:
+        """Id of a partition feature that is unique across partitions"""
+        return (self.tile_index << FID_BITS) | int(fid)
+
+    def feature_table(self, layer_name: str) -> Optional[FeatureTable]:
+        return self.gpkg.feature_table(layer_name) if os.path.exists(self.db_path) else None
+
+    @property
+    def store(self) -> CandidateStore:
+        """Candidates of the partition, loaded on first use and re-derived when its or its neighbours' layers change"""
+        with self._lock:
+            if self._store is None:
+                self._store = self._load_store()
+            try:
+                if len(self._store) and os.path.exists(self.db_path):
+                    neighbours, halo = self.neighbours()
+                    if self._store.derive_distances(self.db_path, neighbours, halo):
+                        self._store.save(self.candidates_path)
+            except Exception as e:
+                logger.warning(f"Deriving candidates of partition {self.key} failed: {str(e)}")
+            return self._store
+
+    def neighbours(self) -> Tuple[List[str], Optional[Bbox]]:
+        """
+        GeoPackages of the other partitions near this tile, with the halo bbox
+        their features are read from when deriving the candidates' columns.
+
+        The halo reaches partition_halo_m past the tile, and at least the
+        density kernel radius, so candidates near the edge see the closest
+        features across it.
+        """
+        if self.manager is None:
+            return [], None
+        halo_m = max(settings.partition_halo_m, KERNEL_TRUNCATE * settings.density_bandwidth_m)
+        minx, miny, maxx, maxy = self.bounds
+        halo = padded_extent(np.array([minx, maxx]), np.array([miny, maxy]), halo_m)
+        paths = [os.path.join(self.manager.path(key), PARTITION_DATABASE)
+                 for key in self.manager.covering(halo) if key != self.key]
+        return paths, halo
+
+    def _load_store(self) -> CandidateStore:
+        if os.path.exists(self.candidates_path):
+            try:
+                return CandidateStore.load(self.candidates_path)
+            except Exception as e:
+                logger.warning(f"Could not load candidates of partition {self.key}: {str(e)}")
+
+        # Partitions built from uploads score their potential_locations layer
+        ids, longitude, latitude = np.empty(0, dtype=np.int64), np.empty(0), np.empty(0)
+        if self.feature_table("potential_locations") is not None:
+            gdf = pyogrio.read_dataframe(self.db_path, layer="potential_locations", columns=[], fid_as_index=True)
+            longitude, latitude = point_coordinates(gdf)
+            ids = (self.tile_index << FID_BITS) | gdf.index.to_numpy(dtype=np.int64)
+        return CandidateStore.from_points(ids, latitude, longitude, seed=settings.candidate_seed)
+
+    @property
+    def nbytes(self) -> int:
+        return self.layers.nbytes + (self._store.nbytes if self._store is not None else 0)
+
+    def close(self):
+        """Release connections and cached data; the partition reopens lazily if still referenced"""
+        self.gpkg.close()
+        self.layers.clear()
+        release(self.db_path)
+
+
+class PartitionManager:
+    """
+    Partitions opened on first use and closed least recently used first.
+
+    Only the partitions a request touches are opened. The coldest ones
+    are closed once more than `max_open` are open or their layers and
+    candidates use more than `max_bytes`.
+    """
+
+    def __init__(self, directory: str, zoom: int, max_open: int, max_bytes: int):
+        self.directory = directory
+        self.zoom = zoom
+        self.max_open = max_open
+        self.max_bytes = max_bytes
+        self._open: "OrderedDict[str, Partition]" = OrderedDict()
+        self._keys: List[str] = []
+        self._scanned: Optional[float] = None
+        self._layer_names: Set[str] = set()
+        self._layers_stamp: Optional[tuple] = None
+        self._lock = threading.RLock()
+        self.opened = 0
+        self.evicted = 0
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.directory, key)
+
+    def keys(self) -> List[str]:
+        """Keys of the partitions on disk, rescanned when the partition directory changes"""
+        try:
+            mtime = os.path.getmtime(self.directory)
+        except OSError:
+            return []
+        with self._lock:
+            if mtime != self._scanned:
+                self._keys = sorted(
+                    name for name in os.listdir(self.directory)
+                    if name.startswith(f"{self.zoom}-") and os.path.exists(os.path.join(self.path(name), PARTITION_DATABASE))
+                )
+                self._scanned = mtime
+            return self._keys
+
+    def layer_names(self) -> Set[str]:
+        """Layers held by any partition, re-read when a partition's GeoPackage changes"""
+        paths = [os.path.join(self.path(key), PARTITION_DATABASE) for key in self.keys()]
+        stamp = tuple((path, os.path.getmtime(path)) for path in paths if os.path.exists(path))
+        with self._lock:
+            if stamp != self._layers_stamp:
+                names = set()
+                for path, _ in stamp:
+                    names.update(pyogrio.list_layers(path)[:, 0])
+                self._layer_names, self._layers_stamp = names, stamp
+            return self._layer_names
+
+    def covering(self, bbox: Bbox) -> List[str]:
+        """Existing partitions a bbox touches, in tile index order"""
+        existing = self.keys()
+        candidates = partition_keys(bbox, self.zoom)
+        if len(candidates) <= len(existing):
+            keys = set(existing).intersection(candidates)
+        else:
+            keys = [key for key in existing if intersects(tile_lonlat_bounds(*parse_partition_key(key)), bbox)]
+        return sorted(keys, key=tile_index)
+
+    def get(self, key: str) -> Partition:
+        """An open partition, opening it and closing cold ones as needed"""
+        with self._lock:
+            partition = self._open.get(key)
+            if partition is not None:
+                self._open.move_to_end(key)
+                return partition
+            partition = Partition(key, self.path(key), self)
+            self._open[key] = partition
+            self.opened += 1
+            self._evict()
+            return partition
+
+    def area(self, bbox: Bbox) -> List[Partition]:
+        """Open partitions covering a bbox"""
+        return [self.get(key) for key in self.covering(bbox)]
+
+    def _evict(self):
+        while len(self._open) > 1 and (
+                len(self._open) > self.max_open or
+                sum(partition.nbytes for partition in self._open.values()) > self.max_bytes):
+            key, partition = self._open.popitem(last=False)
+            partition.close()
+            self.evicted += 1
+            logger.info(f"Closed cold partition {key}")
+
+    def invalidate(self, keys: Sequence[str]):
+        """Close partitions whose files were rewritten, so they reload on next use"""
+        with self._lock:
+            for key in keys:
+                partition = self._open.pop(key, None)
+                if partition is not None:
+                    partition.close()
+            self._scanned = None
+
+    def clear(self):
+        with self._lock:
+            self.invalidate(list(self._open))
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "partitions": len(self.keys()),
+                "open": len(self._open),
+                "open_keys": list(self._open),
+                "size_mb": round(sum(partition.nbytes for partition in self._open.values()) / 1024 / 1024, 2),
+                "opened": self.opened,
+                "evicted": self.evicted
+            }
+
+
+partitions = PartitionManager(
+    settings.partition_dir,
+    settings.partition_zoom,
+    settings.partition_max_open,
+    settings.partition_max_memory_mb * 1024 * 1024
+)
+
+
+# Writing partitions
+
+def route_by_partition(gdf: gpd.GeoDataFrame) -> Iterator[Tuple[str, gpd.GeoDataFrame]]:
+    """Split features by the partition of their representative point, as (db_path, frame) pairs"""
+    longitude, latitude = point_coordinates(gdf)
+    valid = np.isfinite(longitude) & np.isfinite(latitude)
+    x, y = tile_xy(longitude[valid], latitude[valid], partitions.zoom)
+    rows = np.flatnonzero(valid)
+    for col, row in np.unique(np.stack([x, y], axis=1), axis=0) if len(rows) else ():
+        directory = partitions.path(partition_key(partitions.zoom, int(col), int(row)))
+        os.makedirs(directory, exist_ok=True)
+        index = rows[(x == col) & (y == row)]
+        yield os.path.join(directory, PARTITION_DATABASE), gdf.iloc[index].reset_index(drop=True)
+
+
+def _key_of(db_path: str) -> str:
+    return os.path.basename(os.path.dirname(db_path))
+
+
+def ingest_partitioned(stream: BinaryIO, extension: str, layer_name: str, mode: str = "append",
+                       source_crs: Optional[str] = None) -> Dict[str, Any]:
+    """Ingest an upload into the partitions its features fall in"""
+    touched = set()
+
+    def route(gdf: gpd.GeoDataFrame) -> Iterator[Tuple[str, gpd.GeoDataFrame]]:
+        for path, part in route_by_partition(gdf):
+            touched.add(path)
+            yield path, part
+
+    # Replacing a layer empties it in partitions the upload does not reach
+    existing = [os.path.join(partitions.path(key), PARTITION_DATABASE) for key in partitions.keys()]
+    summary = ingest_routed(stream, extension, layer_name, route, mode, source_crs,
+                            replace_in=existing if mode == "replace" else ())
+    changed = touched.union(existing) if mode == "replace" and touched else touched
+    partitions.invalidate(sorted({_key_of(path) for path in changed}))
+    return {**summary, "partitions": sorted(_key_of(path) for path in touched)}
+
+
+def partition_database(db_path: str, store: Optional[CandidateStore] = None,
+                       chunk_size: Optional[int] = None) -> List[str]:
+    """
+    Split every layer of a GeoPackage, and optionally a candidate store, into partitions.
+
+    Layers are read and written in chunks, so a country-sized database is
+    split without being loaded whole.
+    """
+    chunk_size = chunk_size or settings.ingest_batch_size
+    writers: Dict[Tuple[str, str], LayerWriter] = {}
+    for layer_name in pyogrio.list_layers(db_path)[:, 0]:
+        total = pyogrio.read_info(db_path, layer=layer_name)["features"]
+        for start in range(0, total, chunk_size):
+            gdf = pyogrio.read_dataframe(db_path, layer=layer_name, skip_features=start, max_features=chunk_size)
+            if gdf.crs is not None and gdf.crs.to_epsg() != 4326:
+                gdf = gdf.to_crs("EPSG:4326")
+            for path, part in route_by_partition(gdf):
+                writer = writers.get((path, layer_name))
+                if writer is None:
+                    writer = writers[(path, layer_name)] = LayerWriter(path, layer_name, "replace")
+                writer.write(part)
+
+    if store is not None and len(store):
+        x, y = tile_xy(store.longitude, store.latitude, partitions.zoom)
+        for col, row in np.unique(np.stack([x, y], axis=1), axis=0):
+            key = partition_key(partitions.zoom, int(col), int(row))
+            os.makedirs(partitions.path(key), exist_ok=True)
+            part = store.subset(np.flatnonzero((x == col) & (y == row)))
+            part.distance_source_mtime = None  # Derived again from the partition's and its neighbours' layers
+            part.save(candidates_path(partitions.path(key)))
+
+    partitions.clear()
+    keys = partitions.keys()
+    logger.info(f"Split {db_path} into {len(keys)} partitions at zoom {partitions.zoom}")
+    return keys
+
+
+# Request areas
+
+def resolve_area(region: Optional[str] = None, bbox: Optional[Sequence[float]] = None) -> Optional[Bbox]:
+    """
+    The lon/lat bbox a request covers: a named region, a bbox, or their
+    intersection when both are given. None when neither is.
+    """
+    area = None
+    if region is not None:
+        if region not in settings.regions:
+            raise ValueError(f"Unknown region '{region}'")
+        area = tuple(settings.regions[region])
+    if bbox is not None:
+        bbox = tuple(float(v) for v in bbox)
+        if len(bbox) != 4 or not (bbox[0] < bbox[2] and bbox[1] < bbox[3]):
+            raise ValueError("bbox must be minx,miny,maxx,maxy")
+        if area is not None:
+            bbox = (max(area[0], bbox[0]), max(area[1], bbox[1]), min(area[2], bbox[2]), min(area[3], bbox[3]))
+            if not (bbox[0] < bbox[2] and bbox[1] < bbox[3]):
+                raise ValueError(f"bbox lies outside region '{region}'")
+        area = bbox
+    return tuple(round(v, 6) for v in area) if area is not None else None
+
+
+# Candidates of recent areas, keyed by dataset version
+area_stores = TTLCache(
+    ttl=settings.cache_ttl,
+    max_bytes=settings.area_cache_max_memory_mb * 1024 * 1024
+)
+
+
+def area_store(bbox: Bbox) -> CandidateStore:
+    """Candidates inside a bbox, gathered from the partitions it touches or from the single store"""
+    if settings.partitions_enabled:
+        sources = [(partition.key, partition.store) for partition in partitions.area(bbox)]
+    else:
+        sources = [("", get_candidate_store())]
+    digest = hashlib.sha1(repr([(key, store.version) for key, store in sources]).encode()).hexdigest()[:16]
+    dataset = f"{AREA_PREFIX}{','.join(repr(v) for v in bbox)}:{digest}"
+
+    def build() -> CandidateStore:
+        return CandidateStore.concat([store.subset(store.within(bbox)) for _, store in sources], dataset)
+
+    if not settings.cache_enabled:
+        return build()
+    return area_stores.get_or_compute(dataset, build, size_of=lambda store: store.nbytes)
+
+
+def request_store(region: Optional[str] = None, bbox: Optional[Sequence[float]] = None) -> CandidateStore:
+    """
+    Candidates a request covers. Without a region or bbox this is the
+    whole store, or the default area when the dataset is partitioned.
+    """
+    area = resolve_area(region, bbox)
+    if area is None:
+        if not settings.partitions_enabled:
+            return get_candidate_store()
+        area = default_bbox()
+    return area_store(area)
+
+
+def dataset_store(dataset: Optional[str]) -> Optional[CandidateStore]:
+    """The candidates an analysis was scored against, or None if they have changed since"""
+    if not dataset or not dataset.startswith(AREA_PREFIX):
+        return get_candidate_store()
+    bbox = tuple(float(v) for v in dataset[len(AREA_PREFIX):].split(":")[0].split(","))
+    store = area_store(bbox)
+    return store if store.version == dataset else None
+
+
+# Layers of an area
+
+def layer_sources(layer_name: str, bbox: Optional[Bbox]) -> List[Tuple[Partition, FeatureTable]]:
+    """Partitions of an area that hold a layer, with its table in each"""
+    sources = []
+    for partition in partitions.area(bbox or default_bbox()):
+        table = partition.feature_table(layer_name)
+        if table is not None:
+            sources.append((partition, table))
+    return sources
+
+
+def layers_version(sources: List[Tuple[Partition, FeatureTable]]) -> str:
+    """Content version of a layer over several partitions"""
+    return "|".join(f"{partition.key}@{partition.gpkg.last_change(table.name)}" for partition, table in sources)
+
+
+def describe_layers(bbox: Optional[Bbox]) -> Dict[str, Dict[str, Any]]:
+    """Layer metadata of an area, merged across its partitions"""
+    layers: Dict[str, Dict[str, Any]] = {}
+    for partition in partitions.area(bbox or default_bbox()):
+        if not os.path.exists(partition.db_path):
+            continue
+        for name, layer in partition.gpkg.layers().items():
+            merged = layers.get(name)
+            if merged is None:
+                layers[name] = dict(layer)
+                continue
+            merged["feature_count"] += layer["feature_count"]
+            if layer["geometry_type"] != merged["geometry_type"]:
+                merged["geometry_type"] = "Geometry"
+            if layer["bounds"] is not None:
+                bounds = merged["bounds"] or layer["bounds"]
+                merged["bounds"] = [min(bounds[0], layer["bounds"][0]), min(bounds[1], layer["bounds"][1]),
+                                    max(bounds[2], layer["bounds"][2]), max(bounds[3], layer["bounds"][3])]
+            merged["last_change"] = max(merged["last_change"] or "", layer["last_change"] or "")
+    return layers
+
+
+def read_area_layer(sources: List[Tuple[Partition, FeatureTable]], layer_name: str) -> gpd.GeoDataFrame:
+    """A layer over several partitions as one frame, each part from its partition's cache"""
+    frames = [partition.layers.get(layer_name) for partition, _ in sources]
+    if len(frames) == 1:
+        return frames[0]
+    return gpd.GeoDataFrame(pd.concat(frames, ignore_index=True), crs=frames[0].crs)
+
+
+def stream_area_collection(sources: List[Tuple[Partition, FeatureTable]], columns: Sequence[str],
+                           bbox: Optional[Bbox] = None, cursor: Optional[int] = None,
+                           limit: Optional[int] = None, batch_size: int = 1000) -> Iterator[bytes]:
+    """
+    Stream a layer over several partitions as one GeoJSON FeatureCollection.
+
+    Partitions are read in tile order and feature ids carry their tile,
+    so a cursor resumes in the partition it stopped in.
+    """
+    after_tile, after_fid = (cursor >> FID_BITS, cursor & FID_MASK) if cursor is not None else (-1, None)
+
+    yield b'{"type": "FeatureCollection", "features": ['
+    sent, last_id, has_more = 0, None, False
+    for partition, table in sources:
+        if partition.tile_index < after_tile:
+            continue
+        present = [name for name in columns if name in table.columns]
+        indexed = bbox is None or table.rtree is not None
+        remaining = None if limit is None else limit - sent
+        batches = partition.gpkg.iter_features(
+            table, present, bbox=bbox if indexed else None,
+            after=after_fid if partition.tile_index == after_tile else None,
+            limit=remaining + 1 if remaining is not None and indexed else None,
+            batch_size=batch_size
+        )
+        try:
+            for rows in batches:
+                rows = [(partition.feature_id(row[0]), *row[1:]) for row in rows]
+                features = encode_features(rows, present, bbox=None if indexed else bbox)
+                if limit is not None and len(features) > limit - sent:
+                    features = features[:limit - sent]
+                    has_more = True
+                if features:
+                    yield ((", " if sent else "") + ", ".join(f for _, f in features)).encode()
+                    sent += len(features)
+                    last_id = features[-1][0]
+                if has_more:
+                    break
+        finally:
+            batches.close()
+        if has_more:
+            break
+    yield b"]"
+
+    if has_more:
+        yield f', "next_cursor": {last_id}'.encode()
+    yield b"}"
+
+
+def render_area_tile(sources: List[Tuple[Partition, FeatureTable]], layer_name: str,
+                     z: int, x: int, y: int, extent: int = 4096) -> bytes:
+    """One vector tile of a layer drawn from every partition under it"""
+    features = []
+    for partition, table in sources:
+        features.extend((partition.feature_id(fid), properties, geom_type, commands)
+                        for fid, properties, geom_type, commands in tile_features(partition.gpkg, table, z, x, y, extent))
+    return encode_layer(layer_name, features, extent) if features else b""
@@ -0,0 +1,116 @@
+"""
+Vectorized suitability scoring engine for Monasib backend
+"""
+import numpy as np
+from typing import Dict, Any, List, Optional
+
+from parameters import RESTAURANT_PARAMETERS
+
+
+def locations_to_columns(locations: List[Dict[str, Any]]) -> Dict[str, np.ndarray]:
+    """Convert a list of location dicts into one array per parameter"""
+    return {
+        param_id: np.array(
+            [location['parameters'].get(param_id, 0) for location in locations],
+            dtype=np.float64
+        )
+        for param_id in RESTAURANT_PARAMETERS
+    }
+
+
+def score_parameter(values: np.ndarray, param_config: Dict[str, Any], threshold) -> np.ndarray:
+    """Score one parameter (0-100) for every candidate at once"""
+    values = np.asarray(values, dtype=np.float64)
+
+    if param_config['type'] == 'distance':
+        # For distance: closer to user threshold is better
+        if threshold == 0:
+            raise ZeroDivisionError("Distance threshold must be non-zero")
+        return np.where(
+            values <= threshold,
+            100 - (values / threshold * 50),
+            np.maximum(0, 50 - ((values - threshold) / threshold * 50))
+        )
+
+    if param_config.get('inverted'):
+        # Lower is better (like rent cost)
+        return np.maximum(0, 100 - (values / 10 * 100))
+
+    # Higher is better; a zero threshold is always met
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(values >= threshold, 100.0, (values / threshold) * 100)
+
+
+def score_candidates(columns: Dict[str, np.ndarray], criteria: Dict[str, Any]) -> np.ndarray:
+    """
+    Calculate suitability scores for all candidates.
+
+    Scores every candidate in one pass, with every parameter held as a
+    column array.
+    """
+    count = len(next(iter(columns.values()))) if columns else 0
+    total_score = np.zeros(count, dtype=np.float64)
+    total_weight = 0
+
+    for param_id, param_criteria in criteria.items():
+        if param_id not in RESTAURANT_PARAMETERS:
+            continue
+
+        values = columns.get(param_id)
+        if values is None:
+            values = np.zeros(count, dtype=np.float64)
+        user_weight = param_criteria['weight']
+        user_threshold = param_criteria['value']
+
+        param_score = score_parameter(values, RESTAURANT_PARAMETERS[param_id], user_threshold)
+        total_score += param_score * (user_weight / 100)
+        total_weight += user_weight
+
+    # Normalize to 100% scale
+    if total_weight > 0:
+        return np.minimum(100, (total_score / total_weight) * 100)
+    return np.zeros(count, dtype=np.float64)
+
+
+def score_batch(columns: Dict[str, np.ndarray], criteria_list: List[Dict[str, Any]],
+                start: int = 0, stop: Optional[int] = None) -> np.ndarray:
+    """
+    Calculate suitability scores for several criteria sets in one pass.
+
+    Each distinct (parameter, threshold) pair is scored once into a
+    candidates x pairs matrix, which is multiplied by a pairs x scenarios
+    weight matrix. Returns a candidates x scenarios array for the rows
+    start:stop, equal to score_candidates up to floating point rounding.
+    """
+    pairs: Dict[tuple, int] = {}
+    weights = []
+    total_weights = np.zeros(len(criteria_list), dtype=np.float64)
+
+    for k, criteria in enumerate(criteria_list):
+        for param_id, param_criteria in criteria.items():
+            if param_id not in RESTAURANT_PARAMETERS:
+                continue
+            j = pairs.setdefault((param_id, param_criteria['value']), len(pairs))
+            weights.append((j, k, param_criteria['weight'] / 100))
+            total_weights[k] += param_criteria['weight']
+
+    count = len(next(iter(columns.values()))) if columns else 0
+    stop = count if stop is None else min(stop, count)
+    rows = max(stop - start, 0)
+
+    weight_matrix = np.zeros((len(pairs), len(criteria_list)), dtype=np.float64)
+    for j, k, weight in weights:
+        weight_matrix[j, k] += weight
+
+    param_scores = np.empty((rows, len(pairs)), dtype=np.float64)
+    for (param_id, threshold), j in pairs.items():
+        values = columns.get(param_id)
+        values = values[start:stop] if values is not None else np.zeros(rows, dtype=np.float64)
+        param_scores[:, j] = score_parameter(values, RESTAURANT_PARAMETERS[param_id], threshold)
+
+    total_score = param_scores @ weight_matrix
+
+    # Normalize to 100% scale
+    with np.errstate(divide='ignore', invalid='ignore'):
+        normalized = np.minimum(100, (total_score / total_weights) * 100)
+    return np.where(total_weights > 0, normalized, 0.0)
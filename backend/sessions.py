@@ -0,0 +1,190 @@
+"""
+Interactive analysis sessions with incremental re-scoring for Monasib backend
+"""
+import uuid
+import threading
+import numpy as np
+from typing import Any, Dict, Iterable, Optional
+
+from config import settings
+from cache import TTLCache
+from feature_store import CandidateStore
+from parameters import RESTAURANT_PARAMETERS
+from ranking import ScoreAccumulator
+from scoring import score_parameter
+from analysis import AnalysisResult, analysis_key, result_cache, summarize_analysis
+
+
+# Delta updates between full re-sums of the partial scores, bounding rounding drift
+RESUM_INTERVAL = 256
+
+
+def check_criterion(param_id: str, param_criteria: Any):
+    """Raise ValueError unless a criterion has a numeric value and weight"""
+    if not isinstance(param_criteria, dict):
+        raise ValueError(f"Criterion '{param_id}' must be an object with a value and a weight")
+    for key in ('value', 'weight'):
+        value = param_criteria.get(key)
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            raise ValueError(f"Criterion '{param_id}' needs a numeric {key}")
+
+
+class AnalysisSession:
+    """
+    Scores of one user's criteria, kept as per-parameter partial scores.
+
+    Changing one criterion adjusts the weighted total by that parameter's
+    difference instead of re-scoring every parameter.
+    """
+
+    def __init__(self, session_id: str, store: CandidateStore, criteria: Dict[str, Any]):
+        self.session_id = session_id
+        self.store = store
+        self.criteria: Dict[str, Any] = {}
+        self.partials: Dict[str, np.ndarray] = {}
+        self.total = np.zeros(len(store), dtype=np.float64)
+        self.total_weight = 0.0
+        self.updates = 0
+        self.version = store.version
+        self.lock = threading.Lock()
+        self.update(criteria)
+
+    @property
+    def nbytes(self) -> int:
+        """Approximate memory held by the session"""
+        return self.total.nbytes * (len(self.partials) + 2)
+
+    def _set_criterion(self, param_id: str, param_criteria: Dict[str, Any], new_partial: Optional[np.ndarray]):
+        previous = self.criteria.get(param_id)
+        self.criteria[param_id] = param_criteria
+        if param_id not in RESTAURANT_PARAMETERS:
+            return
+
+        weight = param_criteria['weight']
+        partial = self.partials.get(param_id)
+        if previous is None or partial is None:
+            self.partials[param_id] = new_partial
+            self.total += new_partial * (weight / 100)
+        elif new_partial is not None:
+            # Threshold moved: swap in the re-scored parameter
+            self.total += new_partial * (weight / 100) - partial * (previous['weight'] / 100)
+            self.partials[param_id] = new_partial
+        elif previous['weight'] != weight:
+            # Only the weight moved: rescale the existing partial score
+            self.total += partial * ((weight - previous['weight']) / 100)
+        else:
+            return
+        self.total_weight += weight - (previous['weight'] if previous is not None else 0)
+
+    def _remove_criterion(self, param_id: str):
+        previous = self.criteria.pop(param_id, None)
+        partial = self.partials.pop(param_id, None)
+        if previous is None or partial is None:
+            return
+        self.total -= partial * (previous['weight'] / 100)
+        self.total_weight -= previous['weight']
+
+    def _score(self, param_id: str, param_criteria: Dict[str, Any]) -> np.ndarray:
+        values = self.store.columns.get(param_id)
+        if values is None:
+            values = np.zeros(len(self.store), dtype=np.float64)
+        try:
+            return score_parameter(values, RESTAURANT_PARAMETERS[param_id], param_criteria['value'])
+        except ZeroDivisionError as e:
+            raise ValueError(f"Invalid criterion '{param_id}': {str(e)}")
+
+    def _rescored(self, criteria: Dict[str, Any], rescore_all: bool) -> Dict[str, np.ndarray]:
+        """
+        Partial scores of the criteria that are new or whose threshold moved.
+
+        Raises ValueError on an invalid criterion before the session is touched.
+        """
+        partials = {}
+        for param_id, param_criteria in criteria.items():
+            if param_id not in RESTAURANT_PARAMETERS:
+                continue
+            check_criterion(param_id, param_criteria)
+            previous = self.criteria.get(param_id)
+            if (rescore_all or previous is None or param_id not in self.partials or
+                    previous['value'] != param_criteria['value']):
+                partials[param_id] = self._score(param_id, param_criteria)
+        return partials
+
+    def _resum(self):
+        """Rebuild the weighted total from the partial scores"""
+        self.total = np.zeros(len(self.store), dtype=np.float64)
+        for param_id, partial in self.partials.items():
+            self.total += partial * (self.criteria[param_id]['weight'] / 100)
+        self.total_weight = float(sum(self.criteria[param_id]['weight'] for param_id in self.partials))
+
+    def update(self, criteria: Dict[str, Any], remove: Iterable[str] = ()):
+        """Apply changed or added criteria and drop removed ones, all or nothing"""
+        remove = [param_id for param_id in remove if param_id not in criteria]
+        rescore_all = self.version != self.store.version
+        if rescore_all:
+            # Candidate data changed under the session: score everything again
+            kept = {param_id: value for param_id, value in self.criteria.items() if param_id not in remove}
+            criteria, remove = {**kept, **criteria}, []
+        partials = self._rescored(criteria, rescore_all)
+
+        if rescore_all:
+            self.criteria, self.partials = {}, {}
+            self.total = np.zeros(len(self.store), dtype=np.float64)
+            self.total_weight = 0.0
+            self.version = self.store.version
+        for param_id in remove:
+            self._remove_criterion(param_id)
+        for param_id, param_criteria in criteria.items():
+            self._set_criterion(param_id, param_criteria, partials.get(param_id))
+
+        self.updates += 1
+        if self.updates % RESUM_INTERVAL == 0:
+            self._resum()
+
+    def scores(self) -> np.ndarray:
+        """Normalized suitability scores, as score_candidates computes them"""
+        if self.total_weight > 0:
+            return np.minimum(100, (self.total / self.total_weight) * 100)
+        return np.zeros(len(self.store), dtype=np.float64)
+
+    def result(self) -> AnalysisResult:
+        """Summarize the current scores like a regular analysis"""
+        scores = self.scores()
+        accumulator = ScoreAccumulator(10)
+        accumulator.add(scores)
+        criteria = dict(self.criteria)
+        result = summarize_analysis(self.store, criteria, analysis_key(criteria, self.store.version),
+                                    scores, accumulator)
+        if settings.cache_enabled:
+            # Pages of the ranking are served through /analysis/{analysis_id}/results
+            result_cache.set(result.analysis_id, result, size=result.nbytes)
+        return result
+
+
+# Open sessions, expiring after session_ttl seconds without use
+sessions = TTLCache(
+    ttl=settings.session_ttl,
+    max_bytes=settings.session_max_memory_mb * 1024 * 1024
+)
+
+
+def create_session(store: CandidateStore, criteria: Dict[str, Any]) -> AnalysisSession:
+    """Open a session scored against the given criteria"""
+    session = AnalysisSession(uuid.uuid4().hex, store, criteria)
+    sessions.set(session.session_id, session, size=session.nbytes)
+    return session
+
+
+def find_session(session_id: str) -> Optional[AnalysisSession]:
+    """Look up an open session, refreshing its expiry"""
+    session = sessions.get(session_id)
+    if session is not None:
+        sessions.set(session_id, session, size=session.nbytes)
+    return session
+
+
+def close_session(session_id: str) -> bool:
+    """Discard a session; returns whether it existed"""
+    found = sessions.get(session_id) is not None
+    sessions.invalidate(session_id)
+    return found
@@ -0,0 +1,84 @@
+"""
+Spatial precomputation helpers for Monasib backend
+"""
+import numpy as np
+import shapely
+import geopandas as gpd
+from pyproj import CRS, Transformer
+from shapely.strtree import STRtree
+from typing import Dict, Optional, Sequence, Tuple
+
+from logger import logger
+from parameters import RESTAURANT_PARAMETERS
+from columnar import read_layer_with_neighbours
+
+
+# Grid cell (CRS units) used to order nearest-neighbour queries
+LOCALITY_CELL_SIZE = 1000
+
+
+def utm_crs(longitude: np.ndarray, latitude: np.ndarray) -> CRS:
+    """Pick the UTM zone covering the center of the given points"""
+    center_lng = float(np.mean(longitude))
+    center_lat = float(np.mean(latitude))
+    zone = int((center_lng + 180) // 6) % 60 + 1
+    return CRS.from_epsg((32600 if center_lat >= 0 else 32700) + zone)
+
+
+def project_points(longitude: np.ndarray, latitude: np.ndarray, crs: CRS) -> np.ndarray:
+    """Project WGS84 coordinates into point geometries in the target CRS"""
+    transformer = Transformer.from_crs("EPSG:4326", crs, always_xy=True)
+    x, y = transformer.transform(np.asarray(longitude), np.asarray(latitude))
+    return shapely.points(x, y)
+
+
+def nearest_distances(points: np.ndarray, features: gpd.GeoSeries) -> Optional[np.ndarray]:
+    """
+    Distance from every point to its nearest feature, in CRS units.
+
+    Uses an STRtree so the cost grows with N log M rather than N * M.
+    Returns None when there are no features to measure against.
+    """
+    geometries = features.values[~(features.is_empty | features.isna()).values]
+    if len(geometries) == 0:
+        return None
+
+    # Query in spatially sorted order so neighbouring lookups share tree nodes
+    x, y = shapely.get_x(points), shapely.get_y(points)
+    order = np.lexsort((x // LOCALITY_CELL_SIZE, y // LOCALITY_CELL_SIZE))
+
+    tree = STRtree(geometries)
+    (input_index, _), distances = tree.query_nearest(points[order], return_distance=True, all_matches=False)
+    result = np.empty(len(points), dtype=np.float64)
+    result[order[input_index]] = distances
+    return result
+
+
+def compute_distance_columns(longitude: np.ndarray, latitude: np.ndarray, db_path: str,
+                             neighbours: Sequence[str] = (),
+                             halo: Optional[Tuple[float, float, float, float]] = None) -> Dict[str, np.ndarray]:
+    """
+    Derive distance parameters (meters) from their source layers.
+
+    Features of the `neighbours` GeoPackages inside the `halo` bbox count
+    too, so candidates near a partition edge see features across it.
+    """
+    crs = utm_crs(longitude, latitude)
+    points = project_points(longitude, latitude, crs)
+
+    columns = {}
+    for param_id, param_config in RESTAURANT_PARAMETERS.items():
+        layer_name = param_config.get('source_layer')
+        if param_config['type'] != 'distance' or not layer_name:
+            continue
+        try:
+            layer = read_layer_with_neighbours(db_path, layer_name, [], neighbours, halo)
+        except Exception as e:
+            logger.warning(f"Cannot derive '{param_id}' from layer '{layer_name}': {str(e)}")
+            continue
+
+        distances = nearest_distances(points, layer.geometry.to_crs(crs))
+        if distances is not None:
+            columns[param_id] = distances
+            logger.info(f"Derived '{param_id}' from {len(layer)} features in '{layer_name}'")
+    return columns
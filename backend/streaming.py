@@ -0,0 +1,92 @@
+"""
+Streaming GeoJSON encoding for Monasib backend
+"""
+import json
+import numpy as np
+import shapely
+from typing import Iterator, List, Optional, Sequence, Tuple
+
+from gpkg import FeatureTable, GeoPackage, blob_to_wkb
+
+
+def parse_bbox(value: Optional[str]) -> Optional[Tuple[float, float, float, float]]:
+    """Parse a 'minx,miny,maxx,maxy' query parameter"""
+    if not value:
+        return None
+    parts = [float(part) for part in value.split(",")]
+    if len(parts) != 4 or parts[0] > parts[2] or parts[1] > parts[3]:
+        raise ValueError("bbox must be 'minx,miny,maxx,maxy'")
+    return parts[0], parts[1], parts[2], parts[3]
+
+
+def select_properties(table: FeatureTable, value: Optional[str]) -> List[str]:
+    """Resolve a comma separated property selection against the table columns"""
+    if value is None:
+        return list(table.columns)
+    selected = [name.strip() for name in value.split(",") if name.strip()]
+    unknown = [name for name in selected if name not in table.columns]
+    if unknown:
+        raise ValueError(f"Unknown properties: {', '.join(unknown)}")
+    return selected
+
+
+def encode_features(rows: Sequence[tuple], columns: Sequence[str],
+                    bbox: Optional[Tuple[float, float, float, float]] = None) -> List[Tuple[int, str]]:
+    """Encode a batch of (fid, blob, *values) rows as (fid, GeoJSON feature) pairs"""
+    geometries = shapely.from_wkb(np.array([blob_to_wkb(row[1]) for row in rows], dtype=object))
+    keep = np.ones(len(rows), dtype=bool)
+    if bbox is not None:
+        keep = shapely.intersects(geometries, shapely.box(*bbox))
+
+    encoded = shapely.to_geojson(geometries)
+    features = []
+    for row, geometry, kept in zip(rows, encoded, keep):
+        if not kept:
+            continue
+        properties = json.dumps(dict(zip(columns, row[2:])), default=str)
+        features.append((row[0], (
+            f'{{"type": "Feature", "id": {row[0]}, "properties": {properties}, '
+            f'"geometry": {geometry if geometry is not None else "null"}}}'
+        )))
+    return features
+
+
+def stream_feature_collection(gpkg: GeoPackage, table: FeatureTable, columns: Sequence[str],
+                              bbox: Optional[Tuple[float, float, float, float]] = None,
+                              cursor: Optional[int] = None, limit: Optional[int] = None,
+                              batch_size: int = 1000) -> Iterator[bytes]:
+    """
+    Stream a layer as a GeoJSON FeatureCollection, one batch per chunk.
+
+    When a limit is given and more features remain, the collection ends
+    with a "next_cursor" member to pass back as the cursor.
+    """
+    # Without an R-tree the bbox is applied per batch, so the SQL limit cannot be trusted
+    indexed = bbox is None or table.rtree is not None
+    batches = gpkg.iter_features(
+        table, columns, bbox=bbox if indexed else None, after=cursor,
+        limit=limit + 1 if limit is not None and indexed else None,
+        batch_size=batch_size
+    )
+
+    yield b'{"type": "FeatureCollection", "features": ['
+    sent, last_fid, has_more = 0, None, False
+    try:
+        for rows in batches:
+            features = encode_features(rows, columns, bbox=None if indexed else bbox)
+            if limit is not None and len(features) > limit - sent:
+                features = features[:limit - sent]
+                has_more = True
+            if features:
+                yield ((", " if sent else "") + ", ".join(f for _, f in features)).encode()
+                sent += len(features)
+                last_fid = features[-1][0]
+            if has_more:
+                break
+    finally:
+        batches.close()
+    yield b"]"
+
+    if has_more:
+        yield f', "next_cursor": {last_fid}'.encode()
+    yield b"}"
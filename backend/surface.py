@@ -0,0 +1,233 @@
+"""
+Raster suitability surfaces for Monasib backend
+"""
+import math
+import zlib
+import struct
+import numpy as np
+import shapely
+import geopandas as gpd
+from scipy import ndimage
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from config import settings
+from cache import TTLCache
+from feature_store import CandidateStore
+from parameters import RESTAURANT_PARAMETERS
+from scoring import score_candidates
+from density import density_extent, get_density_grid
+
+
+# Meters per degree of latitude, and of longitude at the equator
+METERS_PER_DEGREE_LAT = 110540.0
+METERS_PER_DEGREE_LNG = 111320.0
+
+# Cell value for areas without a score in the compact grid encoding
+NODATA = 255
+
+
+class SurfaceGrid:
+    """Regular lon/lat grid over a bbox, row 0 at the top (north)"""
+
+    def __init__(self, bbox: Tuple[float, float, float, float], width: int, height: int):
+        self.bbox = bbox
+        self.width = width
+        self.height = height
+        minx, miny, maxx, maxy = bbox
+        self.cell_lng = (maxx - minx) / width
+        self.cell_lat = (maxy - miny) / height
+        center_lat = math.radians((miny + maxy) / 2)
+        # Local cell size in meters, accurate at city scale
+        self.cell_dx = self.cell_lng * METERS_PER_DEGREE_LNG * math.cos(center_lat)
+        self.cell_dy = self.cell_lat * METERS_PER_DEGREE_LAT
+
+    @property
+    def key(self) -> tuple:
+        return (tuple(round(v, 9) for v in self.bbox), self.width, self.height)
+
+    def cell_index(self, lng: np.ndarray, lat: np.ndarray, pad: int = 0) -> Tuple[np.ndarray, np.ndarray]:
+        """Row and column of each coordinate on the grid padded by `pad` cells"""
+        col = np.floor((lng - self.bbox[0]) / self.cell_lng).astype(np.int64) + pad
+        row = np.floor((self.bbox[3] - lat) / self.cell_lat).astype(np.int64) + pad
+        return row, col
+
+
+def default_bbox() -> Tuple[float, float, float, float]:
+    """The analysis area around the default location"""
+    lat, lng = settings.default_location_lat, settings.default_location_lng
+    return lng - 0.06, lat - 0.045, lng + 0.06, lat + 0.045
+
+
+def feature_coordinates(features: gpd.GeoSeries) -> Tuple[np.ndarray, np.ndarray]:
+    """Representative lon/lat of each feature (points as-is, others by centroid)"""
+    geometries = features.to_crs("EPSG:4326").values
+    geometries = geometries[~(shapely.is_empty(geometries) | shapely.is_missing(geometries))]
+    points = np.where(shapely.get_type_id(geometries) == 0, geometries, shapely.centroid(geometries))
+    return shapely.get_x(points), shapely.get_y(points)
+
+
+def distance_raster(grid: SurfaceGrid, lng: np.ndarray, lat: np.ndarray) -> np.ndarray:
+    """
+    Meters from every cell to the nearest feature.
+
+    Features are burned into a grid padded by surface_margin_m so that
+    features just outside the bbox still count, then an exact Euclidean
+    distance transform measures cell-center distances.
+    """
+    pad = int(math.ceil(settings.surface_margin_m / min(grid.cell_dx, grid.cell_dy)))
+    pad = min(pad, max(grid.width, grid.height))
+    shape = (grid.height + 2 * pad, grid.width + 2 * pad)
+
+    row, col = grid.cell_index(lng, lat, pad)
+    inside = (row >= 0) & (row < shape[0]) & (col >= 0) & (col < shape[1])
+    if not inside.any():
+        return np.full((grid.height, grid.width), np.inf, dtype=np.float32)
+
+    empty = np.ones(shape, dtype=bool)
+    empty[row[inside], col[inside]] = False
+    distances = ndimage.distance_transform_edt(empty, sampling=(grid.cell_dy, grid.cell_dx))
+    return distances[pad:pad + grid.height, pad:pad + grid.width].astype(np.float32)
+
+
+def nearest_index_raster(grid: SurfaceGrid, lng: np.ndarray, lat: np.ndarray,
+                         max_distance_m: Optional[float] = None) -> np.ndarray:
+    """
+    Index of the nearest sample point to every cell.
+
+    Points within `max_distance_m` around the bbox count too; cells
+    farther than that from every point are -1.
+    """
+    max_distance_m = settings.surface_max_fill_m if max_distance_m is None else max_distance_m
+    pad = int(math.ceil(max_distance_m / min(grid.cell_dx, grid.cell_dy)))
+    pad = min(pad, max(grid.width, grid.height))
+    shape = (grid.height + 2 * pad, grid.width + 2 * pad)
+
+    row, col = grid.cell_index(lng, lat, pad)
+    inside = np.flatnonzero((row >= 0) & (row < shape[0]) & (col >= 0) & (col < shape[1]))
+    if len(inside) == 0:
+        return np.full((grid.height, grid.width), -1, dtype=np.int32)
+
+    sampled = np.zeros(shape, dtype=np.int32)
+    empty = np.ones(shape, dtype=bool)
+    sampled[row[inside], col[inside]] = inside
+    empty[row[inside], col[inside]] = False
+    distances, (nearest_row, nearest_col) = ndimage.distance_transform_edt(
+        empty, sampling=(grid.cell_dy, grid.cell_dx), return_distances=True, return_indices=True
+    )
+    nearest = sampled[nearest_row, nearest_col]
+    nearest[distances > max_distance_m] = -1
+    return nearest[pad:pad + grid.height, pad:pad + grid.width]
+
+
+# Criterion rasters, keyed by parameter, data version and grid
+raster_cache = TTLCache(
+    ttl=settings.cache_ttl,
+    max_bytes=settings.result_cache_max_memory_mb * 1024 * 1024
+)
+
+
+def _cached(key: tuple, compute: Callable[[], np.ndarray]) -> np.ndarray:
+    if not settings.cache_enabled:
+        return compute()
+    return raster_cache.get_or_compute(key, compute, size_of=lambda raster: raster.nbytes)
+
+
+def criterion_raster(param_id: str, grid: SurfaceGrid, store: CandidateStore,
+                     read_layer: Optional[Callable[[str], gpd.GeoDataFrame]] = None,
+                     layer_version: str = "") -> np.ndarray:
+    """
+    Raster of one parameter's values over the grid.
+
+    Distance parameters are measured to the features of their source layer
+    when a layer reader is given, and scale parameters with a source layer
+    are sampled from its density grid; everything else is taken from the
+    nearest candidate, and is NaN where no candidate is near enough.
+    """
+    param_config = RESTAURANT_PARAMETERS[param_id]
+    layer_name = param_config.get('source_layer')
+
+    if param_config['type'] == 'distance' and layer_name and read_layer is not None:
+        def compute():
+            lng, lat = feature_coordinates(read_layer(layer_name).geometry)
+            return distance_raster(grid, lng, lat)
+        return _cached(("distance", layer_name, layer_version, grid.key), compute)
+
+    if param_config['type'] == 'scale' and layer_name and read_layer is not None and len(store):
+        def compute():
+            # The grid the candidates were derived from, so both agree on every level
+            density = get_density_grid(settings.database_path, layer_name,
+                                       density_extent(store.longitude, store.latitude))
+            lng = grid.bbox[0] + (np.arange(grid.width) + 0.5) * grid.cell_lng
+            lat = grid.bbox[3] - (np.arange(grid.height) + 0.5) * grid.cell_lat
+            return density.lookup(*np.meshgrid(lng, lat))
+        return _cached(("density", layer_name, layer_version, grid.key), compute)
+
+    # One nearest-candidate raster serves every candidate parameter
+    nearest = _cached(
+        ("nearest", store.version, grid.key),
+        lambda: nearest_index_raster(grid, store.longitude, store.latitude)
+    )
+    values = store.columns[param_id]
+    raster = np.full(nearest.shape, np.nan)
+    covered = nearest >= 0
+    raster[covered] = values[nearest[covered]]
+    return raster
+
+
+def compute_surface(criteria: Dict[str, Any], grid: SurfaceGrid, store: CandidateStore,
+                    read_layer: Optional[Callable[[str], gpd.GeoDataFrame]] = None,
+                    layer_version: str = "") -> np.ndarray:
+    """Weighted overlay of all criteria over the grid, as a height x width score array"""
+    columns = {
+        param_id: criterion_raster(param_id, grid, store, read_layer, layer_version).ravel()
+        for param_id in criteria if param_id in RESTAURANT_PARAMETERS
+    }
+    if not columns:
+        return np.zeros((grid.height, grid.width), dtype=np.float64)
+    return score_candidates(columns, criteria).reshape(grid.height, grid.width)
+
+
+def quantize(surface: np.ndarray) -> np.ndarray:
+    """Scores rounded to whole percent, NODATA where undefined"""
+    return np.rint(np.nan_to_num(surface, nan=NODATA)).astype(np.uint8)
+
+
+def encode_grid(surface: np.ndarray) -> bytes:
+    """Scores as one unsigned byte per cell (0-100), row-major from the north-west corner"""
+    return quantize(surface).tobytes()
+
+
+def _png_chunk(kind: bytes, data: bytes) -> bytes:
+    return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data) & 0xFFFFFFFF)
+
+
+def color_ramp() -> np.ndarray:
+    """101 RGB colors from red (0) through yellow (50) to green (100)"""
+    t = np.arange(101) / 100
+    red = np.where(t < 0.5, 215, 215 - (t - 0.5) * 2 * (215 - 26))
+    green = np.where(t < 0.5, 48 + t * 2 * (217 - 48), 217 - (t - 0.5) * 2 * (217 - 150))
+    blue = np.where(t < 0.5, 39 + t * 2 * (96 - 39), 96 - (t - 0.5) * 2 * (96 - 65))
+    return np.column_stack([red, green, blue]).round().astype(np.uint8)
+
+
+def encode_png(surface: np.ndarray, opacity: int = 180) -> bytes:
+    """Scores as a palette PNG, fully transparent where there is no score"""
+    height, width = surface.shape
+    indexes = quantize(surface)
+
+    palette = np.zeros((256, 3), dtype=np.uint8)
+    palette[:101] = color_ramp()
+    alpha = np.zeros(256, dtype=np.uint8)
+    alpha[:101] = opacity
+
+    # Each scanline starts with filter type 0 (none)
+    raw = np.zeros((height, width + 1), dtype=np.uint8)
+    raw[:, 1:] = indexes
+    return (
+        b"\x89PNG\r\n\x1a\n"
+        + _png_chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 3, 0, 0, 0))
+        + _png_chunk(b"PLTE", palette.tobytes())
+        + _png_chunk(b"tRNS", alpha.tobytes())
+        + _png_chunk(b"IDAT", zlib.compress(raw.tobytes(), 6))
+        + _png_chunk(b"IEND", b"")
+    )
@@ -0,0 +1,11 @@
+import pytest
+from config import settings
+
+
+@pytest.fixture(autouse=True, scope="session")
+def artifact_paths(tmp_path_factory):
+    """Keep the candidate store, caches and exports written by the suite out of the working tree"""
+    directory = tmp_path_factory.mktemp("artifacts")
+    for name, value in (("candidate_store_path", "candidates.npz"), ("export_dir", "exports"),
+                        ("tile_cache_dir", "tile_cache"), ("partition_dir", "partitions")):
+        setattr(settings, name, str(directory / value))
@@ -0,0 +1,57 @@
+import json
+import numpy as np
+import pytest
+import geopandas as gpd
+from fastapi.testclient import TestClient
+from aggregation import aggregate, encode_bins, hex_cells, hex_centers, numeric_fields
+from main import app
+
+client = TestClient(app)
+
+
+def points(count, seed=0):
+    rng = np.random.default_rng(seed)
+    return gpd.GeoDataFrame(
+        {"id": np.arange(count), "rating": rng.uniform(1, 5, count), "importance": rng.integers(1, 10, count)},
+        geometry=gpd.points_from_xy(rng.uniform(-74.06, -73.94, count), rng.uniform(40.67, 40.76, count)),
+        crs="EPSG:4326"
+    )
+
+
+def test_hex_cells_pick_the_nearest_center():
+    rng = np.random.default_rng(1)
+    x, y = rng.uniform(-1e4, 1e4, 2000), rng.uniform(-1e4, 1e4, 2000)
+    q, r = hex_cells(x, y, 100.0)
+    cx, cy = hex_centers(q, r, 100.0)
+    distance = np.hypot(x - cx, y - cy)
+    for dq, dr in [(1, 0), (-1, 0), (0, 1), (0, -1), (1, -1), (-1, 1)]:
+        nx, ny = hex_centers(q + dq, r + dr, 100.0)
+        assert (np.hypot(x - nx, y - ny) >= distance - 1e-9).all()
+
+
+@pytest.mark.parametrize("method", ["hex", "square", "cluster"])
+def test_aggregate_counts_and_means(method):
+    gdf = points(5000)
+    fields = numeric_fields(gdf)
+    assert fields == ["rating", "importance"]
+
+    coarse = aggregate(gdf, method, 10, fields)
+    fine = aggregate(gdf, method, 15, fields)
+    assert coarse.counts.sum() == fine.counts.sum() == 5000
+    assert len(coarse) < len(fine)
+    # Count-weighted cell means give back the layer mean
+    assert np.isclose((fine.means["rating"] * fine.counts).sum() / 5000, gdf["rating"].mean())
+
+    collection = json.loads(encode_bins(coarse, coarse.select((-74.0, 40.7, -73.98, 40.72))))
+    assert 0 < len(collection["features"]) <= len(coarse)
+    assert {"count", "mean_rating", "mean_importance"} <= set(collection["features"][0]["properties"])
+
+
+def test_fields_must_be_numeric():
+    with pytest.raises(ValueError):
+        numeric_fields(points(10).assign(name="x"), ["name"])
+
+
+def test_aggregate_endpoint_validation():
+    assert client.get("/layers/restaurants/aggregate?z=12&method=triangle").status_code == 400
+    assert client.get("/layers/missing_layer/aggregate?z=12").status_code == 404
@@ -0,0 +1,45 @@
+import threading
+import time
+from analysis import analysis_key, get_analysis, result_cache
+from cache import TTLCache
+from feature_store import CandidateStore
+
+
+def test_analysis_key_is_canonical():
+    """Key order and int/float spelling do not change the key"""
+    first = {"competitors": {"value": 500, "weight": 50}, "foot_traffic": {"value": 7, "weight": 50}}
+    second = {"foot_traffic": {"value": 7.0, "weight": 50}, "competitors": {"value": 500, "weight": 50.0}}
+    assert analysis_key(first, "v1") == analysis_key(second, "v1")
+    assert analysis_key(first, "v1") != analysis_key(first, "v2")
+    assert analysis_key(first, "v1") != analysis_key({"competitors": {"value": 500, "weight": 50}}, "v1")
+
+
+def test_repeated_analysis_is_served_from_cache():
+    """A repeat request returns the cached result"""
+    store = CandidateStore.generate(40.7128, -74.0060, 500, seed=11)
+    criteria = {"competitors": {"value": 500, "weight": 60}, "rent_cost": {"value": 3, "weight": 40}}
+    result_cache.clear()
+    first = get_analysis(store, criteria)
+    assert get_analysis(store, criteria) is first
+    assert first.response["analysis_id"] == first.analysis_id
+
+
+def test_concurrent_misses_are_coalesced():
+    """Concurrent callers for the same key share one computation"""
+    cache = TTLCache(ttl=60, max_bytes=1024)
+    calls = []
+
+    def compute():
+        calls.append(1)
+        time.sleep(0.05)
+        return "value"
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get_or_compute("k", compute)))
+               for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert results == ["value"] * 8
+    assert len(calls) == 1
@@ -0,0 +1,47 @@
+import os
+import sqlite3
+from config import settings
+from feature_store import CandidateStore
+from bootstrap import SAMPLE_LAYERS, generate_sample_layers, write_geopackage
+
+
+def test_sample_layers_are_reproducible(monkeypatch):
+    """The same seed and settings give identical layers of the configured sizes"""
+    monkeypatch.setattr(settings, "sample_restaurants_count", 120)
+    monkeypatch.setattr(settings, "sample_layer_features_min", 40)
+    monkeypatch.setattr(settings, "sample_layer_features_max", 60)
+    store = CandidateStore.generate(40.7128, -74.0060, 80, seed=1)
+
+    first = generate_sample_layers(store, seed=7)
+    second = generate_sample_layers(store, seed=7)
+    assert set(first) == {'restaurants', 'potential_locations'} | {name for name, _ in SAMPLE_LAYERS}
+    assert len(first['restaurants']) == 120
+    assert len(first['potential_locations']) == min(settings.sample_locations_count, 80)
+    assert all(40 <= len(first[name]) <= 60 for name, _ in SAMPLE_LAYERS)
+    for name, gdf in first.items():
+        assert gdf.equals(second[name])
+    assert not first['restaurants'].equals(generate_sample_layers(store, seed=8)['restaurants'])
+
+
+def test_geopackage_is_written_with_spatial_indexes(tmp_path):
+    store = CandidateStore.generate(40.7128, -74.0060, 60, seed=1)
+    path = str(tmp_path / "sample.gpkg")
+    write_geopackage(path, generate_sample_layers(store, seed=3))
+
+    assert os.listdir(tmp_path) == ["sample.gpkg"]
+    with sqlite3.connect(path) as conn:
+        tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    assert "rtree_restaurants_geom" in tables
+    assert "rtree_transport_stops_geom" in tables
+
+
+def test_concurrent_bootstraps_do_not_share_a_temporary_file(tmp_path):
+    """Another worker's half-written database is left alone"""
+    store = CandidateStore.generate(40.7128, -74.0060, 60, seed=1)
+    path = str(tmp_path / "sample.gpkg")
+    other = tmp_path / ".sample.gpkg.other"
+    other.mkdir()
+    (other / "sample.gpkg").write_bytes(b"partial")
+    write_geopackage(path, generate_sample_layers(store, seed=3))
+    assert sorted(os.listdir(tmp_path)) == sorted(["sample.gpkg", other.name])
+    assert (other / "sample.gpkg").read_bytes() == b"partial"
@@ -0,0 +1,50 @@
+import os
+import geopandas as gpd
+from shapely.geometry import Point
+from cache import LayerCache, TTLCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_entries_expire_after_ttl():
+    """Entries are dropped once their TTL has passed"""
+    clock = FakeClock()
+    cache = TTLCache(ttl=10, max_bytes=100, clock=clock)
+    cache.set("a", 1, size=1)
+    clock.now = 9
+    assert cache.get("a") == 1
+    clock.now = 11
+    assert cache.get("a") is None
+    assert len(cache) == 0
+
+
+def test_least_recently_used_entries_are_evicted_over_budget():
+    """The memory budget evicts the least recently used entries first"""
+    cache = TTLCache(ttl=60, max_bytes=10)
+    cache.set("a", 1, size=4)
+    cache.set("b", 2, size=4)
+    cache.get("a")
+    cache.set("c", 3, size=4)
+    assert cache.get("a") == 1
+    assert cache.get("b") is None
+    assert cache.nbytes == 8
+
+
+def test_layer_cache_reloads_when_geopackage_changes(tmp_path):
+    """Changing the GeoPackage file invalidates cached layers"""
+    db_path = str(tmp_path / "test.gpkg")
+    gpd.GeoDataFrame({'id': [1]}, geometry=[Point(0, 0)], crs="EPSG:4326").to_file(db_path, layer='stops', driver="GPKG")
+
+    cache = LayerCache(db_path, ttl=60, max_bytes=10 * 1024 * 1024, enabled=True)
+    first = cache.get('stops')
+    assert cache.get('stops') is first
+
+    gpd.GeoDataFrame({'id': [1, 2]}, geometry=[Point(0, 0), Point(1, 1)], crs="EPSG:4326").to_file(db_path, layer='stops', driver="GPKG")
+    os.utime(db_path, (0, os.path.getmtime(db_path) + 1))
+    assert len(cache.get('stops')) == 2
@@ -0,0 +1,89 @@
+import numpy as np
+import pytest
+import geopandas as gpd
+from config import settings
+from feature_store import CandidateStore
+
+pytest.importorskip("pyarrow")
+
+from columnar import ColumnarLayerStore, read_layer, read_points  # noqa: E402
+
+
+def write_layer(path, count, seed=1):
+    rng = np.random.default_rng(seed)
+    gdf = gpd.GeoDataFrame(
+        {"name": [f"Feature {i}" for i in range(count)], "importance": rng.integers(1, 10, count)},
+        geometry=gpd.points_from_xy(rng.uniform(-74.06, -73.94, count), rng.uniform(40.67, 40.76, count)),
+        crs="EPSG:4326"
+    )
+    gdf.to_file(path, layer="points", driver="GPKG", engine="pyogrio")
+    return gdf
+
+
+def test_snapshot_round_trip_and_bbox_pruning(tmp_path):
+    path = str(tmp_path / "layers.gpkg")
+    original = write_layer(path, 500)
+    store = ColumnarLayerStore(path, str(tmp_path / "columnar"), batch_rows=64)
+
+    gdf = store.read("points")
+    assert len(gdf) == 500 and gdf.crs.to_epsg() == 4326
+    assert sorted(gdf["name"]) == sorted(original["name"])
+
+    bbox = (-74.0, 40.7, -73.97, 40.73)
+    expected = original.cx[bbox[0]:bbox[2], bbox[1]:bbox[3]]
+    subset = store.read("points", columns=["importance"], bbox=bbox)
+    assert list(subset.columns) == ["importance", "geometry"]
+    assert sorted(subset.geometry.x) == sorted(expected.geometry.x)
+
+
+def test_snapshot_follows_layer_changes(tmp_path):
+    path = str(tmp_path / "layers.gpkg")
+    write_layer(path, 50)
+    store = ColumnarLayerStore(path, str(tmp_path / "columnar"))
+    assert len(store.read("points")) == 50
+
+    write_layer(path, 80, seed=2)
+    assert len(store.read("points")) == 80
+
+
+def test_points_are_read_without_decoding_geometries(tmp_path, monkeypatch):
+    path = str(tmp_path / "layers.gpkg")
+    original = write_layer(path, 300)
+    store = ColumnarLayerStore(path, str(tmp_path / "columnar"), batch_rows=64)
+    store.snapshot("points")
+    monkeypatch.setattr("shapely.from_wkb", None)  # any geometry decoding would now fail
+
+    bbox = (-74.0, 40.7, -73.97, 40.73)
+    lng, lat, importance = store.points("points", "importance", bbox=bbox)
+    expected = original.cx[bbox[0]:bbox[2], bbox[1]:bbox[3]]
+    assert sorted(zip(lng, lat, importance)) == sorted(zip(expected.geometry.x, expected.geometry.y,
+                                                           expected["importance"]))
+    assert store.points("points", "missing")[2] is None
+
+    # The GeoPackage fallback gives the same points
+    monkeypatch.undo()
+    monkeypatch.setattr(settings, "columnar_store_enabled", False)
+    fallback = read_points(path, "points", "importance", bbox=bbox)
+    assert sorted(zip(*fallback)) == sorted(zip(lng, lat, importance))
+
+
+def test_read_layer_without_columnar_store(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "columnar_store_enabled", False)
+    path = str(tmp_path / "layers.gpkg")
+    write_layer(path, 20)
+    assert list(read_layer(path, "points", columns=[]).columns) == ["geometry"]
+
+
+def test_candidate_store_memory_maps_arrow_files(tmp_path):
+    path = str(tmp_path / "candidates.arrow")
+    store = CandidateStore.generate(40.7128, -74.0060, 1000, seed=5)
+    store.distance_source_mtime = 123.5
+    store.save(path)
+
+    loaded = CandidateStore.load(path)
+    assert loaded.seed == 5 and loaded.distance_source_mtime == 123.5
+    assert np.array_equal(loaded.latitude, store.latitude)
+    for param_id, values in store.columns.items():
+        assert np.array_equal(loaded.columns[param_id], values)
+        assert loaded.columns[param_id].dtype == values.dtype
+        assert not loaded.columns[param_id].flags.writeable  # a view of the mapping, not a copy
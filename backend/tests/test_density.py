@@ -0,0 +1,54 @@
+import os
+import numpy as np
+import geopandas as gpd
+from config import settings
+from density import DensityGrid, compute_density_columns, density_extent, density_levels, kernel_density
+
+
+def write_layer(path, layer, lng, lat, importance):
+    gdf = gpd.GeoDataFrame({"importance": importance}, geometry=gpd.points_from_xy(lng, lat), crs="EPSG:4326")
+    gdf.to_file(path, layer=layer, driver="GPKG", engine="pyogrio")
+
+
+def test_kernel_density_is_weighted_and_peaks_at_the_points():
+    bbox = (-74.02, 40.70, -73.98, 40.73)
+    density = kernel_density(np.array([-74.01, -73.99]), np.array([40.715, 40.715]), np.array([1.0, 3.0]),
+                             bbox, cell_m=25, bandwidth_m=200)
+    grid = DensityGrid(bbox, density_levels(density))
+    levels = grid.lookup(np.array([-74.01, -73.99, -74.0, -75.0]), np.array([40.715, 40.715, 40.729, 40.715]))
+    assert levels[1] == 10 and 1 < levels[0] < levels[1]
+    assert levels[2] == 1 and levels[3] == 1  # far from any point, and outside the grid
+
+
+def test_density_levels_of_an_empty_layer():
+    assert (density_levels(np.zeros((4, 4))) == 1).all()
+
+
+def test_density_columns_are_cached_and_follow_layer_changes(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "density_cache_dir", str(tmp_path / "density"))
+    path = str(tmp_path / "layers.gpkg")
+    rng = np.random.default_rng(3)
+    # Busy in the west of the area, quiet in the east
+    write_layer(path, "high_traffic_areas", rng.normal(-74.03, 0.004, 400), rng.normal(40.71, 0.004, 400),
+                rng.integers(1, 10, 400))
+
+    lng, lat = np.array([-74.03, -73.97]), np.array([40.71, 40.71])
+    columns = compute_density_columns(lng, lat, path)
+    assert list(columns) == ["foot_traffic"]  # layers of the other parameters are missing
+    assert columns["foot_traffic"][0] > columns["foot_traffic"][1] == 1
+    assert len(os.listdir(settings.density_cache_dir)) == 1
+
+    # Grids of other bboxes over the same data are kept side by side
+    compute_density_columns(lng + 0.05, lat, path)
+    assert len(os.listdir(settings.density_cache_dir)) == 2
+
+    write_layer(path, "high_traffic_areas", rng.normal(-73.97, 0.004, 400), rng.normal(40.71, 0.004, 400),
+                rng.integers(1, 10, 400))
+    columns = compute_density_columns(lng, lat, path)
+    assert columns["foot_traffic"][1] > columns["foot_traffic"][0]
+    assert len(os.listdir(settings.density_cache_dir)) == 1  # the stale grids were removed
+
+
+def test_density_extent_covers_the_kernel():
+    bbox = density_extent(np.array([-74.0, -73.9]), np.array([40.7, 40.8]), bandwidth_m=400)
+    assert bbox[0] < -74.0 - 0.0138 and bbox[3] > 40.8 + 0.0108
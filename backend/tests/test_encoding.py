@@ -0,0 +1,75 @@
+import gzip
+import json
+import pytest
+from fastapi.testclient import TestClient
+from encoding import (ARROW_STREAM, MSGPACK, EncodedPayload, choose_encoding, choose_format, make_etag,
+                      not_modified, record_columns)
+import main
+from main import app
+
+client = TestClient(app)
+
+CRITERIA = {
+    "criteria": {
+        "competitors": {"value": 500, "weight": 50},
+        "foot_traffic": {"value": 7, "weight": 50}
+    },
+    "totalWeight": 100
+}
+
+
+def test_validators_and_negotiation():
+    etag = make_etag("restaurants", "2024-01-01T00:00:00.000Z")
+    assert etag == make_etag("restaurants", "2024-01-01T00:00:00.000Z")
+    assert etag != make_etag("restaurants", "2024-01-02T00:00:00.000Z")
+    assert not_modified(f'"other", W/{etag}', etag)
+    assert not_modified("*", etag)
+    assert not not_modified(None, etag)
+
+    assert choose_encoding("gzip;q=0, deflate") == "identity"
+    assert choose_encoding("gzip, deflate") == "gzip"
+    assert choose_encoding("gzip;q=abc") == "gzip"  # a malformed q-value is not a refusal
+    assert client.post("/analysis", json=CRITERIA, headers={"Accept": "application/msgpack;q=abc"}).status_code == 200
+    assert choose_format("text/html, application/json") == "application/json"
+
+
+def test_payload_variants_decompress_to_the_body():
+    body = json.dumps({"values": list(range(2000))}).encode()
+    payload = EncodedPayload(body, "application/json")
+    assert gzip.decompress(payload.variants["gzip"]) == body
+    assert EncodedPayload(b"{}", "application/json").variants.keys() == {"identity"}
+
+
+def test_record_columns_flattens_nested_records():
+    columns = record_columns([{"id": 1, "parameters": {"a": 2}}, {"id": 3, "extra": True}])
+    assert columns == {"id": [1, 3], "parameters.a": [2, None], "extra": [None, True]}
+
+
+def test_analysis_revalidates_with_etag(monkeypatch):
+    first = client.post("/analysis", json=CRITERIA)
+    assert first.status_code == 200
+    etag = first.headers["etag"]
+
+    # Revalidation is answered before the analysis is looked up or scored
+    with monkeypatch.context() as m:
+        m.setattr(main, "get_analysis", lambda *args: pytest.fail("scored on a matching ETag"))
+        again = client.post("/analysis", json=CRITERIA, headers={"If-None-Match": etag})
+        assert again.status_code == 304 and again.headers["etag"] == etag
+
+    compressed = client.post("/analysis", json=CRITERIA, headers={"Accept-Encoding": "gzip"})
+    assert compressed.headers["content-encoding"] == "gzip"
+    assert compressed.json() == first.json()
+
+
+def test_binary_encodings_of_results():
+    msgpack = pytest.importorskip("msgpack")
+    response = client.post("/analysis", json=CRITERIA, headers={"Accept": MSGPACK})
+    assert response.headers["content-type"] == MSGPACK
+    assert len(msgpack.unpackb(response.content)["top_10_locations"]) == 10
+
+    pa = pytest.importorskip("pyarrow")
+    analysis_id = msgpack.unpackb(response.content)["analysis_id"]
+    response = client.get(f"/analysis/{analysis_id}/results?page=2&page_size=20", headers={"Accept": ARROW_STREAM})
+    table = pa.ipc.open_stream(response.content).read_all()
+    assert table.num_rows == 20 and table.column("rank").to_pylist()[0] == 21
+    assert json.loads(table.schema.metadata[b"page"]) == 2
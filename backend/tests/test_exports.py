@@ -0,0 +1,94 @@
+import csv
+import json
+import time
+import zipfile
+import pytest
+import geopandas as gpd
+from fastapi.testclient import TestClient
+from config import settings
+from feature_store import CandidateStore
+from analysis import run_analysis
+from exports import ExportJob, shapefile_names
+from main import app
+
+client = TestClient(app)
+
+CRITERIA = {"competitors": {"value": 500, "weight": 50}, "foot_traffic": {"value": 7, "weight": 50}}
+
+
+@pytest.fixture
+def analysis(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "export_dir", str(tmp_path))
+    monkeypatch.setattr(settings, "export_chunk_size", 70)
+    store = CandidateStore.generate(40.7128, -74.0060, 300, seed=2)
+    return store, run_analysis(store, CRITERIA, "export-test")
+
+
+def run_export(analysis, format, limit=None):
+    store, result = analysis
+    job = ExportJob(f"e-{format}", result, store, format, limit)
+    job.run()
+    assert job.status == "completed", job.error
+    return job, result
+
+
+def test_csv_and_geojson_follow_the_ranking(analysis):
+    job, result = run_export(analysis, "csv")
+    with open(job.path) as f:
+        rows = list(csv.DictReader(f))
+    assert len(rows) == job.processed == result.scored_count
+    assert [int(row["rank"]) for row in rows] == list(range(1, len(rows) + 1))
+    top = result.response["top_10_locations"]
+    assert [int(row["id"]) for row in rows[:10]] == [location["id"] for location in top]
+
+    job, _ = run_export(analysis, "geojson", limit=25)
+    with open(job.path) as f:
+        features = json.load(f)["features"]
+    assert len(features) == 25
+    assert features[0]["properties"]["suitability_score"] == top[0]["suitability_score"]
+
+
+def test_gpkg_and_shapefile_exports(analysis):
+    job, result = run_export(analysis, "gpkg")
+    gdf = gpd.read_file(job.path, layer="analysis_results")
+    assert len(gdf) == result.scored_count and gdf.crs.to_epsg() == 4326
+
+    job, _ = run_export(analysis, "shapefile", limit=40)
+    names = zipfile.ZipFile(job.path).namelist()
+    assert {"analysis_results.shp", "analysis_results.dbf", "analysis_results.shx"} <= set(names)
+    assert len(gpd.read_file(f"zip://{job.path}")) == 40
+
+
+def test_cancelled_export_leaves_no_file(analysis):
+    store, result = analysis
+    job = ExportJob("e-cancel", result, store, "csv")
+    job.cancel()
+    job.run()
+    assert job.status == "cancelled"
+    job.discard()
+
+
+def test_shapefile_names_are_unique_and_short():
+    names = shapefile_names(["population_density", "population_growth", "rank"])
+    assert names == {"population_density": "population", "population_growth": "populatio1", "rank": "rank"}
+
+
+def test_export_endpoint_round_trip(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "export_dir", str(tmp_path))
+    analysis_id = client.post("/analysis", json={"criteria": CRITERIA, "totalWeight": 100}).json()["analysis_id"]
+    assert client.post(f"/analysis/{analysis_id}/exports?format=pdf").status_code == 400
+    assert client.post("/analysis/unknown/exports?format=csv").status_code == 404
+
+    export = client.post(f"/analysis/{analysis_id}/exports?format=csv&limit=5")
+    assert export.status_code == 202
+    export_id = export.json()["export_id"]
+    for _ in range(100):
+        if client.get(f"/exports/{export_id}").json()["status"] == "completed":
+            break
+        time.sleep(0.05)
+    download = client.get(f"/exports/{export_id}/download")
+    assert download.status_code == 200
+    assert len(download.text.strip().splitlines()) == 6
+
+    client.delete(f"/exports/{export_id}")
+    assert client.get(f"/exports/{export_id}").status_code == 404
@@ -0,0 +1,38 @@
+import numpy as np
+from feature_store import CandidateStore
+from parameters import RESTAURANT_PARAMETERS
+
+
+def test_generation_is_reproducible():
+    """The same seed always yields the same candidates"""
+    first = CandidateStore.generate(40.7128, -74.0060, 1000, seed=7)
+    second = CandidateStore.generate(40.7128, -74.0060, 1000, seed=7)
+    np.testing.assert_array_equal(first.latitude, second.latitude)
+    for param_id in RESTAURANT_PARAMETERS:
+        np.testing.assert_array_equal(first.columns[param_id], second.columns[param_id])
+
+
+def test_compact_column_types():
+    """Distances are float32 and 1-10 scales are uint8"""
+    store = CandidateStore.generate(40.7128, -74.0060, 1000, seed=7)
+    for param_id, config in RESTAURANT_PARAMETERS.items():
+        values = store.columns[param_id]
+        if config['type'] == 'distance':
+            assert values.dtype == np.float32
+            assert values.min() >= 50 and values.max() <= 2000
+        else:
+            assert values.dtype == np.uint8
+            assert values.min() >= 1 and values.max() <= 10
+    assert store.nbytes / len(store) < 64
+
+
+def test_save_and_load_round_trip(tmp_path):
+    """A saved store loads back unchanged"""
+    path = str(tmp_path / "candidates.npz")
+    store = CandidateStore.generate(40.7128, -74.0060, 100, seed=3)
+    store.save(path)
+
+    loaded = CandidateStore.load(path)
+    assert len(loaded) == 100
+    assert loaded.seed == 3
+    assert loaded.location(5) == store.location(5)
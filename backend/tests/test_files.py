@@ -0,0 +1,36 @@
+import os
+import threading
+import pytest
+from files import atomic_path
+
+
+def test_concurrent_writers_get_their_own_temporary_file(tmp_path):
+    path = str(tmp_path / "tile.mvt")
+    ready = threading.Barrier(4)
+    seen = []
+
+    def write(data: bytes):
+        with atomic_path(path) as staged:
+            seen.append(staged)
+            with open(staged, "wb") as f:
+                f.write(data)
+            ready.wait()
+
+    threads = [threading.Thread(target=write, args=(bytes([i]) * 8,)) for i in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(set(seen)) == 4 and all(name.endswith("tile.mvt") for name in seen)
+    assert open(path, "rb").read() in {bytes([i]) * 8 for i in range(4)}
+    assert os.listdir(tmp_path) == ["tile.mvt"]
+
+
+def test_failed_write_leaves_no_file(tmp_path):
+    path = str(tmp_path / "grid.npz")
+    with pytest.raises(RuntimeError):
+        with atomic_path(path) as staged:
+            open(staged, "wb").close()
+            raise RuntimeError("disk full")
+    assert os.listdir(tmp_path) == []
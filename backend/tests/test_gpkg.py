@@ -0,0 +1,33 @@
+import sqlite3
+import geopandas as gpd
+import pytest
+from shapely.geometry import Point
+from gpkg import GeoPackage
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    path = str(tmp_path / "test.gpkg")
+    stops = gpd.GeoDataFrame({'id': [1, 2, 3]}, geometry=[Point(0, 0), Point(1, 2), Point(2, 1)], crs="EPSG:4326")
+    stops.to_file(path, layer='transport_stops', driver="GPKG")
+    return path
+
+
+def test_layers_from_metadata(db_path):
+    """Layer descriptions come from the GeoPackage system tables"""
+    layers = GeoPackage(db_path).layers()
+    assert list(layers) == ['transport_stops']
+    layer = layers['transport_stops']
+    assert layer['feature_count'] == 3
+    assert layer['geometry_type'] == 'Point'
+    assert layer['bounds'] == [0, 0, 2, 2]
+
+
+def test_connections_are_pooled_and_read_only(db_path):
+    """Connections are reused and cannot write"""
+    gpkg = GeoPackage(db_path, pool_size=1)
+    with gpkg.connection() as first:
+        with pytest.raises(sqlite3.OperationalError):
+            first.execute("DELETE FROM transport_stops")
+    with gpkg.connection() as second:
+        assert second is first
@@ -0,0 +1,127 @@
+import io
+import os
+import json
+import sqlite3
+import pytest
+import geopandas as gpd
+from fastapi.testclient import TestClient
+from ingest import geojson_crs, ingest_stream, iter_geojson, read_csv, read_gpx, read_kml, validate_layer_name
+from main import app
+
+client = TestClient(app)
+
+
+def feature(i):
+    return {"type": "Feature", "properties": {"id": i, "name": f"POI {i}"},
+            "geometry": {"type": "Point", "coordinates": [-74.0 + i * 1e-4, 40.7]}}
+
+
+def collection(count, **members):
+    return json.dumps({"type": "FeatureCollection", **members, "features": [feature(i) for i in range(count)]}).encode()
+
+
+def test_geojson_is_decoded_across_read_boundaries():
+    """Features split between small reads are still decoded whole"""
+    features = list(iter_geojson(io.BytesIO(collection(50)), read_size=37))
+    assert [f["properties"]["id"] for f in features] == list(range(50))
+
+    sequence = "\n".join(json.dumps(feature(i)) for i in range(5)).encode()
+    assert len(list(iter_geojson(io.BytesIO(sequence), read_size=16))) == 5
+
+    with pytest.raises(ValueError):
+        list(iter_geojson(io.BytesIO(b'{"type": "FeatureCollection", "features": [{"type": "Fea')))
+
+
+def test_geojson_buffers_one_value_at_a_time():
+    """A long header before "features" is skipped, and oversized values are rejected"""
+    data = collection(20, metadata={"notes": "x" * 5000})
+    features = list(iter_geojson(io.BytesIO(data), read_size=64, max_value_size=8000))
+    assert [f["properties"]["id"] for f in features] == list(range(20))
+
+    with pytest.raises(ValueError):
+        list(iter_geojson(io.BytesIO(data), read_size=64, max_value_size=1000))
+
+
+def test_geojson_legacy_crs_member():
+    data = collection(1, crs={"type": "name", "properties": {"name": "EPSG:3857"}})
+    assert geojson_crs(io.BytesIO(data)) == "EPSG:3857"
+    assert geojson_crs(io.BytesIO(collection(1))) is None
+
+
+def test_csv_kml_and_gpx_readers():
+    rows = list(read_csv(io.BytesIO(b"name,lat,lon\nA,40.7,-74.0\nB,bad,-74.1\n")))
+    assert rows == [({"name": "A"}, (-74.0, 40.7)), ({"name": "B"}, None)]
+
+    kml = b"""<kml xmlns="http://www.opengis.net/kml/2.2"><Document>
+      <Placemark><name>Stop</name><Point><coordinates>-74.0,40.7,0</coordinates></Point></Placemark>
+      <Placemark><name>Route</name><LineString><coordinates>-74.0,40.7 -74.1,40.8</coordinates></LineString></Placemark>
+    </Document></kml>"""
+    placemarks = list(read_kml(io.BytesIO(kml)))
+    assert [p["name"] for p, _ in placemarks] == ["Stop", "Route"]
+    assert [g.geom_type for _, g in placemarks] == ["Point", "LineString"]
+
+    gpx = b"""<gpx xmlns="http://www.topografix.com/GPX/1/1">
+      <wpt lat="40.7" lon="-74.0"><name>Cafe</name></wpt>
+      <trk><trkseg><trkpt lat="40.7" lon="-74.0"/><trkpt lat="40.71" lon="-74.01"/></trkseg></trk>
+    </gpx>"""
+    assert [(p["feature_type"], g.geom_type) for p, g in read_gpx(io.BytesIO(gpx))] == [
+        ("waypoint", "Point"), ("track", "MultiLineString")]
+
+
+def test_ingest_batches_reprojects_and_indexes(tmp_path):
+    path = str(tmp_path / "ingest.gpkg")
+    data = collection(25, crs={"type": "name", "properties": {"name": "EPSG:3857"}})
+    summary = ingest_stream(io.BytesIO(data), ".geojson", path, "pois", batch_size=10)
+    assert summary["features_written"] == 25 and summary["batches"] == 3
+
+    gdf = gpd.read_file(path, layer="pois")
+    assert len(gdf) == 25 and gdf.crs.to_epsg() == 4326
+    assert abs(gdf.geometry.x.max()) < 0.01  # Web Mercator metres became degrees
+    with sqlite3.connect(path) as conn:
+        assert conn.execute("SELECT count(*) FROM rtree_pois_geom").fetchone()[0] == 25
+
+    # Appends conform to the existing schema, replace starts over
+    csv = b"name,lat,lon,unknown\nExtra,40.7,-74.0,x\n"
+    ingest_stream(io.BytesIO(csv), ".csv", path, "pois", batch_size=10)
+    gdf = gpd.read_file(path, layer="pois")
+    assert len(gdf) == 26 and "unknown" not in gdf.columns
+    ingest_stream(io.BytesIO(csv), ".csv", path, "pois", mode="replace")
+    assert len(gpd.read_file(path, layer="pois")) == 1
+
+
+def test_layer_names_are_validated():
+    for name in ("gpkg_contents", "rtree_pois_geom", "bad name", "1abc"):
+        with pytest.raises(ValueError):
+            validate_layer_name(name)
+    validate_layer_name("user_pois")
+
+
+def test_upload_rejects_unsupported_files():
+    response = client.post("/layers/pois/upload", files={"file": ("pois.shp", b"data")})
+    assert response.status_code == 400
+    response = client.post("/layers/gpkg_contents/upload", files={"file": ("pois.geojson", b"{}")})
+    assert response.status_code == 400
+
+
+def test_invalid_features_are_skipped_and_never_replace_a_layer(tmp_path):
+    path = str(tmp_path / "ingest.gpkg")
+    ingest_stream(io.BytesIO(collection(3)), ".geojson", path, "pois")
+
+    data = json.dumps({"type": "FeatureCollection", "features": [
+        {"type": "Feature", "properties": "not an object", "geometry": {"type": "Point", "coordinates": [1, 2]}},
+        {"type": "Feature", "properties": {}, "geometry": 42},
+        "not a feature"
+    ]}).encode()
+    summary = ingest_stream(io.BytesIO(data), ".geojson", path, "pois")
+    assert summary["features_written"] == 0 and summary["features_skipped"] == 3
+
+    with pytest.raises(ValueError):
+        ingest_stream(io.BytesIO(data), ".geojson", path, "pois", mode="replace")
+    assert len(gpd.read_file(path, layer="pois")) == 3
+
+    # A replacement that fails to parse after some batches were written leaves the layer as it was
+    truncated = collection(30)[:-40]
+    with pytest.raises(ValueError):
+        ingest_stream(io.BytesIO(truncated), ".geojson", path, "pois", mode="replace", batch_size=5)
+    assert len(gpd.read_file(path, layer="pois")) == 3
+    assert os.listdir(tmp_path) == ["ingest.gpkg"]
@@ -0,0 +1,58 @@
+import asyncio
+import json
+from config import settings
+from feature_store import CandidateStore
+from jobs import AnalysisJob, JobManager, JobQueueFull, job_events
+from analysis import get_analysis, result_cache
+
+import pytest
+
+
+CRITERIA = {"competitors": {"value": 500, "weight": 50}, "foot_traffic": {"value": 7, "weight": 50}}
+
+
+def test_job_runs_in_chunks_and_matches_analysis(monkeypatch):
+    """A job reports progress per chunk and ends with the same ranking as /analysis"""
+    monkeypatch.setattr(settings, "scoring_chunk_size", 300)
+    store = CandidateStore.generate(40.7128, -74.0060, 1000, seed=4)
+    job = AnalysisJob("j1", store, CRITERIA)
+    job.run()
+
+    snapshot = job.snapshot()
+    assert snapshot["status"] == "completed"
+    assert snapshot["processed"] == 1000 and job.revision == 6  # running, 4 chunks, completed
+    result_cache.clear()
+    expected = get_analysis(store, CRITERIA)
+    assert snapshot["analysis_id"] == expected.analysis_id
+    assert snapshot["top_locations"] == expected.response["top_10_locations"]
+
+
+def test_cancelled_job_does_not_run():
+    store = CandidateStore.generate(40.7128, -74.0060, 100, seed=4)
+    job = AnalysisJob("j2", store, CRITERIA)
+    assert job.cancel()
+    job.run()
+    assert job.snapshot()["status"] == "cancelled" and job.processed == 0
+    assert not job.cancel()
+
+
+def test_queue_is_bounded():
+    """Submissions beyond the pending limit are rejected"""
+    store = CandidateStore.generate(40.7128, -74.0060, 100, seed=4)
+    manager = JobManager(workers=1, max_pending=0, retention=60)
+    with pytest.raises(JobQueueFull):
+        manager.submit(store, CRITERIA)
+    manager.shutdown()
+
+
+def test_events_end_with_final_status():
+    store = CandidateStore.generate(40.7128, -74.0060, 100, seed=4)
+    job = AnalysisJob("j3", store, CRITERIA)
+    job.run()
+
+    async def collect():
+        return [event async for event in job_events(job, poll_interval=0)]
+
+    events = asyncio.run(collect())
+    assert len(events) == 1 and events[0].startswith("event: completed\n")
+    assert json.loads(events[0].split("data: ")[1])["job_id"] == "j3"
@@ -114,3 +114,136 @@ def test_static_files():
     
     response = client.get("/style.css")
     assert response.status_code == 200
+
+
+def test_batch_analysis_endpoint():
+    """Test the batch analysis endpoint with several scenarios"""
+    scenarios = [
+        {"name": "transit", "criteria": {"public_transport": {"value": 300, "weight": 100}}},
+        {"name": "mixed", "criteria": {
+            "competitors": {"value": 500, "weight": 50},
+            "foot_traffic": {"value": 7, "weight": 50}
+        }}
+    ]
+    response = client.post("/analysis/batch", json={"scenarios": scenarios, "top_n": 5})
+    assert response.status_code == 200
+    data = response.json()
+    assert [s["name"] for s in data["scenarios"]] == ["transit", "mixed"]
+    assert len(data["scenarios"][1]["top_locations"]) == 5
+
+    single = client.post("/analysis", json=scenarios[1]).json()
+    assert data["scenarios"][1]["best_location"] == single["best_location"]
+    assert data["scenarios"][1]["analysis_summary"]["median_score"] == single["analysis_summary"]["median_score"]
+
+
+def test_batch_analysis_requires_scenarios():
+    """Test the batch analysis endpoint with no scenarios"""
+    response = client.post("/analysis/batch", json={"scenarios": []})
+    assert response.status_code == 400
+
+
+def test_paginated_analysis_results():
+    """Test paging through the ranking of a cached analysis"""
+    test_criteria = {
+        "criteria": {
+            "competitors": {"value": 400, "weight": 30},
+            "rent_cost": {"value": 3, "weight": 70}
+        }
+    }
+    analysis = client.post("/analysis", json=test_criteria).json()
+    url = f"/analysis/{analysis['analysis_id']}/results"
+
+    first = client.get(url, params={"page": 1, "page_size": 5}).json()
+    second = client.get(url, params={"page": 2, "page_size": 5}).json()
+    ranked_ids = [loc["id"] for loc in first["locations"] + second["locations"]]
+    assert ranked_ids == [loc["id"] for loc in analysis["top_10_locations"]]
+    assert second["locations"][0]["rank"] == 6
+    assert first["total_results"] == analysis["scored_locations"]
+
+
+def test_analysis_results_unknown_id():
+    """Test requesting results of an unknown analysis"""
+    response = client.get("/analysis/unknown/results")
+    assert response.status_code == 404
+
+
+def test_surface_analysis_grid():
+    """The surface endpoint returns one byte per cell with its dimensions"""
+    criteria = {"foot_traffic": {"value": 7, "weight": 100}}
+    response = client.post("/analysis/surface", json={"criteria": criteria, "width": 40, "height": 30, "format": "grid"})
+    assert response.status_code == 200
+    assert response.headers["x-grid-width"] == "40"
+    assert len(response.content) == 40 * 30
+    assert all(value <= 100 or value == 255 for value in response.content)  # 255 is NODATA
+    assert sum(value <= 100 for value in response.content) > 0.9 * 40 * 30
+
+
+def test_surface_analysis_rejects_oversized_grid():
+    criteria = {"foot_traffic": {"value": 7, "weight": 100}}
+    response = client.post("/analysis/surface", json={"criteria": criteria, "width": 100000, "height": 10})
+    assert response.status_code == 400
+
+
+def test_analysis_session_flow():
+    """A session is opened, updated one criterion at a time and closed"""
+    criteria = {"foot_traffic": {"value": 7, "weight": 60}, "rent_cost": {"value": 5, "weight": 40}}
+    response = client.post("/analysis/sessions", json={"criteria": criteria})
+    assert response.status_code == 200
+    session_id = response.json()["session_id"]
+
+    update = client.patch(f"/analysis/sessions/{session_id}",
+                          json={"criteria": {"rent_cost": {"value": 5, "weight": 20}}})
+    assert update.status_code == 200
+    data = update.json()
+    assert data["criteria_used"]["rent_cost"]["weight"] == 20
+    expected = client.post("/analysis", json={"criteria": data["criteria_used"]}).json()
+    assert data["top_10_locations"] == expected["top_10_locations"]
+
+    assert client.delete(f"/analysis/sessions/{session_id}").status_code == 200
+    assert client.patch(f"/analysis/sessions/{session_id}", json={}).status_code == 404
+
+
+def test_analysis_job_flow():
+    """A queued job streams its progress and finishes with a pageable analysis"""
+    response = client.post("/jobs/analysis", json={"criteria": {"foot_traffic": {"value": 7, "weight": 100}}})
+    assert response.status_code == 202
+    job_id = response.json()["job_id"]
+
+    events = client.get(f"/jobs/{job_id}/events")
+    assert events.headers["content-type"].startswith("text/event-stream")
+    assert "event: completed" in events.text
+
+    job = client.get(f"/jobs/{job_id}").json()
+    assert job["status"] == "completed"
+    assert client.get(f"/analysis/{job['analysis_id']}/results").status_code == 200
+    assert client.delete(f"/jobs/{job_id}").status_code == 409
+
+
+def test_prometheus_metrics():
+    """Route latencies and analysis stages are exposed in the text format"""
+    client.post("/analysis", json={"criteria": {"rent_cost": {"value": 4, "weight": 100}}})
+    response = client.get("/metrics", headers={"Accept": "text/plain"})
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    body = response.text
+    assert 'monasib_http_request_duration_seconds_count{method="POST",route="/analysis",status="200"}' in body
+    assert 'monasib_analysis_stage_duration_seconds_count{stage="scoring"}' in body
+    assert 'monasib_cache_hit_ratio{cache="analysis_results"}' in body
+    assert "monasib_http_requests_in_flight 1.0" in body
+
+
+def test_liveness_probe():
+    response = client.get("/health/live")
+    assert response.status_code == 200
+    assert response.json() == {"status": "alive"}
+
+
+def test_readiness_probe_reports_checks():
+    """Readiness reports database, feature store and cache status without reading layers"""
+    client.post("/analysis", json={"criteria": {"rent_cost": {"value": 4, "weight": 100}}})
+    response = client.get("/health/ready")
+    assert response.status_code in [200, 503]
+    checks = response.json()["checks"]
+    assert checks["feature_store"] == "ok"
+    assert "database" in checks and "gis_engine" not in checks
+    assert "gis_engine" in client.get("/health", params={"deep": True}).json()["checks"]
@@ -0,0 +1,27 @@
+from metrics import Counter, Histogram, wants_prometheus
+
+
+def test_histogram_renders_cumulative_buckets():
+    histogram = Histogram("test_seconds", "Test latency", labels=("route",), buckets=(0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 3.0):
+        histogram.observe(value, "/a")
+    lines = histogram.render().splitlines()
+    assert lines[:2] == ["# HELP test_seconds Test latency", "# TYPE test_seconds histogram"]
+    assert 'test_seconds_bucket{route="/a",le="0.1"} 2' in lines
+    assert 'test_seconds_bucket{route="/a",le="1.0"} 3' in lines
+    assert 'test_seconds_bucket{route="/a",le="+Inf"} 4' in lines
+    assert 'test_seconds_count{route="/a"} 4' in lines
+
+
+def test_label_values_are_escaped():
+    counter = Counter("test_total", "Test counter", labels=("name",))
+    counter.inc('say "hi"\n')
+    assert 'test_total{name="say \\"hi\\"\\n"} 1.0' in counter.render()
+
+
+def test_prometheus_negotiation():
+    assert wants_prometheus("text/plain;version=0.0.4", None)
+    assert wants_prometheus("application/openmetrics-text; version=1.0.0", None)
+    assert not wants_prometheus("application/json", None)
+    assert not wants_prometheus("text/plain", "json")
+    assert wants_prometheus(None, "prometheus")
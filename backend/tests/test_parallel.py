@@ -0,0 +1,48 @@
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+import parallel
+from feature_store import CandidateStore
+from parallel import ShardedScorer
+from ranking import ScoreAccumulator
+from scoring import score_candidates
+
+
+def test_sharded_scores_match_serial():
+    """Shards scored in worker processes merge to the serial result"""
+    store = CandidateStore.generate(40.7128, -74.0060, 10001, seed=5)
+    criteria = {"competitors": {"value": 500, "weight": 40}, "foot_traffic": {"value": 7, "weight": 60}}
+    expected = score_candidates(store.columns, criteria)
+    serial = ScoreAccumulator(10)
+    serial.add(expected)
+
+    scorer = ShardedScorer(workers=3)
+    try:
+        scores, accumulator = scorer.score(store, criteria, k=10)
+        np.testing.assert_allclose(scores, expected)
+        assert accumulator.summary() == serial.summary()
+        assert list(accumulator.top_index) == list(serial.top_index)
+
+        # A new store version is re-exported to shared memory
+        store.columns["foot_traffic"] = np.full(len(store), 10, dtype=np.uint8)
+        store.seed = 6
+        scores, _ = scorer.score(store, criteria, k=10)
+        np.testing.assert_allclose(scores, score_candidates(store.columns, criteria))
+    finally:
+        scorer.shutdown()
+
+
+def test_concurrent_stores_keep_their_shared_memory(monkeypatch):
+    """Scoring other stores while shards are queued never removes blocks still in use"""
+    monkeypatch.setattr(parallel, "MAX_SHARED_STORES", 1)
+    criteria = {"competitors": {"value": 500, "weight": 40}, "foot_traffic": {"value": 7, "weight": 60}}
+    stores = [CandidateStore.generate(40.7128, -74.0060, 20000, seed=seed) for seed in range(4)]
+
+    scorer = ShardedScorer(workers=2)
+    try:
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            results = list(executor.map(lambda store: scorer.score(store, criteria)[0], stores * 3))
+        for store, scores in zip(stores * 3, results):
+            np.testing.assert_allclose(scores, score_candidates(store.columns, criteria))
+        assert len(scorer._shared) == 1 and scorer._retired == []
+    finally:
+        scorer.shutdown()
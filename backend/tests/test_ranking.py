@@ -0,0 +1,39 @@
+import numpy as np
+from ranking import ScoreAccumulator, select_top
+
+
+def reference_ranking(scores):
+    """Full stable sort of candidates scoring above zero"""
+    index = np.flatnonzero(scores > 0)
+    rounded = np.round(scores[index], 2)
+    return index[np.argsort(-rounded, kind='stable')], rounded
+
+
+def test_select_top_matches_full_sort():
+    """Partial selection returns the same order as a stable full sort, ties included"""
+    rng = np.random.default_rng(1)
+    scores = rng.integers(0, 50, 5000) / 2.0  # Many ties
+    expected, _ = reference_ranking(scores)
+    index = np.flatnonzero(scores > 0)
+    top_index, _ = select_top(index, scores[index], 25)
+    np.testing.assert_array_equal(top_index, expected[:25])
+
+
+def test_accumulator_over_chunks_matches_whole_array():
+    """Chunked statistics and merged shards equal whole-array results"""
+    rng = np.random.default_rng(2)
+    scores = np.where(rng.random(10001) < 0.1, 0, rng.uniform(0, 100, 10001))
+    expected_index, rounded = reference_ranking(scores)
+
+    first, second = ScoreAccumulator(10), ScoreAccumulator(10)
+    for start in range(0, 6000, 1000):
+        first.add(scores[start:start + 1000], offset=start)
+    second.add(scores[6000:], offset=6000)
+    first.merge(second)
+
+    summary = first.summary()
+    assert summary["scored"] == len(rounded)
+    assert summary["suitable"] == int(np.count_nonzero(rounded >= 60))
+    assert summary["average_score"] == round(float(np.mean(rounded)), 2)
+    assert summary["median_score"] == round(float(np.median(rounded)), 2)
+    np.testing.assert_array_equal(first.top_index, expected_index[:10])
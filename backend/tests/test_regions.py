@@ -0,0 +1,169 @@
+import io
+import os
+import json
+import numpy as np
+import pytest
+import geopandas as gpd
+from fastapi.testclient import TestClient
+import regions
+from pydantic import ValidationError
+from config import Settings, settings
+from feature_store import CandidateStore
+from density import compute_density_columns
+from spatial import compute_distance_columns
+from regions import (area_store, dataset_store, partition_database, partition_key, partition_keys, resolve_area,
+                     tile_lonlat_bounds, tile_xy)
+from main import app
+
+client = TestClient(app)
+
+NEW_YORK = (-74.05, 40.68, -73.95, 40.75)
+BOSTON = (-71.12, 42.33, -71.02, 42.38)
+CRITERIA = {"competitors": {"value": 500, "weight": 50}, "foot_traffic": {"value": 7, "weight": 50}}
+
+
+def random_points(rng, bbox, count):
+    return rng.uniform(bbox[0], bbox[2], count), rng.uniform(bbox[1], bbox[3], count)
+
+
+@pytest.fixture
+def partitioned(tmp_path, monkeypatch):
+    """Two cities split into zoom 10 partitions from one GeoPackage"""
+    rng = np.random.default_rng(4)
+    path = str(tmp_path / "gis.gpkg")
+    for layer_name in ("restaurants", "high_traffic_areas"):
+        lng, lat = zip(random_points(rng, NEW_YORK, 60), random_points(rng, BOSTON, 40))
+        gdf = gpd.GeoDataFrame({"importance": rng.integers(1, 10, 100)},
+                               geometry=gpd.points_from_xy(np.concatenate(lng), np.concatenate(lat)), crs="EPSG:4326")
+        gdf.to_file(path, layer=layer_name, driver="GPKG", engine="pyogrio")
+
+    lng, lat = zip(random_points(rng, NEW_YORK, 300), random_points(rng, BOSTON, 200))
+    store = CandidateStore.generate(0, 0, 500, seed=9)
+    store.longitude, store.latitude = np.concatenate(lng), np.concatenate(lat)
+
+    monkeypatch.setattr(settings, "partitions_enabled", True)
+    monkeypatch.setattr(settings, "regions", {"new_york": list(NEW_YORK), "boston": list(BOSTON)})
+    monkeypatch.setattr(regions.partitions, "directory", str(tmp_path / "partitions"))
+    monkeypatch.setattr(regions.partitions, "zoom", 10)
+    partition_database(path, store, chunk_size=25)
+    yield regions.partitions
+    regions.partitions.clear()
+
+
+def test_tiles_cover_a_bbox():
+    x, y = tile_xy(np.array([-74.0]), np.array([40.7]), 10)
+    minx, miny, maxx, maxy = tile_lonlat_bounds(10, int(x[0]), int(y[0]))
+    assert minx <= -74.0 <= maxx and miny <= 40.7 <= maxy
+    assert len(partition_keys((minx + 1e-6, miny + 1e-6, maxx - 1e-6, maxy - 1e-6), 10)) == 1
+    assert len(partition_keys((minx - 1e-6, miny + 1e-6, maxx - 1e-6, maxy - 1e-6), 10)) == 2
+
+
+def test_resolve_area():
+    assert resolve_area() is None
+    assert resolve_area(bbox=[-74, 40, -73, 41]) == (-74, 40, -73, 41)
+    with pytest.raises(ValueError):
+        resolve_area(region="atlantis")
+    with pytest.raises(ValueError):
+        resolve_area(bbox=[-73, 40, -74, 41])
+
+
+def test_area_store_opens_only_touched_partitions(partitioned):
+    store = area_store(NEW_YORK)
+    assert len(store) == 300
+    assert all(key in partitioned.covering(NEW_YORK) for key in partitioned.stats()["open_keys"])
+    assert not set(partitioned.covering(BOSTON)) & set(partitioned.stats()["open_keys"])
+    assert dataset_store(store.version) is store
+
+    # Cold partitions are closed once too many are open, and reopen lazily
+    partitioned.max_open = 1
+    assert len(area_store(BOSTON)) == 200
+    assert partitioned.stats()["open"] == 1 and partitioned.evicted > 0
+    assert len(area_store(NEW_YORK)) == 300
+
+
+def test_region_requests(partitioned):
+    response = client.post("/analysis", json={"criteria": CRITERIA, "region": "boston"})
+    assert response.status_code == 200 and response.json()["total_locations_analyzed"] == 200
+    analysis_id = response.json()["analysis_id"]
+    page = client.get(f"/analysis/{analysis_id}/results?page=1&page_size=5").json()
+    assert all(BOSTON[0] <= location["longitude"] <= BOSTON[2] for location in page["locations"])
+    assert client.post("/analysis", json={"criteria": CRITERIA, "region": "paris"}).status_code == 400
+
+    # Pages follow a cursor across the partitions of the area
+    ids, cursor = [], None
+    while True:
+        params = {"region": "new_york", "limit": 7, **({"cursor": cursor} if cursor else {})}
+        body = client.get("/layers/restaurants", params=params).json()
+        ids += [feature["id"] for feature in body["features"]]
+        cursor = body.get("next_cursor")
+        if cursor is None:
+            break
+    assert len(ids) == len(set(ids)) == 60
+
+    layers = {layer["id"]: layer for layer in client.get("/layers?region=boston").json()["layers"]}
+    assert layers["restaurants"]["feature_count"] == 40
+
+
+def test_uploads_are_routed_to_partitions(partitioned):
+    features = [{"type": "Feature", "properties": {"importance": 3},
+                 "geometry": {"type": "Point", "coordinates": [-71.06 + i * 1e-3, 42.35]}} for i in range(5)]
+    data = json.dumps({"type": "FeatureCollection", "features": features}).encode()
+    response = client.post("/layers/high_traffic_areas/upload?mode=replace",
+                           files={"file": ("traffic.geojson", io.BytesIO(data))})
+    assert response.status_code == 200
+    assert set(response.json()["partitions"]) <= set(partitioned.covering(BOSTON))
+
+    counts = {region: sum(layer["feature_count"]
+                          for layer in client.get(f"/layers?region={region}").json()["layers"]
+                          if layer["id"] == "high_traffic_areas")
+              for region in ("new_york", "boston")}
+    assert counts == {"new_york": 0, "boston": 5}
+
+
+def test_unknown_layers_are_not_found(partitioned, tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "tile_cache_dir", str(tmp_path / "tiles"))
+    assert client.get("/tiles/no_such_layer/10/301/385.mvt").status_code == 404
+    assert client.get("/layers/no_such_layer?region=boston").status_code == 404
+    assert client.get("/layers/no_such_layer/aggregate?z=10&region=boston").status_code == 404
+    assert not os.path.exists(settings.tile_cache_dir)
+
+    # A known layer outside every partition is empty
+    response = client.get("/tiles/restaurants/10/0/0.mvt")
+    assert response.status_code == 200 and response.content == b""
+    assert client.get("/layers/restaurants?bbox=10,10,11,11").json()["features"] == []
+    assert not os.path.exists(settings.tile_cache_dir)
+
+
+def test_partition_zoom_is_limited(monkeypatch):
+    monkeypatch.setenv("PARTITION_ZOOM", "12")
+    with pytest.raises(ValidationError):
+        Settings()
+
+
+def test_partition_columns_see_features_across_the_tile_edge(tmp_path, monkeypatch):
+    """Candidates near a tile edge take distances and densities from the neighbouring partition too"""
+    minx, miny, maxx, maxy = tile_lonlat_bounds(10, 301, 385)
+    edge, lat = maxx, (miny + maxy) / 2
+    path = str(tmp_path / "gis.gpkg")
+    for layer_name in ("restaurants", "high_traffic_areas"):
+        gdf = gpd.GeoDataFrame({"importance": [5, 5]}, crs="EPSG:4326",
+                               geometry=gpd.points_from_xy([edge + 0.002, minx + 0.01], [lat, lat]))
+        gdf.to_file(path, layer=layer_name, driver="GPKG", engine="pyogrio")
+
+    store = CandidateStore.generate(0, 0, 3, seed=9)
+    store.longitude, store.latitude = np.array([edge - 0.002, edge - 0.01, minx + 0.02]), np.full(3, lat)
+    expected = {**compute_distance_columns(store.longitude, store.latitude, path),
+                **compute_density_columns(store.longitude, store.latitude, path)}
+
+    monkeypatch.setattr(settings, "partitions_enabled", True)
+    monkeypatch.setattr(regions.partitions, "directory", str(tmp_path / "partitions"))
+    monkeypatch.setattr(regions.partitions, "zoom", 10)
+    try:
+        partition_database(path, store, chunk_size=25)
+        assert len(regions.partitions.keys()) == 2
+        derived = regions.partitions.get(partition_key(10, 301, 385)).store
+        np.testing.assert_allclose(derived.columns["competitors"], expected["competitors"], rtol=1e-4)
+        np.testing.assert_array_equal(derived.columns["foot_traffic"], expected["foot_traffic"])
+        assert derived.columns["competitors"][0] < 400
+    finally:
+        regions.partitions.clear()
@@ -0,0 +1,89 @@
+import random
+import numpy as np
+import pytest
+from feature_store import CandidateStore
+from parameters import RESTAURANT_PARAMETERS
+from scoring import locations_to_columns, score_batch, score_candidates
+
+
+def reference_score(location, criteria):
+    """Suitability score of one location, parameter by parameter"""
+    total_score = 0
+    total_weight = 0
+    for param_id, param_criteria in criteria.items():
+        if param_id not in RESTAURANT_PARAMETERS:
+            continue
+        param_config = RESTAURANT_PARAMETERS[param_id]
+        value = location['parameters'].get(param_id, 0)
+        threshold = param_criteria['value']
+
+        if param_config['type'] == 'distance':
+            if value <= threshold:
+                param_score = 100 - (value / threshold * 50)
+            else:
+                param_score = max(0, 50 - ((value - threshold) / threshold * 50))
+        elif param_config.get('inverted'):
+            param_score = max(0, 100 - (value / 10 * 100))
+        elif value >= threshold:
+            param_score = 100
+        else:
+            param_score = (value / threshold) * 100
+
+        total_score += param_score * (param_criteria['weight'] / 100)
+        total_weight += param_criteria['weight']
+    return min(100, (total_score / total_weight) * 100) if total_weight > 0 else 0
+
+
+def random_criteria(rng):
+    """Build a random criteria payload over a subset of the parameters"""
+    criteria = {}
+    for param_id, config in RESTAURANT_PARAMETERS.items():
+        if rng.random() < 0.3:
+            continue
+        value = rng.randint(50, 2000) if config['type'] == 'distance' else rng.randint(0, 10)
+        criteria[param_id] = {"value": value, "weight": rng.randint(0, 40)}
+    return criteria
+
+
+def test_vectorized_scores_match_per_location_scores():
+    """The vectorized engine gives the same scores as scoring each location on its own"""
+    rng = random.Random(42)
+    store = CandidateStore.generate(40.7128, -74.0060, 500, seed=42)
+    locations = [store.location(i) for i in range(len(store))]
+    assert all(np.array_equal(column, store.columns[param_id])
+               for param_id, column in locations_to_columns(locations).items())
+
+    for _ in range(20):
+        criteria = random_criteria(rng)
+        expected = [reference_score(location, criteria) for location in locations]
+        np.testing.assert_allclose(score_candidates(store.columns, criteria), expected, rtol=0, atol=1e-9)
+
+
+def test_unknown_parameters_are_ignored():
+    """Criteria for unknown parameters do not contribute to the score"""
+    columns = {"foot_traffic": np.array([3, 7, 10])}
+    criteria = {
+        "foot_traffic": {"value": 6, "weight": 50},
+        "unknown": {"value": 1, "weight": 50}
+    }
+    np.testing.assert_allclose(score_candidates(columns, criteria), [50.0, 100.0, 100.0])
+
+
+def test_zero_distance_threshold_raises():
+    """A zero distance threshold is rejected like the per-location reference"""
+    columns = {"competitors": np.array([100.0])}
+    with pytest.raises(ZeroDivisionError):
+        score_candidates(columns, {"competitors": {"value": 0, "weight": 100}})
+
+
+def test_batch_scores_match_single_scores():
+    """Scoring K criteria sets at once matches scoring them one by one"""
+    rng = random.Random(7)
+    columns = CandidateStore.generate(40.7128, -74.0060, 300, seed=7).columns
+    criteria_list = [random_criteria(rng) for _ in range(12)]
+
+    batch = score_batch(columns, criteria_list)
+    assert batch.shape == (300, 12)
+    for k, criteria in enumerate(criteria_list):
+        np.testing.assert_allclose(batch[:, k], score_candidates(columns, criteria), rtol=0, atol=1e-9)
+    np.testing.assert_allclose(score_batch(columns, criteria_list, 100, 200), batch[100:200])
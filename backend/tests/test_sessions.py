@@ -0,0 +1,69 @@
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+import sessions
+from feature_store import CandidateStore
+from scoring import score_candidates
+from sessions import AnalysisSession
+from main import app
+
+
+CRITERIA = {
+    "competitors": {"value": 500, "weight": 30},
+    "foot_traffic": {"value": 7, "weight": 40},
+    "rent_cost": {"value": 5, "weight": 30}
+}
+
+
+def test_incremental_updates_match_full_scoring():
+    """Scores after a series of slider moves equal scoring from scratch"""
+    store = CandidateStore.generate(40.7128, -74.0060, 2000, seed=3)
+    session = AnalysisSession("s1", store, dict(CRITERIA))
+
+    session.update({"foot_traffic": {"value": 7, "weight": 55}})
+    session.update({"competitors": {"value": 800, "weight": 15}})
+    session.update({"safety_level": {"value": 6, "weight": 20}}, remove=["rent_cost"])
+
+    expected = score_candidates(store.columns, session.criteria)
+    np.testing.assert_allclose(session.scores(), expected, atol=1e-9)
+    assert set(session.criteria) == {"competitors", "foot_traffic", "safety_level"}
+
+
+def test_weight_change_does_not_rescore(monkeypatch):
+    """Moving a weight slider reuses the stored partial score"""
+    store = CandidateStore.generate(40.7128, -74.0060, 500, seed=3)
+    session = AnalysisSession("s2", store, dict(CRITERIA))
+
+    calls = []
+    original = sessions.score_parameter
+    monkeypatch.setattr(sessions, "score_parameter", lambda *args: calls.append(args) or original(*args))
+    session.update({"foot_traffic": {"value": 7, "weight": 10}})
+    assert calls == []
+    session.update({"foot_traffic": {"value": 9, "weight": 10}})
+    assert len(calls) == 1
+
+
+def test_failed_update_leaves_the_session_unchanged():
+    """An invalid criterion is rejected without touching the running totals"""
+    store = CandidateStore.generate(40.7128, -74.0060, 500, seed=3)
+    session = AnalysisSession("s3", store, {"competitors": {"value": 500, "weight": 20},
+                                            "rent_cost": {"value": 3, "weight": 80}})
+
+    for criteria in ({"competitors": {"value": 0, "weight": 50}},
+                     {"competitors": {"value": 600}},
+                     {"rent_cost": {"value": 2, "weight": 10}, "foot_traffic": "high"}):
+        with pytest.raises(ValueError):
+            session.update(criteria)
+    assert session.criteria["rent_cost"]["weight"] == 80 and session.total_weight == 100
+
+    session.update({"competitors": {"value": 600, "weight": 30}})
+    np.testing.assert_allclose(session.scores(), score_candidates(store.columns, session.criteria), atol=1e-9)
+    assert session.total_weight == 110
+
+
+def test_invalid_session_update_is_a_bad_request():
+    client = TestClient(app)
+    session_id = client.post("/analysis/sessions", json={"criteria": CRITERIA}).json()["session_id"]
+    response = client.patch(f"/analysis/sessions/{session_id}",
+                            json={"criteria": {"competitors": {"value": 0, "weight": 50}}})
+    assert response.status_code == 400
@@ -0,0 +1,33 @@
+import numpy as np
+import geopandas as gpd
+import shapely
+from shapely.geometry import Point
+from spatial import compute_distance_columns, nearest_distances, utm_crs
+
+
+def test_nearest_distances_match_brute_force():
+    """STRtree distances equal the minimum over all features"""
+    rng = np.random.default_rng(0)
+    points = shapely.points(rng.uniform(0, 5000, (300, 2)))
+    features = gpd.GeoSeries(shapely.points(rng.uniform(0, 5000, (50, 2))))
+
+    expected = [min(p.distance(f) for f in features) for p in points]
+    np.testing.assert_allclose(nearest_distances(points, features), expected)
+
+
+def test_nearest_distances_empty_layer():
+    """An empty layer yields no distances"""
+    assert nearest_distances(shapely.points([[0, 0]]), gpd.GeoSeries([], dtype="geometry")) is None
+
+
+def test_compute_distance_columns_in_meters(tmp_path):
+    """Distances are measured in meters in a projected CRS"""
+    db_path = str(tmp_path / "test.gpkg")
+    # One stop ~111m north of the candidate
+    stops = gpd.GeoDataFrame({'id': [1]}, geometry=[Point(-74.0, 40.701)], crs="EPSG:4326")
+    stops.to_file(db_path, layer='transport_stops', driver="GPKG")
+
+    columns = compute_distance_columns(np.array([-74.0]), np.array([40.7]), db_path)
+    assert set(columns) == {'public_transport'}
+    assert abs(columns['public_transport'][0] - 111) < 2
+    assert utm_crs(np.array([-74.0]), np.array([40.7])).to_epsg() == 32618
@@ -0,0 +1,63 @@
+import json
+import geopandas as gpd
+import pytest
+from shapely.geometry import Point
+from gpkg import GeoPackage
+from streaming import parse_bbox, select_properties, stream_feature_collection
+
+
+@pytest.fixture
+def gpkg(tmp_path):
+    path = str(tmp_path / "test.gpkg")
+    stops = gpd.GeoDataFrame(
+        {'name': [f'Stop {i}' for i in range(10)], 'importance': list(range(10))},
+        geometry=[Point(i, i) for i in range(10)],
+        crs="EPSG:4326"
+    )
+    stops.to_file(path, layer='transport_stops', driver="GPKG")
+    return GeoPackage(path)
+
+
+def read_collection(gpkg, **kwargs):
+    table = gpkg.feature_table('transport_stops')
+    columns = select_properties(table, kwargs.pop('properties', None))
+    return json.loads(b"".join(stream_feature_collection(gpkg, table, columns, batch_size=3, **kwargs)))
+
+
+def test_streams_full_layer(gpkg):
+    """Every feature is streamed with its geometry and properties"""
+    collection = read_collection(gpkg)
+    assert collection['type'] == 'FeatureCollection'
+    assert len(collection['features']) == 10
+    feature = collection['features'][2]
+    assert feature['geometry'] == {'type': 'Point', 'coordinates': [2.0, 2.0]}
+    assert feature['properties'] == {'name': 'Stop 2', 'importance': 2}
+    assert 'next_cursor' not in collection
+
+
+def test_bbox_and_property_selection(gpkg):
+    """The bbox filter and property selection are applied"""
+    collection = read_collection(gpkg, bbox=parse_bbox("1.5,1.5,4.5,4.5"), properties="name")
+    assert [f['properties'] for f in collection['features']] == [
+        {'name': 'Stop 2'}, {'name': 'Stop 3'}, {'name': 'Stop 4'}
+    ]
+
+
+def test_cursor_pagination(gpkg):
+    """Pages chained through next_cursor cover the layer exactly once"""
+    ids, cursor = [], None
+    while True:
+        page = read_collection(gpkg, limit=4, cursor=cursor)
+        ids.extend(f['id'] for f in page['features'])
+        cursor = page.get('next_cursor')
+        if cursor is None:
+            break
+    assert ids == list(range(1, 11))
+
+
+def test_invalid_requests():
+    """Malformed bboxes are rejected"""
+    with pytest.raises(ValueError):
+        parse_bbox("1,2,3")
+    with pytest.raises(ValueError):
+        parse_bbox("5,0,1,1")
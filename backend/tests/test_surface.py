@@ -0,0 +1,62 @@
+import zlib
+import numpy as np
+from feature_store import CandidateStore
+from surface import (NODATA, SurfaceGrid, compute_surface, distance_raster, encode_grid, encode_png,
+                     nearest_index_raster)
+
+
+def test_distance_raster_measures_meters():
+    """Cells are measured in meters from the cell holding the feature"""
+    grid = SurfaceGrid((0.0, 0.0, 0.01, 0.01), 10, 10)
+    distances = distance_raster(grid, np.array([0.0005]), np.array([0.0095]))
+    assert distances[0, 0] == 0
+    assert abs(distances[0, 5] - 5 * grid.cell_dx) < 1e-3
+    assert abs(distances[9, 0] - 9 * grid.cell_dy) < 1e-3
+
+
+def test_distance_raster_counts_features_outside_bbox():
+    """Features in the margin around the bbox still bound the distance"""
+    grid = SurfaceGrid((0.0, 0.0, 0.01, 0.01), 10, 10)
+    distances = distance_raster(grid, np.array([0.0105]), np.array([0.0095]))
+    assert np.isfinite(distances).all()
+    assert abs(distances[0, 9] - grid.cell_dx) < 1e-3
+
+
+def test_surface_matches_candidate_scores():
+    """Cells holding a candidate score the same as the candidate itself"""
+    store = CandidateStore.generate(40.7128, -74.0060, count=50, seed=1)
+    criteria = {'foot_traffic': {'value': 7, 'weight': 60}, 'rent_cost': {'value': 5, 'weight': 40}}
+    grid = SurfaceGrid((-74.07, 40.66, -73.94, 40.76), 200, 200)
+    surface = compute_surface(criteria, grid, store)
+
+    row, col = grid.cell_index(store.longitude, store.latitude)
+    traffic = store.columns['foot_traffic'].astype(float)
+    rent = store.columns['rent_cost'].astype(float)
+    expected = (np.where(traffic >= 7, 100, traffic / 7 * 100) * 0.6 + np.maximum(0, 100 - rent * 10) * 0.4)
+    # Candidates sharing a cell cannot all be matched, so compare by majority
+    assert np.mean(np.isclose(surface[row, col], expected)) > 0.9
+
+
+def test_grid_and_png_encoding():
+    """The grid is one byte per cell and the PNG is a valid palette image"""
+    surface = np.array([[0.0, 49.6], [100.0, 12.2]])
+    assert encode_grid(surface) == bytes([0, 50, 100, 12])
+
+    png = encode_png(surface)
+    assert png.startswith(b"\x89PNG\r\n\x1a\n")
+    idat = png.index(b"IDAT")
+    length = int.from_bytes(png[idat - 4:idat], "big")
+    assert zlib.decompress(png[idat + 4:idat + 4 + length]) == bytes([0, 0, 50, 0, 100, 12])
+
+
+def test_cells_far_from_every_candidate_have_no_score():
+    """Cells beyond the fill distance are NODATA instead of copying an arbitrary candidate"""
+    store = CandidateStore.generate(40.7128, -74.0060, count=50, seed=1)
+    criteria = {'rent_cost': {'value': 5, 'weight': 100}}
+    elsewhere = compute_surface(criteria, SurfaceGrid((10.0, 10.0, 10.1, 10.1), 20, 20), store)
+    assert np.isnan(elsewhere).all()
+    assert set(encode_grid(elsewhere)) == {NODATA}
+
+    grid = SurfaceGrid((0.0, 0.0, 0.1, 0.1), 100, 100)
+    nearest = nearest_index_raster(grid, np.array([0.0005]), np.array([0.0995]), max_distance_m=500)
+    assert nearest[0, 0] == 0 and nearest[0, 3] == 0 and nearest[99, 99] == -1
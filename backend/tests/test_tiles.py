@@ -0,0 +1,46 @@
+import os
+import numpy as np
+import geopandas as gpd
+from shapely.geometry import Point, Polygon
+from config import settings
+from gpkg import GeoPackage
+from tiles import ORIGIN_SHIFT, encode_geometry, get_tile, tile_bounds
+
+
+def to_ints(coords):
+    return np.round(coords).astype(np.int64)
+
+
+def test_tile_bounds():
+    """Tile 0/0/0 covers the whole Web Mercator plane"""
+    assert tile_bounds(0, 0, 0) == (-ORIGIN_SHIFT, -ORIGIN_SHIFT, ORIGIN_SHIFT, ORIGIN_SHIFT)
+    minx, miny, maxx, maxy = tile_bounds(1, 1, 0)
+    assert (minx, maxy) == (0, ORIGIN_SHIFT)
+
+
+def test_point_geometry_commands():
+    """A point is a single MoveTo with zigzag encoded deltas"""
+    assert encode_geometry(Point(25, 17), to_ints) == (1, [9, 50, 34])
+
+
+def test_polygon_geometry_commands():
+    """Polygons emit MoveTo, LineTo and ClosePath without the closing point"""
+    geom_type, commands = encode_geometry(Polygon([(0, 0), (0, 10), (10, 10), (10, 0)]), to_ints)
+    assert geom_type == 3
+    assert commands[0] == 9 and commands[3] == (2 | (3 << 3)) and commands[-1] == 15
+
+
+def test_tiles_are_cached_per_layer_version(tmp_path, monkeypatch):
+    """Rendered tiles are written to and served from the disk cache"""
+    db_path = str(tmp_path / "test.gpkg")
+    gpd.GeoDataFrame({'name': ['a']}, geometry=[Point(-74.0, 40.7)], crs="EPSG:4326").to_file(
+        db_path, layer='restaurants', driver="GPKG")
+    monkeypatch.setattr(settings, "tile_cache_dir", str(tmp_path / "tiles"))
+    monkeypatch.setattr(settings, "cache_enabled", True)
+
+    gpkg = GeoPackage(db_path)
+    table = gpkg.feature_table('restaurants')
+    data = get_tile(gpkg, table, "v1", 0, 0, 0)
+    assert b"restaurants" in data
+    assert os.path.exists(str(tmp_path / "tiles" / "restaurants" / "v1" / "0" / "0" / "0.mvt"))
+    assert get_tile(gpkg, table, "v1", 1, 1, 1) == b""  # Southern hemisphere, east: empty
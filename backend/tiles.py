@@ -0,0 +1,280 @@
+"""
+Mapbox Vector Tile encoding for Monasib backend
+"""
+import os
+import math
+import struct
+import numpy as np
+import shapely
+from shapely.geometry.polygon import orient
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from config import settings
+from gpkg import FeatureTable, GeoPackage, blob_to_wkb
+from files import atomic_path
+
+
+EARTH_RADIUS = 6378137.0
+ORIGIN_SHIFT = math.pi * EARTH_RADIUS  # Half the width of the Web Mercator plane
+MAX_LATITUDE = 85.0511287798
+
+# MVT geometry types and commands
+GEOM_POINT, GEOM_LINESTRING, GEOM_POLYGON = 1, 2, 3
+CMD_MOVE_TO, CMD_LINE_TO, CMD_CLOSE_PATH = 1, 2, 7
+
+
+def tile_bounds(z: int, x: int, y: int) -> Tuple[float, float, float, float]:
+    """Web Mercator bounds (minx, miny, maxx, maxy) of an XYZ tile"""
+    size = 2 * ORIGIN_SHIFT / (1 << z)
+    minx = -ORIGIN_SHIFT + x * size
+    maxy = ORIGIN_SHIFT - y * size
+    return minx, maxy - size, minx + size, maxy
+
+
+def mercator_to_lonlat(x: np.ndarray, y: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Convert Web Mercator meters to WGS84 degrees"""
+    lon = np.degrees(x / EARTH_RADIUS)
+    lat = np.degrees(2 * np.arctan(np.exp(y / EARTH_RADIUS)) - math.pi / 2)
+    return lon, lat
+
+
+def lonlat_to_mercator(coords: np.ndarray) -> np.ndarray:
+    """Convert an (N, 2) array of WGS84 degrees to Web Mercator meters"""
+    lon = coords[:, 0]
+    lat = np.clip(coords[:, 1], -MAX_LATITUDE, MAX_LATITUDE)
+    x = np.radians(lon) * EARTH_RADIUS
+    y = np.log(np.tan(math.pi / 4 + np.radians(lat) / 2)) * EARTH_RADIUS
+    return np.column_stack([x, y])
+
+
+# Protocol buffer primitives
+
+def _varint(value: int) -> bytes:
+    out = bytearray()
+    while True:
+        byte = value & 0x7F
+        value >>= 7
+        if value:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return bytes(out)
+
+
+def _zigzag(value: int) -> int:
+    return (value << 1) ^ (value >> 63)
+
+
+def _field(number: int, wire_type: int) -> bytes:
+    return _varint((number << 3) | wire_type)
+
+
+def _bytes_field(number: int, payload: bytes) -> bytes:
+    return _field(number, 2) + _varint(len(payload)) + payload
+
+
+def _packed_field(number: int, values: Sequence[int]) -> bytes:
+    return _bytes_field(number, b"".join(_varint(v) for v in values))
+
+
+def _encode_value(value: Any) -> bytes:
+    """Encode a property value as an MVT Value message"""
+    if isinstance(value, bool):
+        return _field(7, 0) + _varint(int(value))
+    if isinstance(value, (int, np.integer)):
+        return _field(6, 0) + _varint(_zigzag(int(value)))
+    if isinstance(value, (float, np.floating)):
+        return _field(3, 1) + struct.pack("<d", float(value))
+    return _bytes_field(1, str(value).encode())
+
+
+# Geometry command encoding
+
+def _command(command: int, count: int) -> int:
+    return (command & 0x7) | (count << 3)
+
+
+def _dedupe(coords: np.ndarray) -> np.ndarray:
+    """Drop consecutive duplicate points created by quantization"""
+    if len(coords) < 2:
+        return coords
+    keep = np.ones(len(coords), dtype=bool)
+    keep[1:] = np.any(coords[1:] != coords[:-1], axis=1)
+    return coords[keep]
+
+
+class _Cursor:
+    """Tracks the pen position while emitting delta-encoded commands"""
+
+    def __init__(self):
+        self.x = 0
+        self.y = 0
+        self.commands: List[int] = []
+
+    def move_to(self, points: np.ndarray):
+        self.commands.append(_command(CMD_MOVE_TO, len(points)))
+        self._deltas(points)
+
+    def line_to(self, points: np.ndarray):
+        self.commands.append(_command(CMD_LINE_TO, len(points)))
+        self._deltas(points)
+
+    def close_path(self):
+        self.commands.append(_command(CMD_CLOSE_PATH, 1))
+
+    def _deltas(self, points: np.ndarray):
+        for px, py in points.tolist():
+            self.commands.append(_zigzag(px - self.x))
+            self.commands.append(_zigzag(py - self.y))
+            self.x, self.y = px, py
+
+
+def encode_geometry(geometry, transform) -> Optional[Tuple[int, List[int]]]:
+    """
+    Encode a shapely geometry into an MVT (type, commands) pair.
+
+    transform maps an (N, 2) coordinate array into integer tile space.
+    Returns None when nothing drawable survives quantization.
+    """
+    cursor = _Cursor()
+    geom_type = shapely.get_type_id(geometry)
+
+    if geom_type in (0, 4):  # Point, MultiPoint
+        points = transform(shapely.get_coordinates(geometry))
+        if len(points) == 0:
+            return None
+        cursor.move_to(points)
+        return GEOM_POINT, cursor.commands
+
+    if geom_type in (1, 2, 5):  # LineString, LinearRing, MultiLineString
+        for line in shapely.get_parts(geometry):
+            coords = _dedupe(transform(shapely.get_coordinates(line)))
+            if len(coords) < 2:
+                continue
+            cursor.move_to(coords[:1])
+            cursor.line_to(coords[1:])
+        return (GEOM_LINESTRING, cursor.commands) if cursor.commands else None
+
+    if geom_type in (3, 6):  # Polygon, MultiPolygon
+        for polygon in shapely.get_parts(geometry):
+            # Exterior counter-clockwise in y-up space becomes clockwise once y is flipped
+            polygon = orient(polygon, sign=1.0)
+            rings = [polygon.exterior] + list(polygon.interiors)
+            for index, ring in enumerate(rings):
+                coords = _dedupe(transform(shapely.get_coordinates(ring)))[:-1]
+                if len(coords) < 3:
+                    if index == 0:
+                        break  # Degenerate exterior, skip the whole polygon
+                    continue
+                cursor.move_to(coords[:1])
+                cursor.line_to(coords[1:])
+                cursor.close_path()
+        return (GEOM_POLYGON, cursor.commands) if cursor.commands else None
+
+    if geom_type == 7:  # GeometryCollection: encode the first drawable member
+        for part in shapely.get_parts(geometry):
+            encoded = encode_geometry(part, transform)
+            if encoded is not None:
+                return encoded
+    return None
+
+
+def encode_layer(name: str, features: List[Tuple[int, Dict[str, Any], int, List[int]]],
+                 extent: int) -> bytes:
+    """Encode (id, properties, type, commands) features as an MVT layer"""
+    keys: Dict[str, int] = {}
+    values: Dict[Tuple[type, Any], int] = {}
+    encoded_features = []
+
+    for feature_id, properties, geom_type, commands in features:
+        tags = []
+        for key, value in properties.items():
+            if value is None:
+                continue
+            key_index = keys.setdefault(key, len(keys))
+            value_index = values.setdefault((type(value), value), len(values))
+            tags.extend((key_index, value_index))
+
+        message = _field(1, 0) + _varint(max(int(feature_id), 0))
+        if tags:
+            message += _packed_field(2, tags)
+        message += _field(3, 0) + _varint(geom_type)
+        message += _packed_field(4, commands)
+        encoded_features.append(_bytes_field(2, message))
+
+    layer = _field(15, 0) + _varint(2) + _bytes_field(1, name.encode())
+    layer += b"".join(encoded_features)
+    layer += b"".join(_bytes_field(3, key.encode()) for key in keys)
+    layer += b"".join(_bytes_field(4, _encode_value(value)) for _, value in values)
+    layer += _field(5, 0) + _varint(extent)
+    return _bytes_field(3, layer)
+
+
+def tile_features(gpkg: GeoPackage, table: FeatureTable, z: int, x: int, y: int,
+                  extent: int = 4096, buffer: int = 64) -> List[Tuple[int, Dict[str, Any], int, List[int]]]:
+    """
+    Encoded features of a layer for one tile.
+
+    Features are fetched through the layer's R-tree, clipped to the tile
+    plus a buffer and simplified to about one tile unit at this zoom.
+    """
+    minx, miny, maxx, maxy = tile_bounds(z, x, y)
+    scale = extent / (maxx - minx)
+    margin = buffer / scale
+    clip = (minx - margin, miny - margin, maxx + margin, maxy + margin)
+    lon, lat = mercator_to_lonlat(np.array([clip[0], clip[2]]), np.array([clip[1], clip[3]]))
+    bbox = (lon[0], lat[0], lon[1], lat[1])
+
+    def to_tile(coords: np.ndarray) -> np.ndarray:
+        tile_x = np.round((coords[:, 0] - minx) * scale)
+        tile_y = np.round((maxy - coords[:, 1]) * scale)
+        return np.column_stack([tile_x, tile_y]).astype(np.int64)
+
+    features = []
+    for rows in gpkg.iter_features(table, table.columns, bbox=bbox):
+        geometries = shapely.from_wkb(np.array([blob_to_wkb(row[1]) for row in rows], dtype=object))
+        geometries = shapely.transform(geometries, lonlat_to_mercator)
+        keep = shapely.intersects(geometries, shapely.box(*clip))
+        polygonal = shapely.get_type_id(geometries) != 0
+        geometries[polygonal] = shapely.clip_by_rect(geometries[polygonal], *clip)
+        geometries[polygonal] = shapely.simplify(geometries[polygonal], 1 / scale, preserve_topology=False)
+
+        for row, geometry, kept in zip(rows, geometries, keep):
+            if not kept or geometry is None or geometry.is_empty:
+                continue
+            encoded = encode_geometry(geometry, to_tile)
+            if encoded is not None:
+                features.append((row[0], dict(zip(table.columns, row[2:])), *encoded))
+    return features
+
+
+def render_tile(gpkg: GeoPackage, table: FeatureTable, z: int, x: int, y: int, extent: int = 4096) -> bytes:
+    """Build one vector tile for a layer"""
+    features = tile_features(gpkg, table, z, x, y, extent)
+    return encode_layer(table.name, features, extent) if features else b""
+
+
+def tile_cache_path(layer_name: str, version: str, z: int, x: int, y: int) -> str:
+    """Disk location of a cached tile for one layer version"""
+    safe_version = "".join(c if c.isalnum() else "_" for c in version)
+    return os.path.join(settings.tile_cache_dir, layer_name, safe_version, str(z), str(x), f"{y}.mvt")
+
+
+def get_tile(gpkg: GeoPackage, table: FeatureTable, version: str, z: int, x: int, y: int) -> bytes:
+    """Return a tile from the disk cache, rendering and storing it on a miss"""
+    return cached_tile(table.name, version, z, x, y, lambda: render_tile(gpkg, table, z, x, y))
+
+
+def cached_tile(layer_name: str, version: str, z: int, x: int, y: int, render: Callable[[], bytes]) -> bytes:
+    """A tile from the disk cache, or rendered and stored on a miss"""
+    path = tile_cache_path(layer_name, version, z, x, y)
+    if settings.cache_enabled and os.path.exists(path):
+        with open(path, "rb") as f:
+            return f.read()
+
+    data = render()
+    if settings.cache_enabled:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with atomic_path(path) as tmp_path, open(tmp_path, "wb") as f:
+            f.write(data)
+    return data
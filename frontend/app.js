@@ -354,6 +354,7 @@ function App() {
     
     const mapRef = useRef(null);
     const leafletMapRef = useRef(null);
+    const surfaceLayerRef = useRef(null);
 
     // Initialize parameters
     useEffect(() => {
@@ -476,6 +477,32 @@ function App() {
         }));
     };
 
+    // Overlay the suitability surface for the analysis area on the map
+    const showSuitabilitySurface = async (criteria) => {
+        if (!leafletMapRef.current) return;
+        try {
+            const response = await fetch(`${API_BASE_URL}/analysis/surface`, {
+                method: 'POST',
+                headers: {
+                    'Content-Type': 'application/json',
+                },
+                body: JSON.stringify({ criteria, width: 1024, height: 1024, format: 'png' }),
+            });
+            if (!response.ok) return;
+            
+            const [minx, miny, maxx, maxy] = response.headers.get('X-Grid-Bbox').split(',').map(Number);
+            const url = URL.createObjectURL(await response.blob());
+            if (surfaceLayerRef.current) {
+                URL.revokeObjectURL(surfaceLayerRef.current._url);
+                surfaceLayerRef.current.remove();
+            }
+            surfaceLayerRef.current = L.imageOverlay(url, [[miny, minx], [maxy, maxx]], { opacity: 0.8 })
+                .addTo(leafletMapRef.current);
+        } catch (error) {
+            console.error("Error loading suitability surface:", error);
+        }
+    };
+
     // Handle analysis
     const handleAnalysis = async () => {
         const activeParams = Object.entries(parameters)
@@ -514,6 +541,9 @@ function App() {
             
             const result = await response.json();
             
+            // Show the continuous suitability surface for the same criteria
+            showSuitabilitySurface(activeParams);
+            
             // Simulate analysis delay for better UX
             setTimeout(() => {
                 setAnalysisResults({